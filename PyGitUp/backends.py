@@ -0,0 +1,224 @@
+"""
+Backends answering read-only queries about a repository.
+
+Every query git-up sends to git costs a fork and exec, which dominates the
+run time of repositories with many branches. If it's enabled and pygit2
+(libgit2's Python bindings) is installed, `Pygit2Backend` answers ref,
+status and ancestry queries in-process instead. Everything that changes the
+repository (rebase, stash, fetch, ...) still goes through the git command
+line.
+
+Whenever libgit2 can't answer a query, e.g. because the repository uses an
+extension it doesn't support, the backend falls back to running git. libgit2
+ignores replace refs, grafts and shallow boundaries, so repositories using
+any of them aren't opened with it at all.
+"""
+
+__all__ = ['SubprocessBackend', 'Pygit2Backend', 'open_backend']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# 3rd party libs: pygit2 is optional and only imported if enabled
+
+# PyGitUp libs
+from PyGitUp.status import WorktreeStatus
+
+
+###############################################################################
+# SubprocessBackend
+###############################################################################
+
+class SubprocessBackend:
+    """
+    Answers queries by running git commands.
+    """
+
+    name = 'git'
+
+    def __init__(self, git):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        """
+        self.git = git
+
+    def merge_base(self, commit, other):
+        """
+        Return the best common ancestor of two commits, None if they don't
+        have one.
+        """
+        engine = self.git.engine
+        result = engine.run_sync(
+            *engine.command('merge_base', commit, other), check=False
+        )
+
+        # Exit status 1: no common ancestor
+        if result.status == 1 and not result.stdout.strip():
+            return None
+        result.check()
+
+        return self.git.decode_output(result.stdout).strip()
+
+    def commit_sha(self, rev):
+        """ Return the SHA of the commit rev points to, or None. """
+        from PyGitUp.git_wrapper import GitError
+
+        try:
+            return self.git._run('rev_parse', '--verify', '--quiet',
+                                 rev + '^{commit}') or None
+        except GitError:
+            return None
+
+    def tree_shas(self, revs):
+        """ Return the SHAs of the trees of several commits. """
+        if not revs:
+            return []
+
+        return self.git._run('rev_parse',
+                             *[rev + '^{tree}' for rev in revs]).split()
+
+    def status(self):
+        """ Return the local changes in the working tree. """
+        return WorktreeStatus.parse(
+            self.git._run('status', *WorktreeStatus.ARGUMENTS)
+        )
+
+    def close(self):
+        """ Release the backend's resources. """
+
+
+###############################################################################
+# Pygit2Backend
+###############################################################################
+
+class Pygit2Backend(SubprocessBackend):
+    """
+    Answers queries in-process with libgit2.
+    """
+
+    name = 'pygit2'
+
+    def __init__(self, git, repository):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        :type repository: pygit2.Repository
+        """
+        super().__init__(git)
+        self.repository = repository
+
+    @classmethod
+    def open(cls, git, path):
+        """ Open a repository with libgit2, None if it can't be done. """
+        try:
+            import pygit2
+        except ImportError:
+            return None
+
+        try:
+            return cls(git, pygit2.Repository(path))
+        except (pygit2.GitError, KeyError, ValueError):
+            return None  # Unsupported repository (format)
+
+    def merge_base(self, commit, other):
+        import pygit2
+
+        try:
+            base = self.repository.merge_base(commit, other)
+        except (pygit2.GitError, KeyError, ValueError):
+            base = None
+
+        if base is None:
+            # Let git report the error (or find missing objects)
+            return super().merge_base(commit, other)
+
+        return str(base)
+
+    def commit_sha(self, rev):
+        import pygit2
+
+        try:
+            commit = self.repository.revparse_single(rev).peel(pygit2.Commit)
+        except (pygit2.GitError, KeyError, ValueError):
+            return super().commit_sha(rev)
+
+        return str(commit.id)
+
+    def tree_shas(self, revs):
+        import pygit2
+
+        try:
+            return [str(self.repository.revparse_single(rev)
+                        .peel(pygit2.Tree).id) for rev in revs]
+        except (pygit2.GitError, KeyError, ValueError):
+            return super().tree_shas(revs)
+
+    def status(self):
+        import pygit2
+
+        config = self.repository.config
+
+        # libgit2 doesn't support sparse checkouts
+        if self.repository.is_bare or (
+                'core.sparseCheckout' in config and
+                config.get_bool('core.sparseCheckout')):
+            return super().status()
+
+        try:
+            changes = self.repository.status(untracked_files='no')
+            submodules = set(self.repository.listall_submodules())
+        except (pygit2.GitError, TypeError, ValueError):
+            # TypeError: pygit2 < 1.14 doesn't know untracked_files
+            return super().status()
+
+        staged = (pygit2.GIT_STATUS_INDEX_NEW |
+                  pygit2.GIT_STATUS_INDEX_MODIFIED |
+                  pygit2.GIT_STATUS_INDEX_DELETED |
+                  pygit2.GIT_STATUS_INDEX_RENAMED |
+                  pygit2.GIT_STATUS_INDEX_TYPECHANGE)
+        unstaged = (pygit2.GIT_STATUS_WT_MODIFIED |
+                    pygit2.GIT_STATUS_WT_DELETED |
+                    pygit2.GIT_STATUS_WT_RENAMED |
+                    pygit2.GIT_STATUS_WT_TYPECHANGE)
+
+        status = WorktreeStatus()
+        for path, flags in changes.items():
+            if flags & pygit2.GIT_STATUS_IGNORED or \
+                    flags == pygit2.GIT_STATUS_WT_NEW:
+                continue
+
+            status.count += 1
+            if path in submodules:
+                status.submodules += 1
+            if flags & pygit2.GIT_STATUS_CONFLICTED:
+                status.unmerged += 1
+                continue
+            if flags & staged:
+                status.staged += 1
+            if flags & unstaged:
+                status.unstaged += 1
+
+        return status
+
+    def close(self):
+        free = getattr(self.repository, 'free', None)
+        if free is not None:
+            free()
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+def open_backend(git, path, pygit2=True):
+    """
+    Return the backend for the repository at path: pygit2's, if enabled and
+    installed, otherwise git's.
+
+    :type git: PyGitUp.git_wrapper.GitWrapper
+    """
+    backend = None
+    if pygit2 and path is not None:
+        backend = Pygit2Backend.open(git, path)
+
+    return backend or SubprocessBackend(git)
@@ -0,0 +1,199 @@
+"""
+Features supported by the installed git, probed once per process.
+
+Checking git's version means spawning `git version`. The result is cached per
+git executable (identified by its resolved path, modification time and size)
+for the lifetime of the process, and optionally on disk, so git-up running
+from a shell prompt doesn't have to ask git again on every run.
+"""
+
+__all__ = ['GitCapabilities']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import os
+import re
+import subprocess
+import sys
+
+# PyGitUp libs
+from PyGitUp.utils import write_json
+
+
+###############################################################################
+# GitCapabilities
+###############################################################################
+
+class GitCapabilities:
+    """
+    The version of git and the features git-up can use with it.
+
+    Features are available as boolean attributes, e.g. `capabilities.prune`.
+    """
+
+    #: feature -> minimum git version
+    FEATURES = {
+        # git fetch --prune
+        'prune': (1, 6, 6),
+        # git worktree
+        'worktree': (2, 5, 0),
+        # git merge-tree --write-tree
+        'merge_tree': (2, 38, 0),
+        # git merge-tree --write-tree --merge-base=<commit>
+        'merge_tree_base': (2, 40, 0),
+        # git for-each-ref --format='%(ahead-behind:<ref>)'
+        'ahead_behind': (2, 41, 0),
+        # git fetch --multiple --jobs=<n>
+        'fetch_jobs': (2, 24, 0),
+    }
+
+    #: (executable, mtime, size) -> GitCapabilities
+    #: :type: dict[tuple, GitCapabilities]
+    _cache = {}
+
+    def __init__(self, version_string):
+        #: e.g. '2.39.5'
+        self.version_string = version_string
+        #: e.g. (2, 39, 5)
+        self.version = tuple(int(part) for part in version_string.split('.'))
+
+    def __getattr__(self, name):
+        if name in self.FEATURES:
+            return self.is_version_min(self.FEATURES[name])
+
+        raise AttributeError(name)
+
+    def is_version_min(self, required_version):
+        """
+        Does git's version match the requirements?
+
+        :param required_version: a version string ('1.6.6') or tuple
+        """
+        if isinstance(required_version, str):
+            required_version = tuple(
+                int(part) for part in required_version.split('.')
+            )
+
+        return self.version >= tuple(required_version)
+
+    @classmethod
+    def probe(cls, executable='git', persistent=False):
+        """
+        Return the capabilities of a git executable.
+
+        git is asked for its version only once per process (and, with
+        `persistent`, only once per git installation).
+        """
+        key = cls._key(executable)
+
+        capabilities = cls._cache.get(key) if key else None
+        if capabilities is not None:
+            return capabilities
+
+        version_string = cls._load(key) if key and persistent else None
+
+        if version_string is None:
+            output = subprocess.check_output([executable, 'version'],
+                                             stderr=subprocess.DEVNULL)
+            version_string = cls.parse_version(output.decode('utf-8',
+                                                             'replace'))
+
+            if key and persistent:
+                cls._store(key, version_string)
+
+        capabilities = cls(version_string)
+        if key:
+            cls._cache[key] = capabilities
+
+        return capabilities
+
+    @staticmethod
+    def parse_version(output):
+        """
+        Extract the version number from the output of `git version`.
+
+        GitPython's version_info has problems with some types of git version
+        strings (like '2.39.5.windows.1').
+        """
+        return re.search(r'\d+(\.\d+)+', output).group(0)
+
+    @classmethod
+    def clear_cache(cls):
+        """ Forget all probed versions (but not the ones stored on disk). """
+        cls._cache.clear()
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    @staticmethod
+    def _key(executable):
+        """ Identify a git installation, None if it can't be found. """
+        import shutil
+
+        path = shutil.which(executable)
+        if path is None:
+            return None
+
+        path = os.path.realpath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return path, stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def cache_file():
+        """ Return the path of the on-disk cache. """
+        if sys.platform == 'win32':  # pragma: no cover
+            cache_dir = os.environ.get('LOCALAPPDATA')
+        else:
+            cache_dir = os.environ.get('XDG_CACHE_HOME')
+
+        if not cache_dir:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache')
+
+        return os.path.join(cache_dir, 'git-up', 'git-version.json')
+
+    @classmethod
+    def _read_cache_file(cls):
+        """ Return all entries of the on-disk cache. """
+        import json
+
+        try:
+            with open(cls.cache_file(), 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        return entries if isinstance(entries, dict) else {}
+
+    @classmethod
+    def _load(cls, key):
+        """ Look up a git installation in the on-disk cache. """
+        path, mtime, size = key
+
+        entry = cls._read_cache_file().get(path)
+        if not isinstance(entry, dict):
+            return None
+
+        if entry.get('mtime') != mtime or entry.get('size') != size:
+            return None  # git has been updated
+
+        return entry.get('version')
+
+    @classmethod
+    def _store(cls, key, version_string):
+        """ Store a git installation's version in the on-disk cache. """
+        path, mtime, size = key
+
+        entries = cls._read_cache_file()
+        entries[path] = {'mtime': mtime, 'size': size,
+                         'version': version_string}
+
+        # The cache is an optimization only
+        write_json(cls.cache_file(), entries)
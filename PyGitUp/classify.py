@@ -0,0 +1,264 @@
+"""
+Batch classification of branches relative to their targets.
+
+Finding out whether a branch is ahead of, behind or diverged from its target
+used to take one `git merge-base` process (and graph walk) per branch. The
+classifier computes the state of all branches up front with a single
+`git for-each-ref` call:
+
+- with git 2.41 or newer, `%(ahead-behind:<target>)` compares all branches
+  with a few shared targets in one batched walk,
+- otherwise (or with many distinct targets) `%(upstream:trackshort)` does the
+  comparison for every branch with its upstream.
+
+If the repository's commit graph is used, branches are classified from it
+first and only the rest is left to git.
+
+Branches whose SHAs have changed since (e.g. because they track a branch
+git-up has just updated) fall back to `git merge-base`. States and merge
+bases can be restored from an earlier run (see PyGitUp.statecache), in which
+case only branches that have moved since are classified.
+"""
+
+__all__ = ['BranchClassifier', 'UP_TO_DATE', 'AHEAD', 'BEHIND', 'DIVERGED']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# PyGitUp libs
+from PyGitUp.commitgraph import CommitGraphMiss
+from PyGitUp.git_wrapper import GitError, MAX_PATTERN_LENGTH
+
+UP_TO_DATE = 'up to date'
+AHEAD = 'ahead'
+BEHIND = 'behind'
+DIVERGED = 'diverged'
+
+TRACKSHORT_STATES = {
+    '=': UP_TO_DATE,
+    '>': AHEAD,
+    '<': BEHIND,
+    '<>': DIVERGED,
+}
+
+# Use %(ahead-behind:...) for at most this many distinct targets: every
+# target adds a column that's computed for every branch
+MAX_AHEAD_BEHIND_TARGETS = 16
+
+
+###############################################################################
+# BranchClassifier
+###############################################################################
+
+class BranchClassifier:
+    """
+    Classifies branches as up to date, ahead, behind or diverged.
+    """
+
+    def __init__(self, git, capabilities=None, graph=None):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        :type capabilities: PyGitUp.capabilities.GitCapabilities
+        :type graph: PyGitUp.commitgraph.CommitGraph
+        """
+        self.git = git
+        self.capabilities = capabilities
+        self.graph = graph
+
+        #: branch name -> (branch SHA, target SHA, state)
+        #: :type: dict[str, (str, str, str)]
+        self.states = {}
+
+        #: (branch SHA, target SHA) -> merge base (None: there's none)
+        #: :type: dict[(str, str), str | None]
+        self.merge_bases = {}
+
+        #: Number of branches that had to be classified one by one
+        self.fallbacks = 0
+
+    def restore(self, entries):
+        """
+        Reuse the states of an earlier run. Branches whose SHAs are still
+        the same aren't classified again.
+
+        :param entries: branch name -> (branch SHA, target SHA, state,
+                        merge base or None), as returned by `entries`
+        """
+        for name, (branch_sha, target_sha, state, base) in entries.items():
+            self.states[name] = (branch_sha, target_sha, state)
+            if base is not None:
+                self.merge_bases[(branch_sha, target_sha)] = base
+
+    def entries(self, names):
+        """ Return the states of the named branches for `restore`. """
+        return {
+            name: self.states[name] +
+            (self.merge_bases.get(self.states[name][:2]),)
+            for name in names if name in self.states
+        }
+
+    def classify(self, pairs):
+        """
+        Classify many branches at once.
+
+        :param pairs: branch name -> (branch SHA, target SHA)
+        :type pairs: dict[str, (str, str)]
+        """
+        pairs = {name: shas for name, shas in pairs.items()
+                 if shas[0] != shas[1] and
+                 self.states.get(name, ())[:2] != shas}
+
+        if self.graph is not None:
+            for name, shas in list(pairs.items()):
+                state = self._classify_graph(*shas)
+                if state is not None:
+                    self.states[name] = shas + (state,)
+                    del pairs[name]
+
+        if not pairs:
+            return  # Everything's up to date
+
+        targets = sorted(set(target for _, target in pairs.values()))
+
+        try:
+            if self.capabilities is not None \
+                    and self.capabilities.ahead_behind \
+                    and len(targets) <= MAX_AHEAD_BEHIND_TARGETS:
+                states = self._classify_ahead_behind(pairs, targets)
+            else:
+                states = self._classify_trackshort(pairs)
+        except GitError:
+            return  # Classify the branches one by one
+
+        for name, state in states.items():
+            self.states[name] = pairs[name] + (state,)
+
+    def state(self, branch_name, branch_sha, target_sha):
+        """
+        Return the state of a branch, computing it if it hasn't been
+        classified up front or has changed since.
+        """
+        if branch_sha == target_sha:
+            return UP_TO_DATE
+
+        cached = self.states.get(branch_name)
+        if cached and cached[:2] == (branch_sha, target_sha):
+            return cached[2]
+
+        state = self._classify_graph(branch_sha, target_sha)
+
+        if state is None:
+            self.fallbacks += 1
+            base = self.merge_base(branch_sha, target_sha)
+
+            if base == target_sha:
+                state = AHEAD
+            elif base == branch_sha:
+                state = BEHIND
+            else:
+                # Without a merge base (unrelated histories) as well: that's
+                # what the batched comparisons report, too
+                state = DIVERGED
+
+        self.states[branch_name] = (branch_sha, target_sha, state)
+
+        return state
+
+    def merge_base(self, branch_sha, target_sha):
+        """
+        Return the merge base of a branch and its target, None if their
+        histories are unrelated.
+        """
+        if (branch_sha, target_sha) in self.merge_bases:
+            return self.merge_bases[(branch_sha, target_sha)]
+
+        base = None
+        if self.graph is not None:
+            try:
+                base = self.graph.merge_base(branch_sha, target_sha)
+            except CommitGraphMiss:
+                pass
+
+        if base is None:
+            base = self.git.merge_base(branch_sha, target_sha)
+
+        self.merge_bases[(branch_sha, target_sha)] = base
+
+        return base
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _classify_graph(self, branch_sha, target_sha):
+        """ Classify a branch using the commit graph, None if it can't. """
+        if self.graph is None:
+            return None
+
+        try:
+            if self.graph.is_ancestor(target_sha, branch_sha):
+                return AHEAD
+            elif self.graph.is_ancestor(branch_sha, target_sha):
+                return BEHIND
+            else:
+                return DIVERGED
+        except CommitGraphMiss:
+            return None
+
+    def _classify_ahead_behind(self, pairs, targets):
+        """ Compare with all targets in one batched walk (git >= 2.41). """
+        format_ = '%(refname)' + ''.join(
+            '%00%(ahead-behind:{})'.format(target) for target in targets
+        )
+        columns = {target: index for index, target in enumerate(targets)}
+
+        states = {}
+        for name, fields in self._for_each_ref(format_, pairs):
+            target = pairs[name][1]
+            ahead, behind = (int(count) for count
+                             in fields[columns[target]].split())
+
+            if ahead and behind:
+                states[name] = DIVERGED
+            elif ahead:
+                states[name] = AHEAD
+            elif behind:
+                states[name] = BEHIND
+            else:
+                states[name] = UP_TO_DATE
+
+        return states
+
+    def _classify_trackshort(self, pairs):
+        """ Compare every branch with its upstream. """
+        states = {}
+        for name, fields in self._for_each_ref('%(refname)%00%(objectname)'
+                                               '%00%(upstream:trackshort)',
+                                               pairs):
+            sha, trackshort = fields
+
+            # The branch might have moved since it was read
+            if sha == pairs[name][0] and trackshort in TRACKSHORT_STATES:
+                states[name] = TRACKSHORT_STATES[trackshort]
+
+        return states
+
+    def _for_each_ref(self, format_, pairs):
+        """
+        Run `git for-each-ref` for the branches in pairs, yielding their
+        names and the remaining fields.
+        """
+        patterns = ['refs/heads/' + name for name in sorted(pairs)]
+        if sum(len(pattern) + 1 for pattern in patterns) > \
+                MAX_PATTERN_LENGTH:
+            patterns = ['refs/heads']
+
+        output = self.git.for_each_ref('--format=' + format_, *patterns)
+
+        for line in output.splitlines():
+            fields = line.split('\0')
+            name = fields[0][len('refs/heads/'):]
+
+            if name in pairs:
+                yield name, fields[1:]
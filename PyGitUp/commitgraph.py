@@ -0,0 +1,360 @@
+"""
+Answering ancestry questions from git's commit-graph file.
+
+`git commit-graph write` (run by `git gc` and `git maintenance`) stores the
+parents and generation numbers of all commits in
+`.git/objects/info/commit-graph` or in a chain of files under
+`.git/objects/info/commit-graphs`. `CommitGraph` memory-maps these files and
+walks them in Python, so checking whether a branch can be fast-forwarded
+doesn't need a `git merge-base` process for each branch.
+
+Generation numbers allow stopping a walk early: a commit can only be an
+ancestor of commits with a higher generation.
+
+Commits that aren't part of the graph (e.g. ones fetched since it was
+written) can't be answered from it: `CommitGraphMiss` is raised and the
+caller has to ask git instead.
+
+See https://git-scm.com/docs/gitformat-commit-graph for the file format.
+"""
+
+__all__ = ['CommitGraph', 'CommitGraphMiss']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import heapq
+import mmap
+import os
+import struct
+
+# PyGitUp libs
+from PyGitUp.refs import history_rewritten
+
+SIGNATURE = b'CGPH'
+
+# Hash version -> length of an object ID
+HASH_LENGTHS = {1: 20, 2: 32}
+
+CHUNK_FANOUT = b'OIDF'
+CHUNK_LOOKUP = b'OIDL'
+CHUNK_DATA = b'CDAT'
+CHUNK_EXTRA_EDGES = b'EDGE'
+
+PARENT_NONE = 0x70000000
+PARENT_EXTRA = 0x80000000
+
+# Flags for painting the history in merge_base
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+
+
+class CommitGraphMiss(LookupError):
+    """ The commit graph can't answer a question, ask git instead. """
+
+
+###############################################################################
+# CommitGraph
+###############################################################################
+
+class CommitGraph:
+    """
+    Read-only view of a repository's commit graph.
+    """
+
+    def __init__(self, layers):
+        #: Graph files, from the base to the most recent one
+        #: :type: list[_GraphFile]
+        self.layers = layers
+
+        #: position -> (generation, parent positions)
+        self._commits = {}
+
+    @classmethod
+    def open(cls, common_dir):
+        """
+        Open the commit graph of a repository, None if it doesn't have one
+        or it can't be used.
+        """
+        if history_rewritten(common_dir):
+            return None  # The graph doesn't know about grafts/replacements
+
+        info_dir = os.path.join(common_dir, 'objects', 'info')
+
+        try:
+            paths = [os.path.join(info_dir, 'commit-graph')]
+            if not os.path.isfile(paths[0]):
+                paths = _read_chain(info_dir)
+
+            layers = []
+            position = 0
+            for path in paths:
+                layer = _GraphFile(path, position)
+                layers.append(layer)
+                position += layer.count
+        except (OSError, ValueError, struct.error):
+            return None
+
+        if not layers:
+            return None
+
+        return cls(layers)
+
+    def close(self):
+        """ Unmap all graph files. """
+        for layer in self.layers:
+            layer.close()
+
+        self.layers = []
+        self._commits.clear()
+
+    def is_ancestor(self, ancestor, descendant):
+        """
+        Is one commit (given by its SHA) an ancestor of the other?
+
+        :raises CommitGraphMiss: if one of the commits isn't in the graph
+        """
+        target = self._position(ancestor)
+        start = self._position(descendant)
+        if target == start:
+            return True
+
+        generation = self._commit(target)[0]
+
+        seen = {start}
+        stack = [start]
+        while stack:
+            for parent in self._commit(stack.pop())[1]:
+                if parent == target:
+                    return True
+
+                # Commits with a lower or the same generation can't have
+                # the ancestor in their history
+                if parent not in seen and \
+                        self._commit(parent)[0] > generation:
+                    seen.add(parent)
+                    stack.append(parent)
+
+        return False
+
+    def merge_base(self, sha1, sha2):
+        """
+        Return the best common ancestor of two commits.
+
+        :raises CommitGraphMiss: if one of the commits isn't in the graph,
+                                 there's no or more than one merge base
+        """
+        one = self._position(sha1)
+        two = self._position(sha2)
+        if one == two:
+            return sha1
+
+        # Walk both histories at once, highest generation first, and
+        # collect commits reached from both sides (like git itself). Every
+        # commit is processed after all of its descendants, so its flags
+        # are final once it's popped from the queue.
+        flags = {one: PARENT1, two: PARENT2}
+        queue = [(-self._commit(one)[0], one), (-self._commit(two)[0], two)]
+        heapq.heapify(queue)
+
+        done = set()
+        result = []
+        while queue and not all(flags[c] & STALE for _, c in queue):
+            _, position = heapq.heappop(queue)
+            if position in done:
+                continue
+            done.add(position)
+
+            commit_flags = flags[position]
+            if commit_flags & (PARENT1 | PARENT2) == PARENT1 | PARENT2 \
+                    and not commit_flags & STALE:
+                result.append(position)
+                commit_flags |= STALE  # Its ancestors are worse merge bases
+                flags[position] = commit_flags
+
+            for parent in self._commit(position)[1]:
+                parent_flags = flags.get(parent, 0)
+                if parent_flags & commit_flags == commit_flags:
+                    continue
+
+                flags[parent] = parent_flags | commit_flags
+                heapq.heappush(queue, (-self._commit(parent)[0], parent))
+
+        if len(result) != 1:
+            # Let git decide which merge base to pick
+            raise CommitGraphMiss(f'{len(result)} merge bases')
+
+        return self._sha(result[0])
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _position(self, sha):
+        """ Return the position of a commit in the graph. """
+        try:
+            oid = bytes.fromhex(sha)
+        except ValueError:
+            raise CommitGraphMiss(sha) from None
+
+        for layer in self.layers:
+            position = layer.find(oid)
+            if position is not None:
+                return position
+
+        raise CommitGraphMiss(sha)
+
+    def _layer(self, position):
+        """ Return the graph file containing a position. """
+        for layer in reversed(self.layers):
+            if position >= layer.offset:
+                return layer
+
+        raise CommitGraphMiss(position)
+
+    def _commit(self, position):
+        """ Return the generation and parents of a commit. """
+        commit = self._commits.get(position)
+        if commit is None:
+            commit = self._layer(position).commit(position)
+
+            if commit[0] == 0:
+                # Written without generation numbers, can't walk it
+                raise CommitGraphMiss(position)
+
+            self._commits[position] = commit
+
+        return commit
+
+    def _sha(self, position):
+        """ Return the SHA of the commit at a position. """
+        return self._layer(position).oid(position).hex()
+
+
+class _GraphFile:
+    """ A single commit-graph file. """
+
+    def __init__(self, path, offset):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        #: Position of the file's first commit in the whole graph
+        self.offset = offset
+
+        try:
+            self._parse_header()
+        except Exception:
+            self.map.close()
+            raise
+
+    def _parse_header(self):
+        signature, version, hash_version, chunk_count = \
+            struct.unpack_from('>4sBBB', self.map, 0)
+        if signature != SIGNATURE or version != 1 or \
+                hash_version not in HASH_LENGTHS:
+            raise ValueError('Unsupported commit-graph file')
+
+        self.hash_length = HASH_LENGTHS[hash_version]
+
+        chunks = {}
+        for index in range(chunk_count):
+            chunk_id, offset = struct.unpack_from('>4sQ', self.map,
+                                                  8 + 12 * index)
+            chunks[chunk_id] = offset
+
+        for chunk_id in (CHUNK_FANOUT, CHUNK_LOOKUP, CHUNK_DATA):
+            if chunk_id not in chunks:
+                raise ValueError('Missing commit-graph chunk')
+
+        self.fanout = struct.unpack_from('>256I', self.map,
+                                         chunks[CHUNK_FANOUT])
+        self.count = self.fanout[255]
+        self.lookup = chunks[CHUNK_LOOKUP]
+        self.data = chunks[CHUNK_DATA]
+        self.extra_edges = chunks.get(CHUNK_EXTRA_EDGES)
+
+        end = self.data + self.count * (self.hash_length + 16)
+        if self.lookup + self.count * self.hash_length > len(self.map) or \
+                end > len(self.map):
+            raise ValueError('Truncated commit-graph file')
+
+    def close(self):
+        self.map.close()
+
+    def find(self, oid):
+        """ Return the global position of a commit, None if not found. """
+        if len(oid) != self.hash_length:
+            return None
+
+        first = oid[0]
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+
+        while low < high:
+            middle = (low + high) // 2
+            start = self.lookup + middle * self.hash_length
+            current = self.map[start:start + self.hash_length]
+
+            if current == oid:
+                return self.offset + middle
+            elif current < oid:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def oid(self, position):
+        """ Return the object ID of the commit at a global position. """
+        start = self.lookup + (position - self.offset) * self.hash_length
+        return self.map[start:start + self.hash_length]
+
+    def commit(self, position):
+        """
+        Return the generation and parent positions of the commit at a
+        global position.
+        """
+        start = self.data + (position - self.offset) * \
+            (self.hash_length + 16) + self.hash_length
+        parent1, parent2, generation, _ = \
+            struct.unpack_from('>IIII', self.map, start)
+
+        parents = []
+        if parent1 != PARENT_NONE:
+            parents.append(parent1)
+
+        if parent2 & PARENT_EXTRA:
+            # Octopus merge: the remaining parents are in the edge list
+            if self.extra_edges is None:
+                raise CommitGraphMiss(position)
+
+            index = parent2 & ~PARENT_EXTRA
+            while True:
+                edge, = struct.unpack_from('>I', self.map,
+                                           self.extra_edges + 4 * index)
+                parents.append(edge & ~PARENT_EXTRA)
+                if edge & PARENT_EXTRA:
+                    break
+                index += 1
+        elif parent2 != PARENT_NONE:
+            parents.append(parent2)
+
+        # The upper 30 bits hold the topological level
+        return generation >> 2, tuple(parents)
+
+
+def _read_chain(info_dir):
+    """ Return the paths of a split commit graph, base first. """
+    chain_dir = os.path.join(info_dir, 'commit-graphs')
+
+    try:
+        with open(os.path.join(chain_dir, 'commit-graph-chain'), 'r') as f:
+            hashes = f.read().split()
+    except FileNotFoundError:
+        return []
+
+    return [os.path.join(chain_dir, f'graph-{graph_hash}.graph')
+            for graph_hash in hashes]
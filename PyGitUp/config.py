@@ -0,0 +1,235 @@
+"""
+A snapshot of all git-up settings from git config.
+
+Asking `git config` for every setting separately spawns one process per key.
+The snapshot reads all `git-up.*` keys (plus the branches' tracking
+configuration) with a single call instead and is
+cached per repository, so processing many repositories (or the same one many
+times) from one Python process doesn't read the config again unless one of
+the config files has changed in the meantime.
+"""
+
+__all__ = ['ConfigSnapshot']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import os
+
+
+###############################################################################
+# ConfigSnapshot
+###############################################################################
+
+class ConfigSnapshot:
+    """
+    All `git-up.*` config values of a repository, plus the upstream
+    configuration of its branches and the fetch refspecs of its remotes.
+
+    Snapshots are cached per repository. A cached snapshot is reused as long
+    as the files it was read from (plus the repository's and the user's
+    config files) are unchanged. The system config is only tracked if it
+    contains git-up settings.
+    """
+
+    PATTERN = r'^(git-up\.|branch\..*\.(remote|merge)$|remote\..*\.fetch$)'
+
+    # Environment variables that change what git config reads
+    ENVIRONMENT = ('GIT_CONFIG_GLOBAL', 'GIT_CONFIG_SYSTEM',
+                   'GIT_CONFIG_NOSYSTEM', 'GIT_CONFIG_PARAMETERS',
+                   'GIT_CONFIG_COUNT', 'XDG_CONFIG_HOME', 'HOME')
+
+    #: git dir (or working dir outside of a repo) -> ConfigSnapshot
+    #: :type: dict[str, ConfigSnapshot]
+    _cache = {}
+
+    def __init__(self, values, paths=(), all_values=None):
+        #: key -> value ('' for keys without a value)
+        #: :type: dict[str, str]
+        self.values = values
+
+        #: key -> all values, for multi-valued keys
+        #: :type: dict[str, list[str]]
+        self.all_values = all_values or {}
+
+        #: Config files the snapshot depends on
+        #: :type: list[str]
+        self.paths = sorted(set(paths))
+
+        self.fingerprint = self._fingerprint(self.paths)
+
+    @classmethod
+    def for_repo(cls, engine, git_dir=None):
+        """
+        Return the snapshot for a repository, reading it only if it's not
+        cached or outdated.
+
+        :type engine: PyGitUp.engine.GitEngine
+        :param git_dir: the repository's (common) git dir, None if git-up
+                        isn't running inside a repository
+        """
+        key = git_dir or engine.working_dir or os.getcwd()
+
+        snapshot = cls._cache.get(key)
+        if snapshot is None or not snapshot.is_current():
+            snapshot = cls.read(engine, git_dir)
+            cls._cache[key] = snapshot
+
+        return snapshot
+
+    @classmethod
+    def read(cls, engine, git_dir=None):
+        """
+        Read all git-up settings with one `git config` call.
+
+        :type engine: PyGitUp.engine.GitEngine
+        """
+        cwd = engine.working_dir or os.getcwd()
+
+        result = engine.run_sync('config', '-z', '--show-origin',
+                                 '--get-regexp', cls.PATTERN, check=False)
+        if result.ok:
+            output = result.stdout.decode('utf-8', errors='replace')
+        else:
+            output = ''  # No git-up settings at all
+
+        all_values = {}
+        values, origins = cls.parse(output, all_values)
+
+        paths = [os.path.join(cwd, path) for path in origins]
+        paths.extend(cls._default_paths(git_dir))
+
+        return cls(values, paths, all_values)
+
+    @staticmethod
+    def parse(output, all_values=None):
+        """
+        Parse the output of `git config -z --show-origin --get-regexp`.
+
+        Returns a dict of values (the last one wins, like `git config <key>`)
+        and the list of files the values came from. If given, all_values
+        collects every value of each key.
+        """
+        values = {}
+        origins = []
+
+        fields = output.split('\0')
+        for origin, entry in zip(fields[0::2], fields[1::2]):
+            key, _, value = entry.partition('\n')
+            values[key] = value
+
+            if all_values is not None:
+                all_values.setdefault(key, []).append(value)
+
+            if origin.startswith('file:'):
+                origins.append(origin[len('file:'):])
+
+        return values, origins
+
+    def get(self, key, default=None):
+        """ Return a config value like `git config <key>` would. """
+        return self.values.get(key, default)
+
+    def get_all(self, key):
+        """ Return all values of a key like `git config --get-all`. """
+        return self.all_values.get(key, [])
+
+    def upstream(self, branch_name):
+        """
+        Return the upstream ref and remote name of a local branch like
+        `%(upstream)` and `%(upstream:remotename)`, or None.
+        """
+        remote = self.get(f'branch.{branch_name}.remote')
+        merge = self.get(f'branch.{branch_name}.merge')
+        if not remote or not merge:
+            return None
+
+        if remote == '.':
+            return merge, remote
+
+        # Map the remote branch to its remote-tracking branch
+        tracking = None
+        for refspec in self.get_all(f'remote.{remote}.fetch'):
+            negative = refspec.startswith('^')
+            source, _, destination = refspec.lstrip('+^').partition(':')
+
+            mapped = _map_refspec(merge, source, destination or source)
+            if mapped is None:
+                continue
+            if negative:
+                return None  # Excluded from fetching
+            if tracking is None and destination:
+                tracking = mapped
+
+        return (tracking, remote) if tracking else None
+
+    def is_current(self):
+        """ Return True, if none of the config files has changed. """
+        return self._fingerprint(self.paths) == self.fingerprint
+
+    @classmethod
+    def clear_cache(cls):
+        """ Forget all cached snapshots. """
+        cls._cache.clear()
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    @staticmethod
+    def _default_paths(git_dir):
+        """ Return the config files git reads besides the system config. """
+        paths = []
+
+        if git_dir:
+            paths.append(os.path.join(git_dir, 'config'))
+
+        if os.environ.get('GIT_CONFIG_GLOBAL'):
+            paths.append(os.environ['GIT_CONFIG_GLOBAL'])
+        else:
+            xdg_config_home = os.environ.get('XDG_CONFIG_HOME') or \
+                os.path.join(os.path.expanduser('~'), '.config')
+            paths.append(os.path.join(xdg_config_home, 'git', 'config'))
+            paths.append(os.path.join(os.path.expanduser('~'), '.gitconfig'))
+
+        if os.environ.get('GIT_CONFIG_SYSTEM'):
+            paths.append(os.environ['GIT_CONFIG_SYSTEM'])
+
+        return paths
+
+    @classmethod
+    def _fingerprint(cls, paths):
+        """ Stat all config files and collect the relevant environment. """
+        stats = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stats.append((path, None))
+            else:
+                stats.append((path, stat.st_ino, stat.st_mtime_ns,
+                              stat.st_ctime_ns, stat.st_size))
+
+        environment = [(name, value) for name, value in os.environ.items()
+                       if name in cls.ENVIRONMENT
+                       or name.startswith('GIT_CONFIG_KEY_')
+                       or name.startswith('GIT_CONFIG_VALUE_')]
+
+        return tuple(stats), tuple(sorted(environment))
+
+
+def _map_refspec(refname, source, destination):
+    """ Map a ref through one side of a refspec to the other, or None. """
+    if '*' not in source:
+        return destination if refname == source else None
+
+    prefix, _, suffix = source.partition('*')
+    if not refname.startswith(prefix) or not refname.endswith(suffix) or \
+            len(refname) < len(prefix) + len(suffix):
+        return None
+
+    match = refname[len(prefix):len(refname) - len(suffix)]
+
+    return destination.replace('*', match, 1)
@@ -0,0 +1,658 @@
+"""
+Running git commands, one at a time or concurrently with asyncio.
+
+`GitEngine.run` starts git with asyncio's `subprocess_exec` and collects its
+output in the event loop instead of one thread per stream. Commands can be
+awaited concurrently (up to a limit), time out and be cancelled, in which
+case the git process is killed. Commands running side by side can tell
+their output apart with a `PrefixedStream` each.
+
+`GitEngine.run_sync` runs a single command with `subprocess` and blocks
+until it's done. That's what `GitWrapper` uses for everything that doesn't
+run concurrently: it doesn't pay for setting up an event loop per command
+and works in callers that are already running one. Concurrent commands are
+run with `run_coroutine`, which works there, too.
+
+Output that's copied to a stream while the command runs is only kept for
+error messages, in an `OutputBuffer` holding its beginning and its end, so
+verbose commands don't pile up megabytes of it.
+"""
+
+__all__ = ['GitEngine', 'CommandResult', 'PrefixedStream', 'OutputBuffer',
+           'copy_output', 'read_output', 'run_coroutine']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import codecs
+import os
+import re
+import subprocess
+import sys
+import time
+from threading import Thread
+
+# asyncio is imported where it's used: importing it takes longer than a
+# `git up` that has nothing to do
+
+# Seconds to wait for a killed command to exit
+KILL_TIMEOUT = 1
+
+# Like GitPython: make sure git's messages are in English
+LOCALE_ENVIRONMENT = {'LANGUAGE': 'C', 'LC_ALL': 'C'}
+
+# Splits text into lines and their endings
+LINE_PATTERN = re.compile(r'(\r\n|\r|\n)')
+
+# Bytes of copied output kept from its beginning and its end
+CAPTURE_HEAD = 64 * 1024
+CAPTURE_TAIL = 64 * 1024
+
+# Read command output in chunks of up to this many bytes
+READ_CHUNK_SIZE = 64 * 1024
+
+
+###############################################################################
+# CommandResult
+###############################################################################
+
+class CommandResult:
+    """ The exit status and output of a finished command. """
+
+    def __init__(self, args, status, stdout=b'', stderr=b''):
+        #: The command line
+        self.args = args
+        #: The exit status
+        self.status = status
+        #: :type: bytes
+        self.stdout = stdout
+        #: :type: bytes
+        self.stderr = stderr
+
+    @property
+    def ok(self):
+        return self.status == 0
+
+    def check(self, stderr_already_output=False):
+        """ Raise GitError if the command has failed. """
+        if not self.ok:
+            raise _error(self, stderr_already_output)
+
+    def __repr__(self):
+        return '<CommandResult {!r} status={}>'.format(
+            ' '.join(self.args), self.status
+        )
+
+
+###############################################################################
+# GitEngine
+###############################################################################
+
+class GitEngine:
+    """
+    Runs git commands in a repository.
+    """
+
+    def __init__(self, executable='git', working_dir=None, environment=None,
+                 limit=None):
+        """
+        :param executable: the git executable
+        :param working_dir: the directory to run git in (default: cwd)
+        :param environment: environment variables to set for all commands
+        :param limit: the maximum number of commands running at once
+        """
+        self.executable = executable
+        self.working_dir = working_dir
+        self.environment = {} if environment is None else environment
+        self.limit = limit
+
+        # The limiter of the event loop it has been created for
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    @classmethod
+    def for_git(cls, git, limit=None):
+        """
+        Return an engine running commands like a GitPython `Git` instance
+        would: same executable, directory and environment overrides.
+
+        :type git: git.Git
+        """
+        return cls(git.GIT_PYTHON_GIT_EXECUTABLE or 'git', git.working_dir,
+                   git.environment(), limit)
+
+    def command(self, name, *args, **kwargs):
+        """
+        Build the arguments of a command like GitPython: `name` with
+        underscores replaced by dashes, options from kwargs, then args.
+        None arguments are left out, lists are flattened.
+        """
+        command = [name.replace('_', '-')]
+
+        for option, value in kwargs.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for value in values:
+                command.extend(_option(option, value))
+
+        command.extend(_flatten(args))
+
+        return command
+
+    async def run(self, *args, input=None, env=None, stdout_stream=None,
+                  stderr_stream=None, timeout=None, check=True):
+        """
+        Run git with args.
+
+        :param input: bytes to pass to git's stdin
+        :param env: additional environment variables
+        :param stdout_stream: a text stream to copy stdout to while running
+        :param stderr_stream: a text stream to copy stderr to while running
+        :param timeout: kill git after this many seconds
+        :param check: raise GitError if git fails
+        :rtype: CommandResult
+        """
+        async with self._limiter():
+            result = await self._run(list(args), input, env, stdout_stream,
+                                     stderr_stream, timeout)
+
+        if check:
+            result.check(stderr_stream is not None)
+
+        return result
+
+    def run_sync(self, *args, input=None, env=None, stdout_stream=None,
+                 stderr_stream=None, timeout=None, check=True):
+        """
+        Run git with args, blocking until it's done. See `run`.
+
+        No event loop is involved, so this can be called anywhere, even
+        from a coroutine (which blocks its loop until git is done, though).
+        """
+        command = [self.executable] + list(args)
+
+        if stdout_stream is None and stderr_stream is None:
+            result = self._run_captured(command, input, env, timeout)
+        else:
+            result = self._run_streamed(command, input, env, stdout_stream,
+                                        stderr_stream, timeout)
+
+        if check:
+            result.check(stderr_stream is not None)
+
+        return result
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _limiter(self):
+        """ Return the concurrency limiter of the running event loop. """
+        if not self.limit:
+            return _Unlimited()
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._semaphore_loop = loop
+
+        return self._semaphore
+
+    def _env(self, env):
+        environment = dict(os.environ)
+        environment.update(LOCALE_ENVIRONMENT)
+        environment.update(self.environment)
+        environment.update(env or {})
+
+        return environment
+
+    def _process_kwargs(self, env):
+        """ Return the arguments to start git with, besides its pipes. """
+        kwargs = {
+            'cwd': self.working_dir or os.getcwd(),
+            'env': self._env(env),
+        }
+        if sys.platform == 'win32':  # pragma: no cover
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+        return kwargs
+
+    def _run_captured(self, command, input, env, timeout):
+        """ Run a command, collecting all of its output. """
+        kwargs = self._process_kwargs(env)
+        if input is None:
+            kwargs['stdin'] = subprocess.DEVNULL
+
+        try:
+            process = subprocess.run(
+                command, input=input, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, timeout=timeout, **kwargs
+            )
+        except subprocess.TimeoutExpired as error:
+            # subprocess.run has killed git already
+            raise _timeout_error(command, timeout, error.stdout or b'',
+                                 error.stderr or b'')
+
+        return CommandResult(command, process.returncode, process.stdout,
+                             process.stderr)
+
+    def _run_streamed(self, command, input, env, stdout_stream,
+                      stderr_stream, timeout):
+        """
+        Run a command, copying its output to streams while it runs. Each
+        pipe is read by a thread of its own.
+        """
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **self._process_kwargs(env)
+        )
+
+        outputs = {}
+
+        def read(fd, pipe, stream):
+            outputs[fd] = read_output(pipe, stream)
+
+        # Daemon threads: processes started by git (hooks, aliases, ssh,
+        # ...) might keep its pipes open
+        readers = [
+            Thread(target=read, args=(1, process.stdout, stdout_stream),
+                   daemon=True),
+            Thread(target=read, args=(2, process.stderr, stderr_stream),
+                   daemon=True),
+        ]
+
+        timed_out = False
+        try:
+            for reader in readers:
+                reader.start()
+
+            if input is not None:
+                process.stdin.write(input)
+                process.stdin.close()
+
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                _kill_process(process, readers)
+            else:
+                for reader in readers:
+                    reader.join()
+        except BaseException:
+            # Interrupted: don't leave git running
+            _kill_process(process, readers)
+            raise
+        finally:
+            # A reader still waiting for a killed command's children would
+            # block closing its pipe
+            for reader, pipe in zip(readers, [process.stdout,
+                                              process.stderr]):
+                if not reader.is_alive():
+                    pipe.close()
+
+        if timed_out:
+            raise _timeout_error(command, timeout, outputs.get(1, b''),
+                                 outputs.get(2, b''))
+
+        return CommandResult(command, process.returncode, outputs[1],
+                             outputs[2])
+
+    async def _run(self, args, input, env, stdout_stream, stderr_stream,
+                   timeout):
+        import asyncio
+
+        command = [self.executable] + args
+
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.subprocess_exec(
+            lambda: _CommandProtocol(loop, stdout_stream, stderr_stream),
+            *command,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **self._process_kwargs(env)
+        )
+
+        try:
+            if input is not None:
+                stdin = transport.get_pipe_transport(0)
+                stdin.write(input)
+                stdin.close()
+
+            _, pending = await asyncio.wait(
+                [protocol.exited, protocol.closed], timeout=timeout
+            )
+
+            if pending:
+                await _kill(transport, protocol)
+
+                raise _timeout_error(command, timeout, protocol.output(1),
+                                     protocol.output(2))
+        except BaseException:
+            # Cancelled (or interrupted): don't leave git running
+            await _kill(transport, protocol)
+            raise
+        finally:
+            transport.close()
+
+        return CommandResult(command, transport.get_returncode(),
+                             protocol.output(1), protocol.output(2))
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine (e.g. commands awaited concurrently) in an event loop of
+    its own and return its result. If the calling thread is already running
+    an event loop, which can't be blocked by another one, the coroutine is
+    run in a worker thread.
+    """
+    import asyncio
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+class OutputBuffer:
+    """
+    Collects a command's output. If it's bounded, only the first `head`
+    and the last `tail` bytes are kept, with a note on how much has been
+    left out in between.
+    """
+
+    def __init__(self, head=None, tail=None):
+        """
+        :param head: bytes to keep from the beginning (None: keep all)
+        :param tail: bytes to keep from the end
+        """
+        self.head = head
+        self.tail = tail or 0
+
+        #: Number of bytes left out
+        self.dropped = 0
+
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def write(self, data):
+        if self.head is None:
+            self._head += data
+            return
+
+        room = self.head - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+
+        if data:
+            self._tail += data
+
+            excess = len(self._tail) - self.tail
+            if excess > 0:
+                del self._tail[:excess]
+                self.dropped += excess
+
+    def getvalue(self):
+        """ Return the collected output. """
+        if not self.dropped:
+            return bytes(self._head + self._tail)
+
+        return b''.join([
+            self._head,
+            b'\n[... %d bytes left out ...]\n' % self.dropped,
+            self._tail
+        ])
+
+
+def read_output(pipe, stream=None, head=CAPTURE_HEAD, tail=CAPTURE_TAIL):
+    """
+    Read a pipe until it's closed, in chunks as soon as they are available.
+
+    If the output is copied to a text stream, only its first `head` and
+    last `tail` bytes are returned, for error messages.
+
+    :rtype: bytes
+    """
+    captured = OutputBuffer() if stream is None else OutputBuffer(head, tail)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    # read1: return what's available instead of waiting for a full chunk
+    read = getattr(pipe, 'read1', pipe.read)
+    while True:
+        chunk = read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        captured.write(chunk)
+        if stream is not None:
+            copy_output(stream, decoder, chunk)
+
+    if stream is not None:
+        copy_output(stream, decoder, b'', final=True)
+
+    return captured.getvalue()
+
+
+def copy_output(stream, decoder, data, final=False):
+    """
+    Decode a chunk of output and write it to a text stream, which is flushed
+    once a line is complete.
+
+    :param decoder: the stream's incremental decoder
+    """
+    text = decoder.decode(data, final=final)
+    if text:
+        stream.write(text)
+
+    if final or '\n' in text or '\r' in text:
+        stream.flush()
+
+
+class PrefixedStream:
+    """
+    A text stream writing complete lines to another stream, each one
+    prefixed. Lines ending with a carriage return (progress updates) count
+    as lines, too, so lines of several commands never get mixed up.
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+
+        self._pending = ''
+
+    def write(self, text):
+        text = self._pending + text
+
+        # Wait for a '\n' that might follow
+        held = '\r' if text.endswith('\r') else ''
+        lines = LINE_PATTERN.split(text[:len(text) - len(held)])
+        self._pending = lines.pop() + held
+
+        # Line contents and their endings alternate
+        output = ''.join(self.prefix + line + ending for line, ending
+                         in zip(lines[0::2], lines[1::2]))
+        if output:
+            self.stream.write(output)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        """ Write an unterminated last line. """
+        if self._pending:
+            self.stream.write(self.prefix + self._pending + '\n')
+            self._pending = ''
+        self.flush()
+
+
+class _Unlimited:
+    """ A limiter that doesn't limit. """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def _option(name, value):
+    """ Convert a keyword argument to a command line option. """
+    if value is None or value is False:
+        return []
+
+    if len(name) == 1:
+        return ['-' + name] if value is True else ['-' + name, str(value)]
+
+    name = name.replace('_', '-')
+
+    return ['--' + name] if value is True else [f'--{name}={value}']
+
+
+def _flatten(args):
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            yield from _flatten(arg)
+        elif arg is not None:
+            yield str(arg)
+
+
+class _CommandProtocol:
+    """
+    Collects a command's output, copying it to streams as it arrives.
+    """
+
+    def __init__(self, loop, stdout_stream, stderr_stream):
+        #: Resolved once the process has exited
+        self.exited = loop.create_future()
+        #: Resolved once stdout and stderr have been closed
+        self.closed = loop.create_future()
+
+        self._streams = {1: stdout_stream, 2: stderr_stream}
+
+        # Output that's copied to a stream is only needed for errors
+        self._buffers = {
+            fd: OutputBuffer() if stream is None
+            else OutputBuffer(CAPTURE_HEAD, CAPTURE_TAIL)
+            for fd, stream in self._streams.items()
+        }
+        self._decoders = {
+            fd: codecs.getincrementaldecoder('utf-8')(errors='replace')
+            for fd in self._streams
+        }
+
+    def output(self, fd):
+        """
+        Return what the command has written to fd: everything, unless it
+        has been copied to a stream.
+        """
+        return self._buffers[fd].getvalue()
+
+    def connection_made(self, transport):
+        pass
+
+    def pipe_data_received(self, fd, data):
+        self._buffers[fd].write(data)
+        self._write(fd, data)
+
+    def pipe_connection_lost(self, fd, exc):
+        if fd not in self._streams:
+            return  # stdin
+
+        self._write(fd, b'', final=True)
+        del self._streams[fd]
+
+        if not self._streams:
+            _resolve(self.closed)
+
+    def process_exited(self):
+        _resolve(self.exited)
+
+    def connection_lost(self, exc):
+        _resolve(self.exited)
+        _resolve(self.closed)
+
+    def _write(self, fd, data, final=False):
+        stream = self._streams.get(fd)
+        if stream is not None:
+            copy_output(stream, self._decoders[fd], data, final)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _kill(transport, protocol):
+    """ Kill a command (if it's still running) and wait for it to exit. """
+    import asyncio
+
+    if transport.get_returncode() is None:
+        try:
+            transport.kill()
+        except ProcessLookupError:
+            pass
+
+    # Processes started by git (hooks, aliases, ssh, ...) might keep its
+    # pipes open, so don't wait for them to be closed
+    await asyncio.wait([protocol.exited], timeout=KILL_TIMEOUT)
+
+
+def _kill_process(process, readers):
+    """
+    Kill a command (if it's still running) and wait for it to exit and for
+    its output to be read, but no longer than KILL_TIMEOUT.
+    """
+    deadline = time.monotonic() + KILL_TIMEOUT
+
+    if process.poll() is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+    try:
+        process.wait(KILL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        pass
+
+    for reader in readers:
+        reader.join(max(deadline - time.monotonic(), 0))
+
+
+def _decode(output):
+    return output.decode('utf-8', errors='replace')
+
+
+def _timeout_error(command, timeout, stdout, stderr):
+    """ Return the GitError for a command that has been killed. """
+    from PyGitUp.git_wrapper import GitError
+
+    return GitError(
+        "'{}' timed out after {}s".format(' '.join(command), timeout),
+        stderr=_decode(stderr), stdout=_decode(stdout)
+    )
+
+
+def _error(result, stderr_already_output):
+    """ Return the GitError for a failed command. """
+    from PyGitUp.git_wrapper import GitError
+
+    message = "'{}' returned exit status {}".format(' '.join(result.args),
+                                                    result.status)
+
+    return GitError(message, stderr=_decode(result.stderr),
+                    stdout=_decode(result.stdout),
+                    stderr_already_output=stderr_already_output)
@@ -0,0 +1,81 @@
+"""
+When git-up has last fetched each remote.
+
+Several tools calling `git up` shortly after each other (an IDE, a shell
+prompt, cron) shouldn't all go to the network. git-up notes when it has
+fetched a remote in `$GIT_COMMON_DIR/git-up/fetched`, so fetching can be
+skipped while all remotes are fresh (see git-up.fetch.max-age).
+"""
+
+__all__ = ['FetchTimes']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import time
+
+# PyGitUp libs
+from PyGitUp.utils import write_json
+
+
+###############################################################################
+# FetchTimes
+###############################################################################
+
+class FetchTimes:
+    """
+    The times remotes have been fetched at, stored in a file.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        #: Path of the file
+        self.path = path
+
+    def load(self):
+        """
+        Return when the remotes have been fetched.
+
+        :rtype: dict[str, float]
+        """
+        import json
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or \
+                data.get('version') != self.VERSION or \
+                not isinstance(data.get('remotes'), dict):
+            return {}
+
+        return {remote: fetched for remote, fetched in data['remotes'].items()
+                if isinstance(fetched, (int, float))}
+
+    def is_fresh(self, remotes, max_age):
+        """
+        Have all remotes been fetched less than max_age seconds ago?
+        """
+        times = self.load()
+        now = time.time()
+
+        # Times in the future mean the clock has been turned back
+        return all(0 <= now - times.get(remote, 0) < max_age
+                   for remote in remotes)
+
+    def record(self, remotes):
+        """ Note that the remotes have just been fetched. """
+        if not remotes:
+            return
+
+        times = self.load()
+        now = time.time()
+        times.update((remote, now) for remote in remotes)
+
+        # If this fails, fetching again is always fine
+        write_json(self.path, {'version': self.VERSION, 'remotes': times})
@@ -16,22 +16,26 @@ __all__ = ['GitWrapper', 'GitError']
 
 # Python libs
 import sys
-import re
 import subprocess
-import platform
-import codecs
 from contextlib import contextmanager
 from io import BufferedReader
 from threading import Thread
 from typing import IO, Optional, List
 
-# 3rd party libs
-from termcolor import colored  # Assume, colorama is already initialized
-from git import GitCommandError, CheckoutError as OrigCheckoutError, Git
-from git.cmd import Git as GitCmd
+# 3rd party libs: GitPython is imported where it's used, see PyGitUp.gitup
 
 # PyGitUp libs
-from PyGitUp.utils import find
+from PyGitUp.backends import open_backend
+from PyGitUp.capabilities import GitCapabilities
+from PyGitUp.config import ConfigSnapshot
+from PyGitUp.engine import GitEngine, PrefixedStream, read_output, \
+    run_coroutine, CAPTURE_HEAD, CAPTURE_TAIL
+from PyGitUp.refs import history_rewritten
+from PyGitUp.utils import colored  # Assume, colorama is already initialized
+
+# Pass refs as patterns only if the command line stays short (Windows
+# limits it to 32k characters)
+MAX_PATTERN_LENGTH = 8000
 
 
 ###############################################################################
@@ -48,25 +52,50 @@ class GitWrapper:
     """
 
     def __init__(self, repo):
-        if repo:
-            #: :type: git.Repo
-            self.repo = repo
-            #: :type: git.Git
-            self.git = self.repo.git
-        else:
-            #: :type: git.Git
-            self.git = Git()
-
-    def __del__(self):
-        # Is the following true?
+        #: None outside of a repository, where only the config is read
+        #: :type: git.Repo
+        self.repo = repo
+        #: :type: git.Git
+        self.git = repo.git if repo else None
+
+        #: :type: PyGitUp.config.ConfigSnapshot
+        self._config_snapshot = None
+
+        #: :type: PyGitUp.status.WorktreeStatus
+        self._worktree_status = None
+
+        #: :type: PyGitUp.backends.SubprocessBackend
+        self._backend = None
+
+        #: :type: PyGitUp.engine.GitEngine
+        self._engine = None
+
+    @property
+    def engine(self):
+        """
+        Runs the wrapper's git commands, in the same directory and with the
+        same environment as `self.git`.
+
+        :rtype: PyGitUp.engine.GitEngine
+        """
+        if self._engine is None:
+            # Outside of a repository, git is run without GitPython
+            self._engine = (GitEngine() if self.git is None
+                            else GitEngine.for_git(self.git))
+
+        return self._engine
 
+    def close(self):
+        """ Stop the persistent git processes of the repository. """
         # GitPython runs persistent git processes in  the working directory.
         # Therefore, when we use 'git up' in something like a test environment,
         # this might cause troubles because of the open file handlers (like
         # trying to remove the directory right after the test has finished).
         # 'clear_cache' kills the processes...
 
-        if platform.system() == 'Windows':  # pragma: no cover
+        # Sparse init: no GitPython processes
+        if sys.platform == 'win32' and \
+                self.git is not None:  # pragma: no cover
             pass
             # ... or rather "should kill", because but somehow it recently
             # started to not kill cat_file_header out of the blue (I even
@@ -81,67 +110,137 @@ class GitWrapper:
                     str(self.git.cat_file_all.proc.pid)
                 )), shell=True)
 
-        self.git.clear_cache()
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
 
-    def _run(self, name, *args, **kwargs):
+        if self.repo is not None:
+            self.repo.close()
 
-        """ Run a git command specified by name and args/kwargs. """
+    def _run(self, name, *args, **kwargs):
+        """
+        Run a git command specified by name and args/kwargs. Additional
+        environment variables can be passed as `env`.
+        """
+        env = kwargs.pop('env', None)
 
-        stdout = b''
-        cmd = getattr(self.git, name)
+        result = self.engine.run_sync(
+            *self.engine.command(name, *args, **kwargs), env=env
+        )
 
-        # Ask cmd(...) to return a (status, stdout, stderr) tuple
-        kwargs['with_extended_output'] = True
+        return self.decode_output(result.stdout).strip()
 
-        # Execute command
-        try:
-            (_, stdout, _) = cmd(*args, **kwargs)
-        except GitCommandError as error:
-            # Add more meta-information to errors
-            message = "'{}' returned exit status {}".format(
-                ' '.join(str(c) for c in error.command),
-                error.status
-            )
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._run(name, *args, **kwargs)
 
-            raise GitError(message, stderr=error.stderr, stdout=stdout)
+    def _run_input(self, name, data, *args, **kwargs):
+        """ Run a git command, passing data to its stdin. """
+        env = kwargs.pop('env', None)
 
-        return stdout.strip()
+        result = self.engine.run_sync(
+            *self.engine.command(name, *args, **kwargs), input=data, env=env
+        )
 
-    def __getattr__(self, name):
-        return lambda *args, **kwargs: self._run(name, *args, **kwargs)
+        return self.decode_output(result.stdout).strip()
 
     ###########################################################################
     # Overwrite some methods and add new ones
     ###########################################################################
 
+    @property
+    def backend(self):
+        """
+        Answers read-only queries: in-process, if git-up.backend.pygit2 is
+        true and pygit2 is installed, otherwise by running git.
+
+        :rtype: PyGitUp.backends.SubprocessBackend
+        """
+        if self._backend is None:
+            enabled = self.config('git-up.backend.pygit2') or 'false'
+            path = self.repo.working_tree_dir or self.repo.git_dir \
+                if self.repo else None
+
+            # libgit2 wouldn't see settings passed through the environment,
+            # nor replace refs, grafts or shallow boundaries
+            enabled = enabled.lower() == 'true' and \
+                'GIT_CONFIG_PARAMETERS' not in self.git.environment() and \
+                path is not None and \
+                not history_rewritten(self.repo.common_dir)
+
+            self._backend = open_backend(self, path, enabled)
+
+        return self._backend
+
+    def merge_base(self, commit, other):
+        """
+        Return the best common ancestor of two commits, None if they don't
+        have one.
+        """
+        return self.backend.merge_base(commit, other)
+
+    def commit_sha(self, rev):
+        """ Return the SHA of the commit rev points to, or None. """
+        return self.backend.commit_sha(rev)
+
+    def tree_shas(self, *revs):
+        """ Return the SHAs of the trees of several commits. """
+        return self.backend.tree_shas(list(revs))
+
+    def worktree_status(self):
+        """
+        Return the local changes in the working tree.
+
+        The working tree is only scanned again after git-up itself has
+        changed it.
+
+        :rtype: PyGitUp.status.WorktreeStatus
+        """
+        if self._worktree_status is None:
+            self._worktree_status = self.backend.status()
+
+        return self._worktree_status
+
+    def invalidate_worktree_status(self):
+        """ Note that git-up has changed the working tree. """
+        self._worktree_status = None
+
     @contextmanager
     def stasher(self):
         """
         A stashing contextmanager.
+
+        Whether there is anything to stash is decided with the snapshot of
+        `worktree_status`, so the working tree isn't scanned again.
         """
         # nonlocal for python2
         stashed = [False]
         clean = [False]
 
         def stash():
-            if clean[0] or not self.repo.is_dirty(submodules=False):
+            if clean[0]:
+                return
+
+            worktree_status = self.worktree_status()
+            if not worktree_status.dirty:
                 clean[0] = True
                 return
             if stashed[0]:
                 return
 
-            if self.change_count > 1:
+            if worktree_status.count > 1:
                 message = 'stashing {0} changes'
             else:
                 message = 'stashing {0} change'
             print(colored(
-                message.format(self.change_count),
+                message.format(worktree_status.count),
                 'magenta'
             ))
             try:
                 self._run('stash')
             except GitError as git_error:
                 raise StashError(stderr=git_error.stderr, stdout=git_error.stdout)
+            finally:
+                self.invalidate_worktree_status()
 
             stashed[0] = True
 
@@ -155,15 +254,19 @@ class GitWrapper:
                 self._run('stash', 'pop')
             except GitError as e:
                 raise UnstashError(stderr=e.stderr, stdout=e.stdout)
+            finally:
+                self.invalidate_worktree_status()
 
     def checkout(self, branch_name):
         """ Checkout a branch by name. """
+        from git import CheckoutError as OrigCheckoutError, Head
+
         try:
-            find(
-                self.repo.branches, lambda b: b.name == branch_name
-            ).checkout()
+            Head(self.repo, Head.to_full_path(branch_name)).checkout()
         except OrigCheckoutError as e:
             raise CheckoutError(branch_name, details=e)
+        finally:
+            self.invalidate_worktree_status()
 
     def rebase(self, target_branch):
         """ Rebase to target branch. """
@@ -172,55 +275,172 @@ class GitWrapper:
         # (MSYS2 git writes POSIX-style paths into the worktree's .git file).
         current_branch_name = self._run('rev-parse', '--abbrev-ref', 'HEAD')
 
-        arguments = (
-                ([self.config('git-up.rebase.arguments')] or []) +
-                [target_branch.name]
-        )
+        arguments = [self.config('git-up.rebase.arguments'),
+                     target_branch.name]
         try:
             self._run('rebase', *arguments)
         except GitError as e:
             raise RebaseError(current_branch_name, target_branch.name,
                               **e.__dict__)
+        finally:
+            self.invalidate_worktree_status()
+
+    def update_refs(self, updates, message):
+        """
+        Update several refs in a single atomic transaction.
+
+        If any ref doesn't point to its expected old value anymore (e.g.
+        because it has been changed concurrently), no ref is updated.
+
+        :param updates: (refname, new SHA, expected old SHA) tuples, refs
+                        with None as their new SHA are deleted
+        :param message: the reflog message
+        """
+        if not updates:
+            return
+
+        commands = ''.join(
+            f'update {refname} {new_sha} {old_sha}\n' if new_sha is not None
+            else f'delete {refname} {old_sha}\n'
+            for refname, new_sha, old_sha in updates
+        )
+
+        try:
+            self._run_input('update_ref', commands.encode('utf-8'),
+                            '-m', message, '--stdin')
+        except GitError as e:
+            raise RefUpdateError([refname for refname, _, _ in updates],
+                                 **e.__dict__)
 
     def fetch(self, *args, **kwargs):
         """ Fetch remote commits. """
 
+        env = kwargs.pop('env', None)
         stderr_output_stream = kwargs.pop('stderr_output_stream', None)
 
-        # Execute command
-        cmd = self.git.fetch(as_process=True, *args, **kwargs)
+        result = self.engine.run_sync(
+            *self.engine.command('fetch', *args, **kwargs), env=env,
+            stdout_stream=sys.stdout, stderr_stream=stderr_output_stream
+        )
+
+        return result.stdout.strip()
+
+    def fetch_parallel(self, remotes, jobs, *args, **kwargs):
+        """
+        Fetch remotes with one `git fetch` each, at most `jobs` at once.
+        Their output is printed line by line, prefixed with the remote's
+        name.
+
+        :param refspecs: remote name -> refspecs to fetch (optional)
+        :returns: remote name -> GitError, for the remotes that couldn't
+                  be fetched
+        :rtype: dict[str, GitError]
+        """
+        import asyncio
+
+        refspecs = kwargs.pop('refspecs', None) or {}
+        env = kwargs.pop('env', None)
+        stderr_output_stream = kwargs.pop('stderr_output_stream', None)
+        engine = GitEngine.for_git(self.git, limit=jobs)
+
+        async def fetch(remote):
+            prefix = remote + ': '
+            stdout = PrefixedStream(sys.stdout, prefix)
+            stderr = None
+            if stderr_output_stream is not None:
+                stderr = PrefixedStream(stderr_output_stream, prefix)
+
+            try:
+                await engine.run(
+                    *engine.command('fetch', *args, remote,
+                                    refspecs.get(remote), **kwargs),
+                    env=env, stdout_stream=stdout, stderr_stream=stderr
+                )
+            except GitError as error:
+                return remote, error
+            finally:
+                stdout.close()
+                if stderr is not None:
+                    stderr.close()
+
+            return remote, None
+
+        async def fetch_all():
+            return await asyncio.gather(*[fetch(remote)
+                                          for remote in remotes])
+
+        return {remote: error for remote, error in run_coroutine(fetch_all())
+                if error is not None}
+
+    def ls_remotes(self, refs, jobs=None, env=None):
+        """
+        Ask several remotes for the SHAs of some of their refs with
+        `git ls-remote`, at most `jobs` at once.
+
+        :param refs: remote name -> refnames
+        :param env: additional environment variables
+        :returns: remote name -> {refname: SHA} of the refs that exist, None
+                  for remotes that couldn't be asked
+        :rtype: dict[str, dict[str, str] | None]
+        """
+        import asyncio
+
+        engine = GitEngine.for_git(self.git, limit=jobs)
+
+        async def ls_remote(remote):
+            patterns = refs[remote]
+            if sum(len(pattern) + 1 for pattern in patterns) > \
+                    MAX_PATTERN_LENGTH:
+                patterns = []
+
+            # Patterns are matched after listing the refs. With --heads,
+            # protocol v2 at least keeps the remote from advertising refs
+            # outside of refs/heads (pull requests, tags, ...)
+            heads = all(ref.startswith('refs/heads/') for ref in refs[remote])
+
+            result = await engine.run(
+                *engine.command('ls_remote', remote, patterns, heads=heads),
+                env=env, check=False
+            )
+            if not result.ok:
+                return remote, None
+
+            listed = {}
+            for line in self.decode_output(result.stdout).splitlines():
+                sha, _, refname = line.partition('\t')
+                listed[refname] = sha
 
-        return self.run_cmd(cmd, stderr_output_stream=stderr_output_stream)
+            return remote, listed
+
+        async def ls_remote_all():
+            return await asyncio.gather(*[ls_remote(remote)
+                                          for remote in refs])
+
+        return dict(run_coroutine(ls_remote_all()))
 
     def push(self, *args, **kwargs):
         """ Push commits to remote """
-        # Execute command
-        cmd = self.git.push(as_process=True, *args, **kwargs)
+        result = self.engine.run_sync(
+            *self.engine.command('push', *args, **kwargs),
+            stdout_stream=sys.stdout
+        )
 
-        return self.run_cmd(cmd)
+        return result.stdout.strip()
 
     @staticmethod
-    def stream_reader(input_stream: BufferedReader, output_stream: Optional[IO], result_list: List[bytes]) -> None:
+    def stream_reader(input_stream: BufferedReader, output_stream: Optional[IO], result_list: List[bytes],
+                      head: int = CAPTURE_HEAD, tail: int = CAPTURE_TAIL) -> None:
         """
         Helper method to read from a stream and write to another stream.
+        See `PyGitUp.engine.read_output`, which the engine's own commands
+        use.
 
         We use a list to store results because they are mutable and allow
         for passing data back to the caller from the thread without additional
         machinery.
         """
-        captured_bytes = b""
-        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
-        while True:
-            read_byte = input_stream.read(1)
-            captured_bytes += read_byte
-            if output_stream is not None:
-                decoded_text = decoder.decode(read_byte, final=not read_byte)
-                if decoded_text:
-                    output_stream.write(decoded_text)
-                    output_stream.flush()
-            if read_byte == b"":
-                break
-        result_list.append(captured_bytes)
+        result_list.append(read_output(input_stream, output_stream, head,
+                                       tail))
 
     @staticmethod
     def decode_output(output):
@@ -230,8 +450,18 @@ class GitWrapper:
         return output
 
     @staticmethod
-    def run_cmd(cmd: GitCmd.AutoInterrupt, stderr_output_stream=None) -> bytes:
-        """ Run a command and return stdout. """
+    def run_cmd(cmd: 'git.cmd.Git.AutoInterrupt',
+                stderr_output_stream=None) -> bytes:
+        """
+        Run a command started by GitPython (`as_process=True`) and return
+        stdout.
+
+        git-up's own commands go through `self.engine`. This (and
+        `stream_reader`) stays for code driving GitPython processes itself,
+        with the same output handling and errors.
+        """
+        from git import GitCommandError
+
         std_outs = []
         std_errs = []
         stdout_thread = Thread(target=GitWrapper.stream_reader,
@@ -268,8 +498,23 @@ class GitWrapper:
 
         return std_outs[0].strip() if std_outs else bytes()
 
+    @property
+    def config_snapshot(self):
+        """ All git-up settings, read with a single `git config` call. """
+        if self._config_snapshot is None:
+            git_dir = self.repo.common_dir if self.repo else None
+            self._config_snapshot = ConfigSnapshot.for_repo(self.engine,
+                                                            git_dir)
+
+        return self._config_snapshot
+
     def config(self, key):
         """ Return `git config key` output or None. """
+        if key.startswith('git-up.'):
+            return self.config_snapshot.get(key)
+
+        from git import GitCommandError
+
         try:
             return self.git.config(key)
         except GitCommandError:
@@ -278,25 +523,30 @@ class GitWrapper:
     @property
     def change_count(self):
         """ The number of changes in the working directory. """
-        status = self.git.status(porcelain=True, untracked_files='no').strip()
-        if not status:
-            return 0
-        else:
-            return len(status.split('\n'))
+        return self.worktree_status().count
 
     @property
-    def version(self):
+    def capabilities(self):
         """
-        Return git's version as a list of numbers.
+        The features supported by git, probed only once per process.
 
-        The original repo.git.version_info has problems with tome types of
-        git version strings.
+        :rtype: PyGitUp.capabilities.GitCapabilities
         """
-        return re.search(r'\d+(\.\d+)+', self.git.version()).group(0)
+        persistent = self.config('git-up.cache.git-version') or ''
+
+        return GitCapabilities.probe(
+            self.git.GIT_PYTHON_GIT_EXECUTABLE or 'git',
+            persistent=persistent.lower() == 'true'
+        )
+
+    @property
+    def version(self):
+        """ Return git's version string, e.g. '2.39.5'. """
+        return self.capabilities.version_string
 
     def is_version_min(self, required_version):
         """ Does git's version match the requirements? """
-        return self.version.split('.') >= required_version.split('.')
+        return self.capabilities.is_version_min(required_version)
 
 
 ###############################################################################
@@ -357,6 +607,18 @@ class CheckoutError(GitError):
                           **kwargs)
 
 
+class RefUpdateError(GitError):
+    """
+    Error while updating refs
+    """
+
+    def __init__(self, refnames, **kwargs):
+        kwargs.pop('message', None)
+
+        message = 'Failed to update ' + ', '.join(refnames)
+        GitError.__init__(self, message, **kwargs)
+
+
 class RebaseError(GitError):
     """
     Error during rebase command
@@ -1,6 +1,3 @@
-from git import Git
-from git import GitCommandNotFound
-
 __all__ = ['GitUp']
 
 ###############################################################################
@@ -8,45 +5,50 @@ __all__ = ['GitUp']
 ###############################################################################
 
 # Python libs
-import argparse
-import codecs
 import errno
 import sys
 import os
 import re
-import json
 import subprocess
-from io import StringIO
-from tempfile import NamedTemporaryFile
-from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
-
-# 3rd party libs
-try:
-    from importlib import metadata
-except ImportError:  # pragma: no cover
-    metadata = None
-    NO_DISTRIBUTE = True
-else:  # pragma: no cover
-    NO_DISTRIBUTE = False
-
-from packaging.version import InvalidVersion, Version
-
-import colorama
-from git import Repo, GitCmdObjectDB
-from termcolor import colored
+
+# 3rd party libs (GitPython, colorama, packaging, ...) are imported where
+# they're used: importing them takes longer than a `git up` that has nothing
+# to do, and most of them are only needed on some code paths.
 
 # PyGitUp libs
-from PyGitUp.utils import execute, uniq, find
+from PyGitUp.capabilities import GitCapabilities
+from PyGitUp.classify import BranchClassifier, AHEAD, BEHIND, UP_TO_DATE
+from PyGitUp.commitgraph import CommitGraph
+from PyGitUp.fetchtimes import FetchTimes
+from PyGitUp.utils import colored, config_environment, execute_lines, \
+    parse_duration, uniq
 from PyGitUp.git_wrapper import GitWrapper, GitError, RebaseError
+from PyGitUp.jobs import WorktreeJobs
+from PyGitUp.planner import ExecutionPlan
+from PyGitUp.refs import RefSnapshot
+from PyGitUp.repos import RepoPool
+from PyGitUp.replay import InMemoryRebase
+from PyGitUp.scratch import ScratchPool
+from PyGitUp.statecache import StateCache
+from PyGitUp.worktrees import WorktreeIndex
 
 ON_WINDOWS = sys.platform == 'win32'
 
-def normalize_path(path):
-    if ON_WINDOWS and path and path[0] == '/':
-        return execute(['cygpath', '-m', path])
 
-    return path
+def normalize_paths(paths):
+    """
+    Convert POSIX-style paths reported by MSYS2 git into paths usable by a
+    native Windows Python, using a single cygpath call.
+    """
+    posix_paths = [path for path in paths
+                   if ON_WINDOWS and path and path[0] == '/']
+    if not posix_paths:
+        return paths
+
+    converted = execute_lines(['cygpath', '-m'] + posix_paths) or posix_paths
+    converted = dict(zip(posix_paths, converted))
+
+    return [converted.get(path, path) for path in paths]
 
 
 def prepare_windows_log_hook(log_hook):
@@ -78,7 +80,17 @@ def prepare_windows_log_hook(log_hook):
 # Setup of 3rd party libs
 ###############################################################################
 
-colorama.init(autoreset=True, convert=ON_WINDOWS)
+_colorama_initialized = False
+
+
+def init_colorama():
+    """ Set up colorama, unless that has already been done. """
+    global _colorama_initialized
+
+    if not _colorama_initialized:
+        import colorama
+        colorama.init(autoreset=True, convert=ON_WINDOWS)
+        _colorama_initialized = True
 
 ###############################################################################
 # Setup constants
@@ -86,32 +98,109 @@ colorama.init(autoreset=True, convert=ON_WINDOWS)
 
 PYPI_URL = 'https://pypi.python.org/pypi/git-up/json'
 
+# How the states of branches that are left alone are printed
+STATE_MESSAGES = {
+    'up to date': ('up to date', 'green'),
+    'ahead': ('ahead of upstream', 'cyan'),
+    'diverged': ('diverged', 'red'),
+    'operation in progress': ('operation in progress', 'yellow'),
+    'remote branch doesn\'t exist': ('error: remote branch doesn\'t exist',
+                                     'red'),
+}
+
+# How updates are announced by `git up --status`
+PLANNED_MESSAGES = {
+    'fast-forwarding': 'would fast-forward',
+    'rebasing': 'would rebase',
+}
+
 
 ###############################################################################
 # GitUp
 ###############################################################################
 
-def get_git_dir():
-    toplevel_dir = execute(['git', 'rev-parse', '--show-toplevel'])
-    toplevel_dir = normalize_path(toplevel_dir)
+class RepoLocation:
+    """
+    Where the repository git-up runs in lives on disk.
 
-    if toplevel_dir is not None \
-            and os.path.isfile(os.path.join(toplevel_dir, '.git')):
-        # Not a normal git repo. Check if it's a submodule, then use
-        # toplevel_dir. Otherwise it's a worktree, thus use  common_dir.
-        # NOTE: git worktree support only comes with git v2.5.0 or
-        # later, on earlier versions toplevel_dir is the best we can do.
+    All of it is discovered with a single `git rev-parse` call.
+    """
 
-        cmd = ['git', 'rev-parse', '--is-inside-work-tree']
-        inside_worktree = execute(cmd, cwd=os.path.join(toplevel_dir, '..'))
+    OPTIONS = ['--show-toplevel', '--git-dir', '--git-common-dir',
+               '--is-inside-work-tree',
+               # Has to be the last option: prints nothing outside of
+               # submodules
+               '--show-superproject-working-tree']
+
+    def __init__(self, toplevel_dir, git_dir, common_dir,
+                 inside_work_tree=True, superproject_dir=None):
+        self.toplevel_dir = toplevel_dir
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.inside_work_tree = inside_work_tree
+        self.superproject_dir = superproject_dir
+
+    @classmethod
+    def discover(cls, cwd=None):
+        """ Locate the repository, None if we're not inside of one. """
+        lines = execute_lines(['git', 'rev-parse'] + cls.OPTIONS, cwd=cwd)
+
+        return cls.parse(lines, cwd or os.getcwd())
+
+    @classmethod
+    def parse(cls, lines, cwd):
+        """ Parse the output of `git rev-parse OPTIONS`. """
+        if not lines or len(lines) < 4:
+            return None
 
-        if inside_worktree == 'true' or Git().version_info[:3] < (2, 5, 0):
-            return toplevel_dir
-        else:
-            common_dir = execute(['git', 'rev-parse', '--git-common-dir'])
-            return normalize_path(common_dir)
+        toplevel_dir, git_dir, common_dir, inside_work_tree = lines[:4]
+        superproject_dir = lines[4] if len(lines) > 4 and lines[4] else None
+
+        toplevel_dir, git_dir, common_dir, superproject_dir = \
+            normalize_paths([toplevel_dir, git_dir, common_dir,
+                             superproject_dir])
+
+        # The git dirs are reported relative to the working directory
+        return cls(
+            toplevel_dir=toplevel_dir,
+            git_dir=os.path.normpath(os.path.join(cwd, git_dir)),
+            common_dir=os.path.normpath(os.path.join(cwd, common_dir)),
+            inside_work_tree=inside_work_tree == 'true',
+            superproject_dir=superproject_dir,
+        )
+
+    @property
+    def is_submodule(self):
+        """ Are we inside of a submodule? """
+        return self.superproject_dir is not None
+
+    @property
+    def is_linked_worktree(self):
+        """ Are we inside of a worktree created by `git worktree add`? """
+        return self.git_dir != self.common_dir
+
+    @property
+    def repo_dir(self):
+        """ The directory to open the repository from. """
+        if self.is_linked_worktree:
+            # Open the worktree itself, so its own HEAD and index are used
+            return self.toplevel_dir
 
-    return toplevel_dir
+        if os.path.isfile(os.path.join(self.toplevel_dir, '.git')) \
+                and not self.is_submodule:
+            # A work tree with its git dir somewhere else, thus use the
+            # common dir. Submodules use the toplevel dir like normal
+            # repositories do.
+            return self.common_dir
+
+        return self.toplevel_dir
+
+
+def get_git_dir():
+    """ Return the directory to open the repository from, if any. """
+    location = RepoLocation.discover()
+
+    return location.repo_dir if location else None
 
 
 class GitUp:
@@ -121,7 +210,13 @@ class GitUp:
         'fetch.prune': True,
         'fetch.all': False,
         'fetch.progress': False,
+        'fetch.jobs': 1,
+        'fetch.narrow': False,
+        'fetch.skip-unchanged': False,
+        'fetch.max-age': None,
         'rebase.show-hashes': False,
+        'rebase.commit-graph': False,
+        'rebase.in-memory': False,
         'rebase.arguments': None,
         'rebase.auto': True,
         'rebase.log-hook': None,
@@ -129,108 +224,144 @@ class GitUp:
         'push.auto': False,
         'push.tags': False,
         'push.all': False,
+        'cache.git-version': False,
+        'cache.state': False,
+        'worktrees.cache': False,
+        'worktrees.scratch': 0,
+        'worktrees.jobs': 1,
+        'backend.pygit2': False,
     }
 
     def __init__(self, testing=False, sparse=False, quiet=False):
+        init_colorama()
         self.quiet = quiet
 
-        # Sparse init: config only
-        if sparse:
-            self.git = GitWrapper(None)
+        #: Repositories opened during the run, closed by close()
+        self.repos = RepoPool()
 
-            # Load configuration
-            self.settings = self.default_settings.copy()
-            self.load_config()
-            return
+        try:
+            # Sparse init: config only
+            if sparse:
+                self.git = GitWrapper(None)
 
-        # Testing: redirect stderr to stdout
-        self.testing = testing
-        if self.testing:
-            self.stderr = sys.stdout  # Quiet testing
-        else:  # pragma: no cover
-            self.stderr = sys.stderr
+                # Load configuration
+                self.settings = self.default_settings.copy()
+                self.load_config()
+                return
 
-        self.states = []
-        self.should_fetch = True
-        self.pushed = False
+            # Not needed for the sparse init (e.g. `git up --version`)
+            from git import GitCommandNotFound, Head, RemoteReference
 
-        # Check, if we're in a git repo
-        try:
-            repo_dir = get_git_dir()
-        except (OSError, GitCommandNotFound) as e:
-            if isinstance(e, GitCommandNotFound) or e.errno == errno.ENOENT:
-                exc = GitError("The git executable could not be found")
-                raise exc
+            # Testing: redirect stderr to stdout
+            self.testing = testing
+            if self.testing:
+                self.stderr = sys.stdout  # Quiet testing
+            else:  # pragma: no cover
+                self.stderr = sys.stderr
+
+            self.states = []
+            self.should_fetch = True
+            self.status_only = False
+            self.pushed = False
+
+            # Check, if we're in a git repo
+            try:
+                #: :type: RepoLocation
+                self.location = RepoLocation.discover()
+            except (OSError, GitCommandNotFound) as e:
+                if isinstance(e, GitCommandNotFound) or \
+                        e.errno == errno.ENOENT:
+                    exc = GitError("The git executable could not be found")
+                    raise exc
+                else:
+                    raise
             else:
-                raise
-        else:
-            if repo_dir is None:
-                exc = GitError("We don't seem to be in a git repository.")
-                raise exc
+                if self.location is None:
+                    exc = GitError("We don't seem to be in a git repository.")
+                    raise exc
 
-            self.repo = Repo(repo_dir, odbt=GitCmdObjectDB)
+                self.git = self.repos.open(self.location.repo_dir)
 
-        # Check for branch tracking information
-        if not any(b.tracking_branch() for b in self.repo.branches):
-            exc = GitError("Can\'t update your repo because it doesn\'t has "
-                           "any branches with tracking information.")
-            self.print_error(exc)
+            self.repo = self.git.repo
 
-            raise exc
+            # refs: SHAs and upstreams of all branches, read in one go
+            self.refs = RefSnapshot.load(self.git, self.location.git_dir)
 
-        self.git = GitWrapper(self.repo)
+            # Check for branch tracking information
+            if not self.refs.upstreams:
+                exc = GitError("Can\'t update your repo because it "
+                               "doesn\'t has any branches with tracking "
+                               "information.")
+                self.print_error(exc)
 
-        # target_map: map local branch names to remote tracking branches
-        #: :type: dict[str, git.refs.remote.RemoteReference]
-        self.target_map = dict()
+                raise exc
 
-        for branch in self.repo.branches:
-            target = branch.tracking_branch()
+            # target_map: map local branch names to remote tracking branches
+            #: :type: dict[str, git.refs.remote.RemoteReference]
+            self.target_map = dict()
 
-            if target:
-                if target.name.startswith('./'):
+            for name, (upstream, remote) in self.refs.upstreams.items():
+                if remote == '.':
                     # Tracking branch is in local repo
+                    target = RemoteReference(
+                        self.repo,
+                        'refs/remotes/./' + upstream[len('refs/heads/'):]
+                    )
                     target.is_local = True
                 else:
+                    target = RemoteReference(self.repo, upstream)
                     target.is_local = False
 
-                self.target_map[branch.name] = target
+                self.target_map[name] = target
 
-        # branches: all local branches with tracking information
-        #: :type: list[git.refs.head.Head]
-        self.branches = [b for b in self.repo.branches if b.tracking_branch()]
-        self.branches.sort(key=lambda br: br.name)
+            # branches: all local branches with tracking information
+            #: :type: list[git.refs.head.Head]
+            self.branches = [Head(self.repo, Head.to_full_path(name))
+                             for name in self.target_map]
+            self.branches.sort(key=lambda br: br.name)
 
-        # remotes: all remotes that are associated with local branches
-        #: :type: list[git.refs.remote.RemoteReference]
-        self.remotes = uniq(
-            # name = '<remote>/<branch>' -> '<remote>'
-            [r.name.split('/', 2)[0]
-             for r in list(self.target_map.values())]
-        )
-
-        # change_count: Number of unstaged changes
-        self.change_count = len(
-            self.git.status(porcelain=True, untracked_files='no').split('\n')
-        )
+            # remotes: all remotes that are associated with local branches
+            #: :type: list[str]
+            self.remotes = uniq(
+                [remote for _, remote in self.refs.upstreams.values()]
+            )
 
-        # Build worktree map: branch name -> worktree path
-        self.worktree_map, self.in_progress_branches = self._build_worktree_map()
+            # Load configuration
+            self.settings = self.default_settings.copy()
+            self.load_config()
 
-        # Load configuration
-        self.settings = self.default_settings.copy()
-        self.load_config()
+            # worktrees: branches checked out in linked worktrees, looked up
+            # lazily. The branch checked out in the current worktree is handled
+            # via the regular checkout path.
+            #: :type: PyGitUp.worktrees.WorktreeIndex
+            self.worktrees = WorktreeIndex(
+                self.location.common_dir,
+                exclude_branch=self._current_branch(),
+                cache_file=(self._cache_file('worktrees')
+                            if self.settings['worktrees.cache'] else None),
+                exclude_root=self._cache_file('scratch')
+            )
+        except BaseException:
+            # Don't leave the git processes of a half-initialized run behind
+            self.repos.close()
+            raise
 
     def run(self):
         """ Run all the git-up stuff. """
         try:
-            if self.should_fetch:
+            # Fetching writes remote-tracking branches, --status mustn't
+            # change anything
+            if self.should_fetch and not self.status_only and \
+                    not self._fetched_recently():
                 self.fetch()
 
-            self.rebase_all_branches()
+            if self.status_only:
+                self.status()
+            else:
+                self.rebase_all_branches()
 
-            if self.settings['push.auto']:
-                self.push()
+                if self.settings['push.auto']:
+                    self.push()
 
         except GitError as error:
             self.print_error(error)
@@ -242,213 +373,432 @@ class GitUp:
                 sys.exit(1)
         except KeyboardInterrupt:
             sys.exit(130)
+        finally:
+            self.close()
+
+    def close(self):
+        """ Stop all git processes started by git-up. """
+        self.repos.close()
+
+        if self.git.repo is None:
+            self.git.close()  # Sparse init: not opened through the pool
+
+    @property
+    def worktree_status(self):
+        """
+        Local changes, looked at once they're needed.
+
+        :rtype: PyGitUp.status.WorktreeStatus
+        """
+        return self.git.worktree_status()
+
+    @property
+    def change_count(self):
+        """ Number of unstaged changes """
+        return self.worktree_status.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def rebase_all_branches(self):
         """ Rebase all branches, if possible. """
         col_width = max(len(b.name) for b in self.branches) + 1
-        if self.repo.head.is_detached:
+        current_branch = self._current_branch()
+        if current_branch is None:
             raise GitError("You're not currently on a branch. I'm exiting"
                            " in case you're in the middle of something.")
-        original_branch = self.repo.active_branch
 
-        with self.git.stasher() as stasher:
+        from git import Head
+
+        original_branch = Head(self.repo, Head.to_full_path(current_branch))
+
+        # Fast-forwards of branches that aren't checked out, applied in one
+        # transaction per target whenever git needs to see them
+        fast_forwards = []
+
+        # Custom rebase arguments can only be honored by git rebase itself
+        in_memory = None
+        if self.settings['rebase.in-memory'] and \
+                not self.settings['rebase.arguments']:
+            in_memory = InMemoryRebase(self.git, self.git.capabilities)
+
+        scratch = self._scratch_pool()
+
+        # Update the branches that don't need a checkout first and finish on
+        # the original branch. The log hook's output can't be kept in order.
+        log_hook = self.settings['rebase.log-hook']
+        names = [branch.name for branch in self.branches]
+        plan = ExecutionPlan(
+            names, original_branch.name,
+            {name: self.target_map[name].name[2:] for name in names
+             if self.target_map[name].is_local},
+            enabled=not log_hook
+        )
+        jobs = WorktreeJobs(1 if log_hook
+                            else self._int_setting('worktrees.jobs'),
+                            names if plan.enabled else ())
+
+        branches = dict(zip(names, self.branches))
+        states = {}
+
+        def update(branch):
+            """
+            Update a branch, unless that needs a checkout. Returns the target
+            to rebase it onto in the main working tree in that case.
+            """
+            target = self.target_map[branch.name]
+
+            # Print branch name
+            if branch.name == original_branch.name:
+                attrs = ['bold']
+            else:
+                attrs = []
+            print(colored(branch.name.ljust(col_width), attrs=attrs),
+                    end=' ')
+
+            # Check status and act appropriately
+            jobs.wait(self._target_refname(target))
+            target_sha = self.refs.sha(self._target_refname(target))
+            branch_sha = self.refs.sha(branch.path)
+
+            state = self._branch_state(branch, branch_sha, target_sha,
+                                       classifier)
+            states[branch.name] = state
+
+            if state in STATE_MESSAGES:
+                print(colored(*STATE_MESSAGES[state]))
+
+                return None  # Do not do anything
+
+            # Get tracking branch
+            if target.is_local:
+                target = Head(self.repo, Head.to_full_path(target.name[2:]))
+
+            worktree = self.worktrees.get(branch.name)
+
+            fast_forward = state == 'fast-forwarding'
+            fast_fastforward = False
+            if fast_forward:
+                print(colored('fast-forwarding...', 'yellow'), end='')
+                # Don't fast fast-forward the currently checked-out branch
+                fast_fastforward = (branch.name !=
+                                    self.repo.active_branch.name)
+            else:
+                print(colored('rebasing', 'yellow'), end='')
+
+            print(self._hashes(state, branch_sha, target_sha, classifier))
+
+            if log_hook:
+                self._fast_forward_all(fast_forwards)
+            self.log(branch, target)
+            if fast_fastforward and not worktree:
+                fast_forwards.append(
+                    (branch.path, target_sha, branch_sha, target.name)
+                )
+            elif worktree:
+                self._fast_forward_all(fast_forwards)
+                worktree_path, = normalize_paths([worktree.path])
+                jobs.submit(
+                    branch.path, self._rebase_in_worktree,
+                    branch, target, worktree_path, fast_fastforward,
+                    jobs.environment
+                )
+            else:
+                rebased_sha = None
+                if in_memory and \
+                        branch.name != self.repo.active_branch.name:
+                    rebased_sha = in_memory.rebase(branch_sha, target_sha)
+
+                if rebased_sha:
+                    self._fast_forward_all(fast_forwards)
+                    self.git.update_refs(
+                        [(branch.path, rebased_sha, branch_sha)],
+                        f'rebase (finish): {branch.path} onto {target_sha}'
+                    )
+                elif scratch and \
+                        branch.name != self.repo.active_branch.name and \
+                        self._rebase_in_scratch(branch, target, scratch,
+                                                fast_forwards):
+                    pass  # Rebased off the main working tree
+                else:
+                    # Not possible in memory or in a scratch worktree, e.g.
+                    # because of conflicts
+                    return target
+
+            # Later branches may track this one locally
+            self.refs.update(branch.path,
+                             target_sha if fast_fastforward else None)
+
+            return None
+
+        graph = self._commit_graph()
+        state_cache = self._state_cache()
+        classifier = None
+        try:
+            classifier = self._classify_all(graph, state_cache)
+
+            with self.git.stasher() as stasher, jobs:
+                for name, target in plan:
+                    branch = branches[name]
+                    jobs.branch(name)
+
+                    if target is None:
+                        target = update(branch)
+
+                        if target is not None and plan.enabled:
+                            plan.defer(name, target)
+                            continue
+
+                    if target is not None:
+                        self._fast_forward_all(fast_forwards)
+                        stasher()
+                        self.git.checkout(branch.name)
+                        self.git.rebase(target)
+
+                        self.refs.update(branch.path)
+
+                    plan.finish(name)
+                    jobs.finish(name)
+
+                self._fast_forward_all(fast_forwards)
+                jobs.drain()
+
+                if (self.repo.head.is_detached  # Only on Travis CI,
+                        # we get a detached head after doing our rebase
+                        # *confused*. Running self.repo.active_branch would
+                        # fail.
+                        or not self.repo.active_branch.name ==
+                        original_branch.name):
+                    print(colored(f'returning to {original_branch.name}',
+                                  'magenta'))
+                    original_branch.checkout()
+        finally:
+            self.states.extend(states[name] for name in names
+                               if name in states)
+
+            if state_cache is not None and classifier is not None:
+                state_cache.store(classifier.entries(names))
+
+            if graph is not None:
+                graph.close()
+
+    def status(self):
+        """
+        Print what rebase_all_branches would do without doing it: nothing is
+        stashed, checked out or written, and all branches are classified in
+        one go. Branches tracking a local branch are compared with that
+        branch as it is now, not as it would be after updating it.
+
+        :returns: (branch name, state) pairs, with the states recorded in
+                  `self.states` by rebase_all_branches
+        """
+        col_width = max(len(b.name) for b in self.branches) + 1
+        current_branch = self._current_branch()
+
+        graph = self._commit_graph()
+        state_cache = self._state_cache()
+        try:
+            classifier = self._classify_all(graph, state_cache)
+
+            planned = []
             for branch in self.branches:
                 target = self.target_map[branch.name]
+                target_sha = self.refs.sha(self._target_refname(target))
+                branch_sha = self.refs.sha(branch.path)
 
-                # Print branch name
-                if branch.name == original_branch.name:
-                    attrs = ['bold']
-                else:
-                    attrs = []
+                state = self._branch_state(branch, branch_sha, target_sha,
+                                           classifier)
+                planned.append((branch.name, state))
+
+                attrs = ['bold'] if branch.name == current_branch else []
                 print(colored(branch.name.ljust(col_width), attrs=attrs),
-                        end=' ')
+                      end=' ')
 
-                # Check, if target branch exists
-                try:
-                    if target.name.startswith('./'):
-                        # Check, if local branch exists
-                        self.git.rev_parse(target.name[2:])
-                    else:
-                        # Check, if remote branch exists
-                        _ = target.commit
-
-                except (ValueError, GitError):
-                    # Remote branch doesn't exist!
-                    print(colored('error: remote branch doesn\'t exist', 'red'))
-                    self.states.append('remote branch doesn\'t exist')
-
-                    continue
-
-                # Skip branches whose worktree has an in-progress operation
-                if branch.name in self.in_progress_branches:
-                    print(colored('operation in progress', 'yellow'))
-                    self.states.append('operation in progress')
-                    continue
-
-                # Get tracking branch
-                if target.is_local:
-                    target = find(self.repo.branches,
-                                  lambda b: b.name == target.name[2:])
-
-                # Check status and act appropriately
-                if target.commit.hexsha == branch.commit.hexsha:
-                    print(colored('up to date', 'green'))
-                    self.states.append('up to date')
-
-                    continue  # Do not do anything
-
-                base = self.git.merge_base(branch.name, target.name)
-
-                if base == target.commit.hexsha:
-                    print(colored('ahead of upstream', 'cyan'))
-                    self.states.append('ahead')
-
-                    continue  # Do not do anything
-
-                fast_fastforward = False
-                if base == branch.commit.hexsha:
-                    print(colored('fast-forwarding...', 'yellow'), end='')
-                    self.states.append('fast-forwarding')
-                    # Don't fast fast-forward the currently checked-out branch
-                    fast_fastforward = (branch.name !=
-                                        self.repo.active_branch.name)
-
-                elif not self.settings['rebase.auto']:
-                    print(colored('diverged', 'red'))
-                    self.states.append('diverged')
-
-                    continue  # Do not do anything
+                if state in STATE_MESSAGES:
+                    print(colored(*STATE_MESSAGES[state]))
                 else:
-                    print(colored('rebasing', 'yellow'), end='')
-                    self.states.append('rebasing')
+                    print(colored(PLANNED_MESSAGES[state], 'yellow') +
+                          self._hashes(state, branch_sha, target_sha,
+                                       classifier))
+        finally:
+            if graph is not None:
+                graph.close()
 
-                if self.settings['rebase.show-hashes']:
-                    print(' {}..{}'.format(base[0:7],
-                                           target.commit.hexsha[0:7]))
-                else:
-                    print()
+        if state_cache is not None:
+            state_cache.store(classifier.entries(name for name, _ in planned))
 
-                self.log(branch, target)
-                worktree_path = self.worktree_map.get(branch.name)
-                if worktree_path:
-                    self._rebase_in_worktree(
-                        branch, target, worktree_path, fast_fastforward
-                    )
-                elif fast_fastforward:
-                    branch.commit = target.commit
-                else:
-                    stasher()
-                    self.git.checkout(branch.name)
-                    self.git.rebase(target)
+        self.states.extend(state for _, state in planned)
+
+        return planned
 
-            if (self.repo.head.is_detached  # Only on Travis CI,
-                    # we get a detached head after doing our rebase *confused*.
-                    # Running self.repo.active_branch would fail.
-                    or not self.repo.active_branch.name == original_branch.name):
-                print(colored(f'returning to {original_branch.name}',
-                              'magenta'))
-                original_branch.checkout()
+    def _commit_graph(self):
+        """ Return the commit-graph, if it's enabled. """
+        if self.settings['rebase.commit-graph']:
+            return CommitGraph.open(self.location.common_dir)
 
-    def _build_worktree_map(self):
+        return None
+
+    def _state_cache(self):
+        """ Return the cache of branch states, if it's enabled. """
+        if not self.settings['cache.state']:
+            return None
+
+        return StateCache.open(self.location.common_dir,
+                               self._cache_file('state'), self.refs.replaced)
+
+    def _classify_all(self, graph, state_cache=None):
+        """
+        Classify all branches at once instead of one by one, reusing the
+        cached states of branches that haven't moved.
         """
-        Build a map of branch names to worktree paths.
+        classifier = BranchClassifier(self.git, self.git.capabilities, graph)
+        if state_cache is not None:
+            classifier.restore(state_cache.load())
+
+        pairs = {}
+        for branch in self.branches:
+            target_sha = self.refs.sha(
+                self._target_refname(self.target_map[branch.name])
+            )
+            if target_sha is not None:
+                pairs[branch.name] = (self.refs.sha(branch.path), target_sha)
+        classifier.classify(pairs)
 
-        This allows us to detect branches that are checked out in
-        separate worktrees, so we can rebase them in-place instead of
-        failing on checkout.
+        return classifier
+
+    def _branch_state(self, branch, branch_sha, target_sha, classifier):
         """
-        worktree_map = {}
-        in_progress_branches = set()
-        try:
-            output = self.git.worktree('list', '--porcelain')
-        except GitError:
-            return worktree_map, in_progress_branches
-
-        # The branch checked out in the current worktree is handled via the
-        # regular checkout path. Exclude it by name instead of comparing
-        # paths: a branch can only be checked out in one worktree, and the
-        # paths reported by git may not be resolvable by Python (MSYS2 git
-        # reports POSIX-style paths).
-        active_branch = None
-        if not self.repo.head.is_detached:
-            active_branch = self.repo.active_branch.name
-
-        current_path = None
-        for line in output.split('\n'):
-            line = line.rstrip('\r')
-            if line.startswith('worktree '):
-                current_path = self._normalize_git_path(
-                    line[len('worktree '):]
-                )
-            elif line.startswith('branch refs/heads/'):
-                branch_name = line[len('branch refs/heads/'):]
-                if current_path and branch_name != active_branch:
-                    worktree_map[branch_name] = current_path
-                    if self._worktree_has_in_progress_op(current_path):
-                        in_progress_branches.add(branch_name)
-            elif line == 'detached' and current_path:
-                branch_name = self._get_rebase_branch(current_path)
-                if branch_name and branch_name != active_branch:
-                    worktree_map[branch_name] = current_path
-                    in_progress_branches.add(branch_name)
-
-        return worktree_map, in_progress_branches
+        Return what updating a branch does: 'fast-forwarding', 'rebasing'
+        or one of the states in STATE_MESSAGES if it's left alone.
+        """
+        if target_sha is None:
+            return 'remote branch doesn\'t exist'
 
-    @staticmethod
-    def _normalize_git_path(path):
+        state = classifier.state(branch.name, branch_sha, target_sha)
+
+        if state == UP_TO_DATE:
+            return 'up to date'
+
+        if state == AHEAD:
+            return 'ahead'
+
+        if state != BEHIND and not self.settings['rebase.auto']:
+            return 'diverged'
+
+        # Skip branches whose worktree has an in-progress operation
+        worktree = self.worktrees.get(branch.name)
+        if worktree and worktree.in_progress:
+            return 'operation in progress'
+
+        return 'fast-forwarding' if state == BEHIND else 'rebasing'
+
+    def _hashes(self, state, branch_sha, target_sha, classifier):
+        """ Return the range of commits an update applies, if enabled. """
+        if not self.settings['rebase.show-hashes']:
+            return ''
+
+        if state == 'fast-forwarding':
+            base = branch_sha
+        else:
+            base = classifier.merge_base(branch_sha, target_sha)
+
+        if base is None:
+            return ' (no merge base)..{}'.format(target_sha[0:7])
+
+        return ' {}..{}'.format(base[0:7], target_sha[0:7])
+
+    def _fast_forward_all(self, fast_forwards):
         """
-        Convert a POSIX-style path reported by MSYS2 git into a path
-        usable by a native Windows Python.
+        Move fast-forwarded branches with one `git update-ref --stdin`
+        transaction per target branch. If any branch of a transaction has
+        been changed in the meantime, none of them is updated.
+
+        :param fast_forwards: (refname, new SHA, old SHA, target name) tuples
         """
-        if ON_WINDOWS and path.startswith('/'):
-            try:
-                path = subprocess.check_output(
-                    ['cygpath', '-m', path], text=True
-                ).strip()
-            except (OSError, subprocess.CalledProcessError):
-                pass
-        return path
-
-    def _get_worktree_meta_dir(self, worktree_path):
-        """Return the git metadata directory for a worktree."""
-        git_file = os.path.join(worktree_path, '.git')
-        if not os.path.isfile(git_file):
+        # A transaction has a single reflog message, which names the target
+        # like 'git merge --ff-only'
+        by_target = {}
+        for refname, new_sha, old_sha, target in fast_forwards:
+            by_target.setdefault(target, []).append(
+                (refname, new_sha, old_sha)
+            )
+
+        for target, updates in by_target.items():
+            self.git.update_refs(updates, f'merge {target}: Fast-forward')
+
+        del fast_forwards[:]
+
+    def _scratch_pool(self):
+        """
+        Return the pool of scratch worktrees, None if it's disabled. Scratch
+        worktrees left from when it was enabled are removed.
+        """
+        size = self._int_setting('worktrees.scratch')
+        root = self._cache_file('scratch')
+
+        if not size and not os.path.isdir(root):
             return None
-        with open(git_file, 'r') as f:
-            content = f.read().strip()
-        if not content.startswith('gitdir: '):
+
+        pool = ScratchPool(self.git, root, size)
+        if not size:
+            pool.evict()
             return None
-        meta_dir = self._normalize_git_path(content[len('gitdir: '):])
-        if not os.path.isabs(meta_dir):
-            meta_dir = os.path.join(worktree_path, meta_dir)
-        return os.path.realpath(meta_dir)
-
-    def _worktree_has_in_progress_op(self, worktree_path):
-        """Return True if the worktree has a cherry-pick, merge, or bisect in progress."""
-        meta_dir = self._get_worktree_meta_dir(worktree_path)
-        if not meta_dir:
-            return False
-        for marker in ('CHERRY_PICK_HEAD', 'MERGE_HEAD', 'BISECT_LOG'):
-            if os.path.isfile(os.path.join(meta_dir, marker)):
-                return True
-        return False
-
-    def _get_rebase_branch(self, worktree_path):
-        """Return the branch name if a rebase is in progress in the worktree."""
-        meta_dir = self._get_worktree_meta_dir(worktree_path)
-        if not meta_dir:
+
+        return pool
+
+    def _rebase_in_scratch(self, branch, target, scratch, fast_forwards):
+        """
+        Rebase a branch in a scratch worktree. Returns False if the branch
+        has to be rebased in the main working tree (e.g. on conflicts).
+        """
+        self._fast_forward_all(fast_forwards)
+
+        try:
+            with scratch.worktree(branch.name, target.name) as worktree:
+                self._rebase_in_worktree(branch, target, worktree.path,
+                                         False, worktree.environment)
+        except GitError:
+            return False  # The rebase has been aborted
+
+        return True
+
+    def _current_branch(self):
+        """ Return the name of the checked out branch, None if detached. """
+        if self.refs.head is None:
+            # Not known from the ref snapshot
+            if self.repo.head.is_detached:
+                return None
+            return self.repo.active_branch.name
+
+        if not self.refs.head.startswith('refs/heads/'):
             return None
-        for subdir in ('rebase-merge', 'rebase-apply'):
-            head_name_file = os.path.join(meta_dir, subdir, 'head-name')
-            if os.path.isfile(head_name_file):
-                with open(head_name_file, 'r') as f:
-                    ref = f.read().strip()
-                if ref.startswith('refs/heads/'):
-                    return ref[len('refs/heads/'):]
-        return None
+
+        return self.refs.head[len('refs/heads/'):]
+
+    def _int_setting(self, key):
+        """ Return a numeric setting, 0 if it's unset or invalid. """
+        try:
+            return max(int(self.settings[key] or 0), 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def _cache_file(self, name):
+        """ Return the path of one of git-up's per-repository caches. """
+        return os.path.join(self.location.common_dir, 'git-up', name)
+
+    @staticmethod
+    def _target_refname(target):
+        """ Return the full name of the ref a target branch points to. """
+        if target.is_local:
+            return 'refs/heads/' + target.name[2:]
+
+        return target.path
 
     def _rebase_in_worktree(self, branch, target, worktree_path,
-                            fast_forward):
+                            fast_forward, environment=None):
         """
         Rebase or fast-forward a branch checked out in a worktree.
 
@@ -456,35 +806,44 @@ class GitUp:
         directly in the worktree directory where the branch is already
         checked out.
         """
-        worktree_repo = Repo(worktree_path, odbt=GitCmdObjectDB)
-        worktree_git = GitWrapper(worktree_repo)
-
-        if fast_forward:
-            worktree_git._run('merge', '--ff-only', target.name)
-        else:
-            with worktree_git.stasher() as stash:
-                stash()
-                try:
-                    worktree_git.rebase(target)
-                except RebaseError:
-                    stash.suppress_pop = True
-                    raise
+        with self.repos.using(worktree_path, environment) as worktree_git:
+            if fast_forward:
+                worktree_git._run('merge', '--ff-only', target.name)
+            else:
+                with worktree_git.stasher() as stash:
+                    stash()
+                    try:
+                        worktree_git.rebase(target)
+                    except RebaseError:
+                        stash.suppress_pop = True
+                        raise
 
     def fetch(self):
         """
         Fetch the recent refs from the remotes.
 
         Unless git-up.fetch.all is set to true, all remotes with
-        locally existent branches will be fetched.
+        locally existent branches will be fetched. With git-up.fetch.jobs,
+        several remotes are fetched at the same time. With
+        git-up.fetch.narrow, only the branches tracked by local branches are
+        fetched. With git-up.fetch.skip-unchanged, remotes whose tracked
+        branches haven't moved aren't fetched at all.
         """
         fetch_kwargs = {'multiple': True}
         fetch_args = []
+        jobs = self._int_setting('fetch.jobs')
+        remotes = self.remotes
+        refspecs = {}
 
         if self.is_prune():
             fetch_kwargs['prune'] = True
 
         if self.settings['fetch.all']:
             fetch_kwargs['all'] = True
+
+            # Let git fetch all remotes in parallel itself
+            if jobs > 1 and self.git.capabilities.fetch_jobs:
+                fetch_kwargs['jobs'] = jobs
         else:
             if '.' in self.remotes:
                 self.remotes.remove('.')
@@ -494,17 +853,214 @@ class GitUp:
                     # `git fetch --multiple` will fail
                     return
 
-            fetch_args.append(self.remotes)
+            narrow = self.settings['fetch.narrow']
+            skip_unchanged = self.settings['fetch.skip-unchanged']
+
+            if narrow or skip_unchanged:
+                tracked = self._tracked_refs()
+                listed = self.git.ls_remotes(
+                    {remote: sorted(refs)
+                     for remote, refs in tracked.items()},
+                    jobs, env=config_environment('protocol.version=2')
+                )
+
+            if skip_unchanged:
+                remotes = self._changed_remotes(tracked, listed)
+                if not remotes:
+                    self._record_fetch()
+                    return  # Nothing new
+
+            if narrow:
+                refspecs, deleted = self._narrow_refspecs(listed)
+                if deleted and self.is_prune():
+                    self._prune(deleted)
+
+                remotes = [remote for remote in remotes
+                           if refspecs.get(remote)]
+                if not remotes:
+                    self.refs.reload()
+                    self._record_fetch()
+                    return  # All tracked branches have been deleted
+
+                # Protocol v2 lets git ask the remote for these refs only,
+                # instead of having it advertise all of them
+                fetch_kwargs['env'] = \
+                    config_environment('protocol.version=2')
+
+            fetch_args.append(remotes)
 
         if self.settings['fetch.progress'] and not self.quiet:
             fetch_kwargs['stderr_output_stream'] = self.stderr
 
+        if jobs > 1 and not self.settings['fetch.all'] and \
+                len(remotes) > 1:
+            del fetch_kwargs['multiple']
+            errors = self.git.fetch_parallel(remotes, jobs,
+                                             refspecs=refspecs,
+                                             **fetch_kwargs)
+
+            # Remote-tracking branches of the other remotes have moved
+            self.refs.reload()
+            self._record_fetch(errors)
+
+            if errors:
+                raise self._fetch_error(errors)
+
+            return
+
         try:
-            self.git.fetch(*fetch_args, **fetch_kwargs)
+            if refspecs:
+                # Refspecs can't be passed to `git fetch --multiple`
+                del fetch_kwargs['multiple']
+                for remote in remotes:
+                    self.git.fetch(remote, refspecs[remote], **fetch_kwargs)
+            else:
+                self.git.fetch(*fetch_args, **fetch_kwargs)
         except GitError as error:
             error.message = "`git fetch` failed"
             raise error
 
+        # Remote-tracking branches have moved
+        self.refs.reload()
+        self._record_fetch()
+
+    def _max_age(self):
+        """
+        Return git-up.fetch.max-age in seconds, 0 if it's unset and None if
+        it's invalid.
+        """
+        return parse_duration(self.settings['fetch.max-age'] or 0)
+
+    def _fetched_recently(self):
+        """ Have all remotes been fetched within git-up.fetch.max-age? """
+        max_age = self._max_age()
+        if max_age is None:
+            print(colored(
+                "Warning: git-up.fetch.max-age is set to '{}', which isn't "
+                "a duration like 90s, 5m, 1h or 1d. Fetching anyway."
+                .format(self.settings['fetch.max-age']),
+                'yellow'
+            ), file=self.stderr)
+            return False
+
+        if not max_age:
+            return False
+
+        return FetchTimes(self._cache_file('fetched')).is_fresh(
+            [remote for remote in self.remotes if remote != '.'], max_age
+        )
+
+    def _record_fetch(self, errors=()):
+        """ Note the time the remotes have been fetched at. """
+        if not self._max_age():
+            return
+
+        FetchTimes(self._cache_file('fetched')).record(
+            [remote for remote in self.remotes
+             if remote != '.' and remote not in errors]
+        )
+
+    def _narrow_refspecs(self, listed):
+        """
+        Return refspecs fetching just the branches local branches track,
+        each into its remote-tracking branch.
+
+        A plain refspec fetches nothing but the branch it names, but makes
+        the fetch fail if the branch doesn't exist. Branches the remotes
+        haven't listed are left out (unless a remote couldn't be asked),
+        their remote-tracking branches are returned for pruning instead.
+
+        :param listed: the refs of the remotes, see `GitWrapper.ls_remotes`
+        :returns: remote name -> refspecs, deleted remote-tracking branches
+        :rtype: (dict[str, list[str]], list[str])
+        """
+        refspecs = {}
+        deleted = []
+
+        for name, (upstream, remote) in sorted(self.refs.upstreams.items()):
+            if remote not in listed:
+                continue  # Local or not fetched
+
+            merge = self._merge_ref(name)
+            if listed[remote] is None or merge in listed[remote]:
+                refspecs.setdefault(remote, []).append(f'+{merge}:{upstream}')
+            else:
+                deleted.append(upstream)
+
+        return ({remote: uniq(specs) for remote, specs in refspecs.items()},
+                uniq(deleted))
+
+    def _prune(self, refnames):
+        """ Delete remote-tracking branches, like `git fetch --prune`. """
+        updates = []
+        for refname in refnames:
+            sha = self.refs.sha(refname)
+            if sha is not None:
+                updates.append((refname, None, sha))
+
+        self.git.update_refs(updates, 'fetch: prune')
+
+    def _tracked_refs(self):
+        """
+        Return the branches on the remotes that local branches track.
+
+        :returns: remote -> branch on the remote -> SHA of its
+                  remote-tracking branch (None: not fetched yet)
+        :rtype: dict[str, dict[str, str | None]]
+        """
+        tracked = {}
+        for name, (upstream, remote) in self.refs.upstreams.items():
+            if remote in self.remotes:
+                tracked.setdefault(remote, {})[self._merge_ref(name)] = \
+                    self.refs.sha(upstream)
+
+        return tracked
+
+    def _changed_remotes(self, tracked, listed):
+        """
+        Return the remotes whose branches tracked by local branches have
+        moved (or have been deleted) since they were fetched. Remotes that
+        couldn't be asked are returned, too: fetching them reports the
+        error.
+
+        :param tracked: see `_tracked_refs`
+        :param listed: the refs of the remotes, see `GitWrapper.ls_remotes`
+        """
+        return [remote for remote in self.remotes
+                if listed.get(remote) is None or
+                any(listed[remote].get(ref) != sha
+                    for ref, sha in tracked[remote].items())]
+
+    def _merge_ref(self, branch_name):
+        """ Return the full name of the remote branch a branch tracks. """
+        merge = self.git.config_snapshot.get(f'branch.{branch_name}.merge')
+        if not merge.startswith('refs/'):
+            merge = 'refs/heads/' + merge
+
+        return merge
+
+    @staticmethod
+    def _fetch_error(errors):
+        """
+        Combine the errors of remotes fetched in parallel, git's output
+        prefixed with the remote's name.
+
+        :type errors: dict[str, GitError]
+        """
+        def prefixed(remote, output):
+            return ''.join(f'{remote}: {line}\n'
+                           for line in (output or '').splitlines())
+
+        return GitError(
+            "`git fetch` failed for {}".format(', '.join(errors)),
+            stderr=''.join(prefixed(remote, error.stderr)
+                           for remote, error in errors.items()).rstrip(),
+            stdout=''.join(prefixed(remote, error.stdout)
+                           for remote, error in errors.items()).rstrip(),
+            stderr_already_output=all(error.stderr_already_output
+                                      for error in errors.values())
+        )
+
     def push(self):
         """
         Push the changes back to the remote(s) after fetching
@@ -542,6 +1098,8 @@ class GitUp:
 
         if log_hook:
             if ON_WINDOWS:  # pragma: no cover
+                from tempfile import NamedTemporaryFile
+
                 # Running a string in CMD from Python is not that easy on
                 # Windows. Running 'cmd /C log_hook' produces problems when
                 # using multiple statements or things like 'echo'. Therefore,
@@ -590,6 +1148,13 @@ class GitUp:
 
     def version_info(self):
         """ Tell, what version we're running at and if it's up to date. """
+        import codecs
+        import json
+        from importlib import metadata
+        from urllib.error import HTTPError, URLError
+        from urllib.request import urlopen
+
+        from packaging.version import InvalidVersion, Version
 
         # Retrive and show local version info
         try:
@@ -674,13 +1239,15 @@ class GitUp:
         Because of possible incompatibilities, this requires special
         treatment.
         """
-        required_version = "1.6.6"
         config_value = self.settings['fetch.prune']
 
-        if self.git.is_version_min(required_version):
+        if self.git.capabilities.prune:
             return config_value is not False
         else:  # pragma: no cover
             if config_value == 'true':
+                required_version = '.'.join(
+                    str(part) for part in GitCapabilities.FEATURES['prune']
+                )
                 print(colored(
                     "Warning: fetch.prune is set to 'true' but your git"
                     "version doesn't seem to support it ({} < {})."
@@ -735,6 +1302,7 @@ def run():  # pragma: no cover
     """
     A nicer `git pull`.
     """
+    import argparse
 
     parser = argparse.ArgumentParser(description="A nicer `git pull`.", epilog=EPILOG)
     parser.add_argument('-V', '--version', action='store_true',
@@ -746,23 +1314,38 @@ def run():  # pragma: no cover
     parser.add_argument('-p', '--push', action='store_true',
                         help='Push the changes after pulling successfully.')
 
+    def duration(value):
+        """ Parse a duration argument into seconds. """
+        seconds = parse_duration(value)
+        if seconds is None:
+            raise ValueError(value)  # Reported by argparse
+
+        return seconds
+
+    parser.add_argument('--max-age', metavar='DURATION', type=duration,
+                        help='Don\'t fetch if all remotes have been fetched '
+                             'within DURATION (e.g. 90s, 5m, 1h).')
+    parser.add_argument('--status', action='store_true',
+                        help='Show what would be updated without changing '
+                             'anything.')
+
     args = parser.parse_args()
 
     if args.version:
-        if NO_DISTRIBUTE:
-            print(colored('Please install \'git-up\' via pip in order to '
-                          'get version information.', 'yellow'))
-        else:
-            GitUp(sparse=True).version_info()
+        GitUp(sparse=True).version_info()
         return
 
     if args.quiet:
+        from io import StringIO
         sys.stdout = StringIO()
 
     try:
         gitup = GitUp(quiet=args.quiet)
         gitup.settings['push.auto'] = args.push
         gitup.should_fetch = args.fetch
+        gitup.status_only = args.status
+        if args.max_age is not None:
+            gitup.settings['fetch.max-age'] = args.max_age
     except GitError:
         sys.exit(1)  # Error in constructor
     else:
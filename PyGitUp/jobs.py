@@ -0,0 +1,245 @@
+"""
+Updating branches in linked worktrees concurrently.
+
+Linked worktrees are independent working directories with their own index,
+so rebasing branches in several of them at once is safe. Only the refs in the
+common git dir are shared: git is told to wait for ref locks instead of
+failing right away, and not to run automatic maintenance in between.
+
+While jobs are running, or branches are updated out of order (see
+PyGitUp.planner), everything printed is collected per branch and written in
+the order of the branches, so the output looks just like the one of a
+sequential run.
+"""
+
+__all__ = ['WorktreeJobs']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import io
+import sys
+import threading
+
+# PyGitUp libs
+from PyGitUp.utils import config_environment
+
+# Settings for git commands running concurrently
+JOB_CONFIG = (
+    # Wait up to 10s for ref locks held by other jobs
+    'core.filesRefLockTimeout=10000',
+    'core.packedRefsTimeout=10000',
+    # Don't repack while other jobs are writing
+    'maintenance.auto=false',
+    'gc.auto=0',
+)
+
+
+###############################################################################
+# WorktreeJobs
+###############################################################################
+
+class WorktreeJobs:
+    """
+    Runs worktree updates in a bounded thread pool, keeping the output in
+    order. With a single job, everything runs right away.
+    """
+
+    def __init__(self, jobs, branches=()):
+        """
+        :param jobs: the maximum number of concurrent jobs
+        :param branches: names of the branches in output order, if their
+                         output has to be collected even without jobs
+        """
+        #: Maximum number of concurrent jobs
+        self.jobs = max(jobs, 1)
+
+        #: Environment for git commands run by jobs
+        self.environment = config_environment(*JOB_CONFIG) \
+            if self.parallel else None
+
+        #: Collect the output per branch?
+        self.ordered = self.parallel or bool(branches)
+
+        #: Output and jobs of the branches that haven't been written yet
+        #: :type: list[_Entry]
+        self._entries = [_Entry(name) for name in branches]
+        self._current = None
+        #: refname -> future
+        self._pending = {}
+
+        #: The first error of a job (in branch order)
+        self._error = None
+
+        self._executor = None
+        self._output = None
+
+    @property
+    def parallel(self):
+        """ Do jobs run concurrently? """
+        return self.jobs > 1
+
+    def __enter__(self):
+        if self.ordered:
+            self._output = _ThreadOutput(sys.stdout)
+            sys.stdout = self._output
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.ordered:
+            return
+
+        try:
+            error = self.drain()
+        finally:
+            sys.stdout = self._output.stream
+
+            if self._executor is not None:
+                self._executor.shutdown()
+
+        if error is not None and exc_type is None:
+            raise error
+
+    def branch(self, name):
+        """ Start (or resume) collecting the output of a branch. """
+        if not self.ordered:
+            return
+
+        self._emit()
+
+        entry = self._entry(name)
+        if entry is None:
+            entry = _Entry(name)
+            self._entries.append(entry)
+
+        self._current = entry
+        self._output.attach(entry.output)
+
+    def finish(self, name):
+        """ Note that nothing but its job will print for a branch anymore. """
+        entry = self._entry(name)
+        if entry is not None:
+            entry.finished = True
+
+    def submit(self, refname, function, *args):
+        """ Update a branch, concurrently if enabled. """
+        if not self.parallel:
+            return function(*args)
+
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(self.jobs)
+
+        # The job's output follows what has been printed for its branch
+        entry = self._current
+
+        def job():
+            self._output.attach(entry.job_output)
+            try:
+                return function(*args)
+            finally:
+                self._output.attach(None)
+
+        entry.future = self._executor.submit(job)
+        self._pending[refname] = entry.future
+
+    def wait(self, refname):
+        """ Wait for the job updating a branch, if there is one. """
+        future = self._pending.pop(refname, None)
+        if future is not None:
+            future.exception()
+
+    def drain(self):
+        """
+        Wait for all jobs and write all output. Returns the first error (in
+        branch order), if any.
+        """
+        if not self.ordered:
+            return None
+
+        for entry in self._entries:
+            if entry.future is not None:
+                entry.future.exception()
+        self._pending.clear()
+
+        error = self._emit(final=True)
+        self._output.attach(None)
+
+        return error
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _entry(self, name):
+        """ Return the entry of a branch that hasn't been written yet. """
+        for entry in self._entries:
+            if entry.name == name:
+                return entry
+
+        return None
+
+    def _emit(self, final=False):
+        """
+        Write the output of the branches that are done, up to the first one
+        that isn't. Returns the first error.
+        """
+        while self._entries:
+            entry = self._entries[0]
+            if not final and not entry.finished:
+                break  # The branch is still being processed
+            if entry.future is not None and not entry.future.done():
+                break  # Its job is still running
+
+            self._output.stream.write(entry.output.getvalue())
+            self._output.stream.write(entry.job_output.getvalue())
+            self._output.stream.flush()
+
+            if entry.future is not None and self._error is None:
+                self._error = entry.future.exception()
+
+            self._entries.pop(0)
+
+        return self._error
+
+
+class _Entry:
+    """ The output and job of a branch. """
+
+    def __init__(self, name):
+        self.name = name
+        self.output = io.StringIO()
+        self.job_output = io.StringIO()
+        self.future = None
+        self.finished = False
+
+
+class _ThreadOutput:
+    """
+    Stands in for sys.stdout, sending everything each thread prints to the
+    buffer attached to it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def attach(self, buffer):
+        """ Collect the current thread's output in a buffer (or don't). """
+        self._local.buffer = buffer
+
+    def _target(self):
+        buffer = getattr(self._local, 'buffer', None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
@@ -0,0 +1,91 @@
+"""
+Ordering branch updates to avoid checkouts.
+
+Going through the branches alphabetically means bouncing the working tree
+between them: check out A, rebase, check out B, rebase, and finally check out
+the original branch again. `ExecutionPlan` hands out the branches so that
+everything that doesn't need the working tree (fast-forwards, worktrees,
+in-memory rebases) happens first. Rebases that need a checkout are deferred
+until nothing else can be done, with the original branch coming last, so
+the run ends up where it started without an extra checkout.
+
+Branches tracking another local branch are only updated once their target
+is done, so they see its new state.
+"""
+
+__all__ = ['ExecutionPlan']
+
+
+###############################################################################
+# ExecutionPlan
+###############################################################################
+
+class ExecutionPlan:
+    """
+    The order to update branches in.
+
+    Iterating yields `(branch name, deferred)` pairs: `deferred` is None for
+    branches to update, otherwise it's whatever has been passed to `defer`
+    for a branch that needs a checkout.
+    """
+
+    def __init__(self, branches, current=None, targets=None, enabled=True):
+        """
+        :param branches: names of the branches to update, in order
+        :param current: the name of the checked out branch
+        :param targets: branch name -> name of the local branch it tracks
+        :param enabled: if False, branches are handed out in order
+        """
+        self.current = current
+        self.targets = targets or {}
+        self.enabled = enabled
+
+        self._pending = list(branches)
+        self._deferred = []
+        self._unfinished = set(branches)
+
+    def __iter__(self):
+        while self._pending or self._deferred:
+            yield self._next()
+
+    def defer(self, branch, deferred):
+        """ Postpone the part of a branch's update that needs a checkout. """
+        if not self.enabled:
+            raise ValueError('Planning is disabled')
+
+        self._deferred.append((branch, deferred))
+
+    def finish(self, branch):
+        """ Note that a branch is up to date now. """
+        self._unfinished.discard(branch)
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _next(self):
+        """ Return the next step. """
+        for branch in self._pending:
+            if self._ready(branch):
+                self._pending.remove(branch)
+                return branch, None
+
+        if self._deferred:
+            # Checkouts, finishing on the current branch
+            others = [index for index, (branch, _) in enumerate(self._deferred)
+                      if branch != self.current]
+
+            return self._deferred.pop(others[0] if others else 0)
+
+        # Circular tracking: go on in order
+        return self._pending.pop(0), None
+
+    def _ready(self, branch):
+        """ Has the branch's target been updated already? """
+        if not self.enabled:
+            return True
+
+        target = self.targets.get(branch)
+
+        return target is None or target == branch or \
+            target not in self._unfinished
@@ -0,0 +1,222 @@
+"""
+A snapshot of the repository's branches and remote-tracking branches.
+
+Asking GitPython for a branch's tracking branch goes through its config
+reader and ref resolution for every single branch. With thousands of local
+branches this adds up to seconds before anything else happens. The snapshot
+reads the SHAs of all branches from the ref storage (see PyGitUp.refstore)
+and their upstreams from the config snapshot instead. If the refs can't be
+read directly, it falls back to a single `git for-each-ref` call.
+"""
+
+__all__ = ['RefSnapshot', 'history_rewritten']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import os
+
+# PyGitUp libs
+from PyGitUp.refstore import open_ref_store, RefStoreError
+
+HEADS_PREFIX = 'refs/heads/'
+REMOTES_PREFIX = 'refs/remotes/'
+REPLACE_PREFIX = 'refs/replace/'
+
+# Files in the common dir that change what a commit's history looks like
+HISTORY_MARKERS = ('shallow', os.path.join('info', 'grafts'))
+
+
+###############################################################################
+# RefSnapshot
+###############################################################################
+
+class RefSnapshot:
+    """
+    The SHAs of all local and remote-tracking branches plus the upstream
+    configuration of the local branches.
+
+    Refs that git-up moves itself have to be reported via `update` so the
+    snapshot stays in sync with the repository.
+    """
+
+    # Fields are NUL-separated so nothing in a ref name can break parsing
+    FORMAT = '%00'.join([
+        '%(refname)',
+        '%(objectname)',
+        '%(upstream)',
+        '%(upstream:remotename)',
+    ])
+
+    def __init__(self, git, git_dir=None):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        :param git_dir: the git dir of the worktree to read HEAD from
+                        (default: the repository's)
+        """
+        self.git = git
+        self.git_dir = git_dir
+
+        #: refname -> SHA (None: unknown, resolve on next access)
+        #: :type: dict[str, str | None]
+        self.shas = {}
+
+        #: local branch name -> (upstream refname, remote name)
+        #: :type: dict[str, (str, str)]
+        self.upstreams = {}
+
+        #: The branch HEAD points to ('' if detached, None if unknown)
+        #: :type: str | None
+        self.head = None
+
+        #: Are there replace refs?
+        self.replaced = False
+
+    @classmethod
+    def load(cls, git, git_dir=None):
+        """ Build a snapshot without running git, if possible. """
+        snapshot = cls(git, git_dir)
+        snapshot.reload()
+
+        return snapshot
+
+    def reload(self):
+        """ Read all refs again, e.g. after fetching. """
+        self._clear()
+
+        if self.git.repo is not None:
+            try:
+                self.read(self.git_dir or self.git.repo.git_dir,
+                          self.git.repo.common_dir)
+                return
+            except RefStoreError:
+                self._clear()
+
+        output = self.git.for_each_ref('--format=' + self.FORMAT,
+                                       'refs/heads', 'refs/remotes',
+                                       'refs/replace')
+        self.parse(output)
+
+    def read(self, git_dir, common_dir):
+        """ Read the refs from disk, the upstreams from the config. """
+        store = open_ref_store(git_dir, common_dir)
+        try:
+            shas = store.refs([HEADS_PREFIX, REMOTES_PREFIX, REPLACE_PREFIX])
+            head, _ = store.head()
+        finally:
+            store.close()
+
+        config = self.git.config_snapshot
+        for refname in sorted(shas):
+            if refname.startswith(REPLACE_PREFIX):
+                self.replaced = True
+                continue
+
+            self.shas[refname] = shas[refname]
+
+            if refname.startswith(HEADS_PREFIX):
+                name = refname[len(HEADS_PREFIX):]
+                upstream = config.upstream(name)
+                if upstream is not None:
+                    self._track(name, *upstream)
+
+        self.head = head or ''
+
+    def parse(self, output):
+        """ Parse the output of `git for-each-ref --format=FORMAT`. """
+        for line in output.splitlines():
+            fields = line.split('\0')
+            if len(fields) < 4:
+                continue
+
+            refname, sha, upstream, remote = fields[:4]
+            if refname.startswith(REPLACE_PREFIX):
+                self.replaced = True
+                continue
+
+            self.shas[refname] = sha
+
+            if refname.startswith(HEADS_PREFIX) and upstream:
+                self._track(refname[len(HEADS_PREFIX):], upstream, remote)
+
+    def sha(self, refname):
+        """
+        Return the SHA a ref points to, or None if it doesn't exist.
+
+        Refs that have been invalidated are resolved again through git.
+        """
+        if refname not in self.shas:
+            return None
+
+        sha = self.shas[refname]
+        if sha is None:
+            sha = self.git.commit_sha(refname)
+            if sha is None:
+                del self.shas[refname]
+                return None
+
+            self.shas[refname] = sha
+
+        return sha
+
+    def update(self, refname, sha=None):
+        """
+        Record that git-up moved a ref.
+
+        Without a SHA the ref is resolved again the next time it's needed.
+        """
+        self.shas[refname] = sha
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _clear(self):
+        self.shas.clear()
+        self.upstreams.clear()
+        self.head = None
+        self.replaced = False
+
+    def _track(self, name, upstream, remote):
+        """ Record a branch's upstream. """
+        if upstream.startswith(HEADS_PREFIX):
+            remote = '.'
+        elif upstream.startswith(REMOTES_PREFIX):
+            if not remote:
+                # '<remote>/<branch>' -> '<remote>'
+                remote = upstream[len(REMOTES_PREFIX):].split('/', 1)[0]
+        else:
+            return  # Upstream outside of the namespaces we know
+
+        self.upstreams[name] = (upstream, remote)
+
+
+###############################################################################
+# Helpers
+###############################################################################
+
+def history_rewritten(common_dir, replaced=None):
+    """
+    Does git see a different history than the one stored in the commits,
+    because of a shallow clone, grafts or replace refs? Anything reading
+    commits directly would disagree with git then.
+
+    :param replaced: are there replace refs? (None: look them up)
+    """
+    for marker in HISTORY_MARKERS:
+        if os.path.exists(os.path.join(common_dir, marker)):
+            return True
+
+    if replaced is None:
+        try:
+            store = open_ref_store(common_dir)
+            try:
+                replaced = bool(store.refs([REPLACE_PREFIX]))
+            finally:
+                store.close()
+        except RefStoreError:
+            replaced = True  # Can't tell
+
+    return replaced
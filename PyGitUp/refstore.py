@@ -0,0 +1,514 @@
+"""
+Reading refs straight from the repository's ref storage.
+
+Listing refs through git (or GitPython, which creates an object per ref)
+costs a process and, with many refs, seconds and lots of memory. The ref
+stores here read the refs git-up needs directly from disk:
+
+- `FilesRefStore` reads loose refs and a memory-mapped `packed-refs`, which
+  is sorted, so looking up a ref or a namespace is a binary search,
+- `ReftableRefStore` reads the tables of repositories using the reftable
+  format (`git init --ref-format=reftable`).
+
+Refs private to a worktree (like its `HEAD`) are read from the worktree's
+git dir, everything else from the common dir. Anything the stores don't
+understand raises `RefStoreError`, so the caller can ask git instead.
+"""
+
+__all__ = ['open_ref_store', 'FilesRefStore', 'ReftableRefStore',
+           'RefStoreError']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import mmap
+import os
+
+SYMREF_PREFIX = 'ref: '
+
+# Symbolic refs pointing to symbolic refs are followed this deep
+MAX_SYMREF_DEPTH = 5
+
+# Refs that every worktree has its own copy of
+WORKTREE_REFS = ('HEAD', 'refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+
+PACKED_REFS_HEADER = b'# pack-refs with:'
+
+REFTABLE_MAGIC = b'REFT'
+REFTABLE_BLOCK_REF = ord('r')
+# Header and footer sizes by format version
+REFTABLE_HEADER_SIZES = {1: 24, 2: 28}
+REFTABLE_FOOTER_SIZES = {1: 68, 2: 72}
+# Record value types
+REFTABLE_DELETION = 0
+REFTABLE_VALUE = 1
+REFTABLE_VALUE_PEELED = 2
+REFTABLE_SYMREF = 3
+
+
+class RefStoreError(Exception):
+    """ The refs can't be read without git. """
+
+
+def open_ref_store(git_dir, common_dir=None):
+    """
+    Return the ref store of a repository (or worktree).
+
+    :param git_dir: the (worktree's) git dir
+    :param common_dir: the common git dir, if it's a linked worktree
+    """
+    common_dir = common_dir or git_dir
+
+    if os.path.isdir(os.path.join(common_dir, 'reftable')):
+        return ReftableRefStore(git_dir, common_dir)
+
+    return FilesRefStore(git_dir, common_dir)
+
+
+###############################################################################
+# FilesRefStore
+###############################################################################
+
+class FilesRefStore:
+    """
+    Reads refs stored as loose files and in `packed-refs`.
+    """
+
+    def __init__(self, git_dir, common_dir=None):
+        self.git_dir = git_dir
+        self.common_dir = common_dir or git_dir
+
+        self._packed = _PackedRefs(os.path.join(self.common_dir,
+                                                'packed-refs'))
+
+    def refs(self, prefixes):
+        """
+        Return the SHAs of all refs starting with one of the prefixes (which
+        have to end with a slash), symbolic refs resolved.
+
+        :rtype: dict[str, str]
+        """
+        refs = {}
+
+        for prefix in prefixes:
+            refs.update(self._packed.refs(prefix))
+
+            for refname in self._loose_refs(prefix):
+                sha = self.resolve(refname)
+                if sha is None:
+                    refs.pop(refname, None)  # Dangling symbolic ref
+                else:
+                    refs[refname] = sha
+
+        return refs
+
+    def resolve(self, refname, depth=0):
+        """ Return the SHA a ref points to, or None if it doesn't exist. """
+        content = self._read_loose(refname)
+
+        if content is None:
+            return self._packed.get(refname)
+
+        if content.startswith(SYMREF_PREFIX):
+            if depth >= MAX_SYMREF_DEPTH:
+                return None
+            return self.resolve(content[len(SYMREF_PREFIX):], depth + 1)
+
+        return _check_sha(content, refname)
+
+    def head(self):
+        """
+        Return the ref the worktree's HEAD points to (None if it's detached)
+        and its SHA (None on unborn branches).
+        """
+        content = self._read_loose('HEAD')
+        if content is None:
+            raise RefStoreError('HEAD is missing')
+
+        if content.startswith(SYMREF_PREFIX):
+            target = content[len(SYMREF_PREFIX):]
+            return target, self.resolve(target)
+
+        return None, _check_sha(content, 'HEAD')
+
+    def close(self):
+        """ Unmap `packed-refs`. """
+        self._packed.close()
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _ref_dir(self, refname):
+        """ Return the git dir a ref is stored in. """
+        if refname.startswith(WORKTREE_REFS):
+            return self.git_dir
+
+        return self.common_dir
+
+    def _read_loose(self, refname):
+        """ Return the content of a loose ref, None if there's none. """
+        path = os.path.join(self._ref_dir(refname), *refname.split('/'))
+
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+        except OSError as e:
+            raise RefStoreError(f'Failed to read {refname}: {e}')
+
+        return content.decode('utf-8', errors='replace').strip()
+
+    def _loose_refs(self, prefix):
+        """ Return the names of all loose refs starting with prefix. """
+        root = os.path.join(self._ref_dir(prefix), *prefix.split('/'))
+
+        refnames = []
+        for directory, _, files in os.walk(root):
+            relative = os.path.relpath(directory, root)
+            relative = '' if relative == os.curdir else \
+                relative.replace(os.sep, '/') + '/'
+
+            refnames.extend(prefix + relative + name for name in files
+                            if not name.endswith('.lock'))
+
+        return sorted(refnames)
+
+
+class _PackedRefs:
+    """ A memory-mapped `packed-refs` file. """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._data = None
+        self._start = 0
+        self._sorted = True
+        #: Unsorted files: refname -> SHA
+        self._refs = None
+
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._data = mmap.mmap(f.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            raise RefStoreError(f'Failed to read packed-refs: {e}')
+
+        if self._data is not None and \
+                self._data[:len(PACKED_REFS_HEADER)] == PACKED_REFS_HEADER:
+            end = self._line_end(0)
+            traits = self._data[len(PACKED_REFS_HEADER):end].split()
+
+            self._sorted = b'sorted' in traits
+            self._start = min(end + 1, len(self._data))
+        else:
+            self._sorted = False
+
+    def get(self, refname):
+        """ Return the SHA of a packed ref, None if it isn't packed. """
+        if self._data is None:
+            return None
+
+        if not self._sorted:
+            return self._all().get(refname)
+
+        key = refname.encode('utf-8')
+        position = self._search(key)
+
+        if position < len(self._data):
+            name, sha, _ = self._record(position)
+            if name == key:
+                return sha
+
+        return None
+
+    def refs(self, prefix):
+        """ Return the SHAs of all packed refs starting with prefix. """
+        if self._data is None:
+            return {}
+
+        if not self._sorted:
+            return {refname: sha for refname, sha in self._all().items()
+                    if refname.startswith(prefix)}
+
+        key = prefix.encode('utf-8')
+        position = self._search(key)
+
+        refs = {}
+        while position < len(self._data):
+            name, sha, position = self._record(position)
+            if not name.startswith(key):
+                break
+
+            refs[name.decode('utf-8')] = sha
+
+        return refs
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def _all(self):
+        """ Parse all refs of an unsorted file. """
+        if self._refs is None:
+            self._refs = {}
+
+            position = self._start
+            while position < len(self._data):
+                name, sha, position = self._record(position)
+                self._refs[name.decode('utf-8')] = sha
+
+        return self._refs
+
+    def _search(self, key):
+        """ Return the position of the first record whose name is >= key. """
+        low, high = self._start, len(self._data)
+
+        while low < high:
+            start = self._record_start((low + high) // 2, low)
+            name, _, end = self._record(start)
+
+            if name < key:
+                low = end
+            else:
+                high = start
+
+        return low
+
+    def _record_start(self, position, lower_bound):
+        """ Return the start of the record containing position. """
+        start = self._data.rfind(b'\n', lower_bound, position) + 1
+        start = max(start, lower_bound)
+
+        if self._data[start:start + 1] == b'^':
+            # A peeled tag belongs to the record before it
+            start = max(self._data.rfind(b'\n', lower_bound, start - 1) + 1,
+                        lower_bound)
+
+        return start
+
+    def _record(self, start):
+        """
+        Parse the record at start, returning the ref's name, its SHA and the
+        start of the next record.
+        """
+        end = self._line_end(start)
+        sha, _, name = self._data[start:end].partition(b' ')
+        if not name or sha.startswith((b'^', b'#')):
+            raise RefStoreError('Unexpected content in packed-refs')
+
+        # Skip the peeled value of a tag
+        end += 1
+        if self._data[end:end + 1] == b'^':
+            end = self._line_end(end) + 1
+
+        return name.rstrip(b'\r'), sha.decode('ascii'), min(end,
+                                                             len(self._data))
+
+    def _line_end(self, start):
+        end = self._data.find(b'\n', start)
+        return len(self._data) if end == -1 else end
+
+
+###############################################################################
+# ReftableRefStore
+###############################################################################
+
+class ReftableRefStore:
+    """
+    Reads refs stored in reftables.
+
+    Tables aren't searched but read completely: unlike `packed-refs`, a
+    stack of tables has to be merged (and deletions applied) anyway.
+    """
+
+    def __init__(self, git_dir, common_dir=None):
+        self.git_dir = git_dir
+        self.common_dir = common_dir or git_dir
+
+        self._refs = _read_stack(os.path.join(self.common_dir, 'reftable'))
+
+        # Linked worktrees keep their private refs in a stack of their own
+        if os.path.normcase(os.path.realpath(self.git_dir)) == \
+                os.path.normcase(os.path.realpath(self.common_dir)):
+            self._worktree_refs = self._refs
+        else:
+            self._worktree_refs = _read_stack(
+                os.path.join(self.git_dir, 'reftable')
+            )
+
+    def refs(self, prefixes):
+        """
+        Return the SHAs of all refs starting with one of the prefixes,
+        symbolic refs resolved.
+
+        :rtype: dict[str, str]
+        """
+        prefixes = tuple(prefixes)
+
+        refs = {}
+        for refname in sorted(self._refs):
+            if refname.startswith(prefixes):
+                sha = self.resolve(refname)
+                if sha is not None:
+                    refs[refname] = sha
+
+        return refs
+
+    def resolve(self, refname, depth=0):
+        """ Return the SHA a ref points to, or None if it doesn't exist. """
+        value = self._value(refname)
+
+        if value is not None and value.startswith(SYMREF_PREFIX):
+            if depth >= MAX_SYMREF_DEPTH:
+                return None
+            return self.resolve(value[len(SYMREF_PREFIX):], depth + 1)
+
+        return value
+
+    def head(self):
+        """
+        Return the ref the worktree's HEAD points to (None if it's detached)
+        and its SHA (None on unborn branches).
+        """
+        value = self._value('HEAD')
+        if value is None:
+            raise RefStoreError('HEAD is missing')
+
+        if value.startswith(SYMREF_PREFIX):
+            target = value[len(SYMREF_PREFIX):]
+            return target, self.resolve(target)
+
+        return None, value
+
+    def close(self):
+        """ The tables have been read completely, nothing to do. """
+
+    def _value(self, refname):
+        if refname.startswith(WORKTREE_REFS):
+            return self._worktree_refs.get(refname)
+
+        return self._refs.get(refname)
+
+
+def _read_stack(directory):
+    """
+    Read all refs of a stack of reftables, newer tables overriding older
+    ones. Symbolic refs are returned as 'ref: <target>'.
+    """
+    try:
+        with open(os.path.join(directory, 'tables.list'), 'r') as f:
+            tables = f.read().split()
+    except OSError as e:
+        raise RefStoreError(f'Failed to read the reftable stack: {e}')
+
+    refs = {}
+    for name in tables:
+        try:
+            with open(os.path.join(directory, name), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise RefStoreError(f'Failed to read reftable {name}: {e}')
+
+        try:
+            for refname, value in _read_table(data):
+                if value is None:
+                    refs.pop(refname, None)
+                else:
+                    refs[refname] = value
+        finally:
+            data.close()
+
+    return refs
+
+
+def _read_table(data):
+    """ Yield the names and values of the refs in a reftable. """
+    if data[:4] != REFTABLE_MAGIC or \
+            data[4] not in REFTABLE_HEADER_SIZES:
+        raise RefStoreError('Unsupported reftable format')
+
+    version = data[4]
+    header_size = REFTABLE_HEADER_SIZES[version]
+    hash_size = 20
+    if version == 2 and data[24:28] == b's256':
+        hash_size = 32
+
+    end = len(data) - REFTABLE_FOOTER_SIZES[version]
+
+    # Ref blocks come first. The first one includes the file header.
+    position = 0
+    block_type = header_size
+    while block_type < end and data[block_type] == REFTABLE_BLOCK_REF:
+        block_end = position + int.from_bytes(
+            data[block_type + 1:block_type + 4], 'big'
+        )
+        restarts = int.from_bytes(data[block_end - 2:block_end], 'big')
+
+        yield from _read_ref_block(data, block_type + 4,
+                                   block_end - 2 - 3 * restarts, hash_size)
+
+        # Skip the padding up to the next block
+        position = block_end
+        while position < end and data[position] == 0:
+            position += 1
+        block_type = position
+
+
+def _read_ref_block(data, position, end, hash_size):
+    """ Yield the names and values of the records in a ref block. """
+    name = b''
+
+    while position < end:
+        prefix_length, position = _varint(data, position)
+        suffix_type, position = _varint(data, position)
+        suffix_length, value_type = suffix_type >> 3, suffix_type & 0x7
+
+        name = name[:prefix_length] + data[position:position + suffix_length]
+        position += suffix_length
+
+        _, position = _varint(data, position)  # Update index delta
+
+        if value_type == REFTABLE_DELETION:
+            value = None
+        elif value_type in (REFTABLE_VALUE, REFTABLE_VALUE_PEELED):
+            value = data[position:position + hash_size].hex()
+            position += hash_size * value_type
+        elif value_type == REFTABLE_SYMREF:
+            length, position = _varint(data, position)
+            value = SYMREF_PREFIX + \
+                data[position:position + length].decode('utf-8')
+            position += length
+        else:
+            raise RefStoreError('Unsupported reftable record')
+
+        yield name.decode('utf-8'), value
+
+
+def _varint(data, position):
+    """ Decode one of git's variable-length integers. """
+    byte = data[position]
+    value = byte & 0x7f
+
+    while byte & 0x80:
+        position += 1
+        byte = data[position]
+        value = ((value + 1) << 7) | (byte & 0x7f)
+
+    return value, position + 1
+
+
+def _check_sha(content, refname):
+    """ Make sure a loose ref contains a SHA. """
+    if len(content) not in (40, 64) or \
+            content.strip('0123456789abcdef'):
+        raise RefStoreError(f'Unexpected content in {refname}')
+
+    return content
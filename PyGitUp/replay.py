@@ -0,0 +1,183 @@
+"""
+Rebasing branches without checking them out.
+
+Rebasing a branch other than the current one used to mean stashing, checking
+it out, rebasing and checking out the original branch again: two full
+rewrites of the working tree. `InMemoryRebase` replays a branch's commits
+onto its target with `git merge-tree --write-tree` and `git commit-tree`
+instead, which only write objects to the object database. The branch is
+moved once all commits have been replayed.
+
+Like `git rebase`, merge commits and commits that are already part of the
+target are dropped, and so are commits that become empty. If a commit
+doesn't apply cleanly, nothing is changed and the caller has to fall back to
+a regular rebase.
+"""
+
+__all__ = ['InMemoryRebase']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# PyGitUp libs
+from PyGitUp.git_wrapper import GitError
+
+# Fields of a commit as read by `git log`
+LOG_FORMAT = '%H%x00%P%x00%T%x00%an%x00%ae%x00%ad%x00%B'
+LOG_FIELDS = 7
+
+
+###############################################################################
+# InMemoryRebase
+###############################################################################
+
+class InMemoryRebase:
+    """
+    Replays commits onto a new base without touching the working tree.
+    """
+
+    def __init__(self, git, capabilities):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        :type capabilities: PyGitUp.capabilities.GitCapabilities
+        """
+        self.git = git
+        self.capabilities = capabilities
+
+        self._supported = None
+
+    @property
+    def supported(self):
+        """ Can the installed git replay commits in memory? """
+        if self._supported is None:
+            # commit-tree doesn't sign commits like git rebase would
+            sign = self.git.config('commit.gpgSign') or ''
+            self._supported = self.capabilities.merge_tree and \
+                sign.lower() != 'true'
+
+        return self._supported
+
+    def rebase(self, branch_sha, target_sha):
+        """
+        Replay the commits of a branch onto its target.
+
+        Returns the SHA of the rebased branch or None, if it has to be
+        rebased the regular way (e.g. because of a conflict).
+        """
+        if not self.supported:
+            return None
+
+        try:
+            commits = self._commits(branch_sha, target_sha)
+            if commits is None:
+                return None  # Root commits can't be replayed
+
+            trees = self._parent_trees(commits)
+
+            head = target_sha
+            head_tree, = self.git.tree_shas(target_sha)
+
+            for commit in commits:
+                tree = self._merge(head, head_tree, commit)
+                if tree is None:
+                    return None  # Conflict
+
+                started_empty = commit['tree'] == trees[commit['parent']]
+                if tree == head_tree and not started_empty:
+                    continue  # Became empty, drop it like git rebase
+
+                head = self._commit(tree, head, commit)
+                head_tree = tree
+        except GitError:
+            return None
+
+        return head
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _commits(self, branch_sha, target_sha):
+        """
+        Return the commits to replay, oldest first: the branch's commits
+        without merges and without changes already on the target. Returns
+        None if one of them is a root commit (e.g. if the branch doesn't
+        share any history with the target).
+        """
+        output = self.git.log(
+            '--reverse', '--cherry-pick', '--right-only', '--no-merges',
+            '--date=raw', '-z', '--format=' + LOG_FORMAT,
+            f'{target_sha}...{branch_sha}'
+        )
+
+        fields = output.split('\0')
+        commits = []
+        for index in range(0, len(fields) - LOG_FIELDS + 1, LOG_FIELDS):
+            sha, parents, tree, name, email, date, message = \
+                fields[index:index + LOG_FIELDS]
+
+            if not parents:
+                return None
+
+            # The output's final newline has been stripped
+            if not message.endswith('\n'):
+                message += '\n'
+
+            commits.append({
+                'sha': sha,
+                'parent': parents.split()[0],
+                'tree': tree,
+                'author': (name, email, date),
+                'message': message,
+            })
+
+        return commits
+
+    def _parent_trees(self, commits):
+        """ Map the parents of the commits to their trees. """
+        trees = {commit['sha']: commit['tree'] for commit in commits}
+
+        missing = [commit['parent'] for commit in commits
+                   if commit['parent'] not in trees]
+        if missing:
+            trees.update(zip(missing, self.git.tree_shas(*missing)))
+
+        return trees
+
+    def _merge(self, head, head_tree, commit):
+        """
+        Apply a commit's changes to the new head, returning the resulting
+        tree or None on conflicts.
+        """
+        parent = commit['parent']
+
+        if self.capabilities.merge_tree_base:
+            ours = head
+            arguments = ['--merge-base=' + parent]
+        else:
+            # Without --merge-base, merge-tree uses the merge base of both
+            # sides. A temporary commit with the new head's tree on top of
+            # the original parent makes that the original parent.
+            ours = self.git._run_input('commit_tree', b'git-up\n',
+                                       head_tree, '-p', parent)
+            arguments = []
+
+        try:
+            output = self.git.merge_tree('--write-tree', '--no-messages',
+                                         *arguments, ours, commit['sha'])
+        except GitError:
+            return None  # Conflict (exit status 1) or failure
+
+        return output.split()[0]
+
+    def _commit(self, tree, parent, commit):
+        """ Create the replayed commit, keeping the original author. """
+        name, email, date = commit['author']
+
+        return self.git._run_input(
+            'commit_tree', commit['message'].encode('utf-8'), tree,
+            '-p', parent,
+            env={'GIT_AUTHOR_NAME': name, 'GIT_AUTHOR_EMAIL': email,
+                 'GIT_AUTHOR_DATE': date}
+        )
@@ -0,0 +1,159 @@
+"""
+Repository handles shared for the duration of a run.
+
+Opening a repository with GitPython is cheap, but reading objects starts
+persistent `git cat-file` processes for every `Repo` instance. git-up opens
+the main repository and every linked worktree it updates. The pool opens each
+repository (identified by its git dir) once and lets all repositories with
+the same common dir, i.e. the same object database, share one object reader.
+Everything is torn down by `close()` at the end of the run instead of
+whenever the garbage collector gets to it.
+"""
+
+__all__ = ['RepoPool']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import io
+import os
+import threading
+from contextlib import contextmanager
+
+# 3rd party libs: GitPython is imported where it's used, see PyGitUp.gitup
+
+# PyGitUp libs
+from PyGitUp.git_wrapper import GitWrapper
+
+
+###############################################################################
+# RepoPool
+###############################################################################
+
+class RepoPool:
+    """
+    Opens repositories once per run and closes them all at the end.
+    """
+
+    def __init__(self):
+        #: git dir -> GitWrapper
+        #: :type: dict[str, GitWrapper]
+        self._handles = {}
+        #: common dir -> object database
+        self._odbs = {}
+
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        """
+        Return the wrapper for the repository (or worktree) at path.
+
+        :rtype: GitWrapper
+        """
+        key = _git_dir(path)
+
+        with self._lock:
+            git = self._handles.get(key)
+
+            if git is None:
+                from git import Repo
+
+                repo = Repo(path, odbt=_shared_object_db())
+
+                # Share the object reader with the other worktrees
+                common_dir = os.path.normcase(
+                    os.path.realpath(repo.common_dir)
+                )
+                repo.odb = self._odbs.setdefault(common_dir, repo.odb)
+
+                git = GitWrapper(repo)
+                self._handles[key] = git
+
+        return git
+
+    @contextmanager
+    def using(self, path, environment=None):
+        """
+        Open the repository at path, running its git commands with
+        additional environment variables until the block is left.
+
+        :rtype: GitWrapper
+        """
+        git = self.open(path)
+
+        with git.git.custom_environment(**(environment or {})):
+            yield git
+
+    def close(self):
+        """ Close all repositories, stopping their git processes. """
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._odbs.clear()
+
+        for git in handles:
+            git.close()
+
+
+def _git_dir(path):
+    """ Return the git dir of a working tree (or the path, if bare). """
+    dot_git = os.path.join(path, '.git')
+
+    if os.path.isfile(dot_git):
+        # A linked worktree or submodule
+        with open(dot_git, 'r') as f:
+            git_dir = f.read().strip()[len('gitdir: '):]
+        git_dir = os.path.join(path, git_dir)
+    elif os.path.isdir(dot_git):
+        git_dir = dot_git
+    else:
+        git_dir = path
+
+    return os.path.normcase(os.path.realpath(git_dir))
+
+
+_SharedObjectDB = None
+
+
+def _shared_object_db():
+    """
+    Return the object database class for pooled repositories: GitPython's
+    GitCmdObjectDB, made safe for use from several threads.
+    """
+    global _SharedObjectDB
+
+    if _SharedObjectDB is not None:
+        return _SharedObjectDB
+
+    from git import GitCmdObjectDB
+    from gitdb.base import OStream
+
+    class SharedObjectDB(GitCmdObjectDB):
+        """ Serializes access to the persistent cat-file processes. """
+
+        def __init__(self, root_path, git):
+            super().__init__(root_path, git)
+            self._lock = threading.RLock()
+
+        def info(self, binsha):
+            with self._lock:
+                return super().info(binsha)
+
+        def stream(self, binsha):
+            # Read the object completely while no one else uses the process
+            with self._lock:
+                stream = super().stream(binsha)
+                data = stream.read()
+
+            return OStream(stream.binsha, stream.type, stream.size,
+                           io.BytesIO(data))
+
+        def partial_to_complete_sha_hex(self, partial_hexsha):
+            with self._lock:
+                return super().partial_to_complete_sha_hex(partial_hexsha)
+
+    _SharedObjectDB = SharedObjectDB
+
+    return _SharedObjectDB
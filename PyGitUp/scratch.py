@@ -0,0 +1,277 @@
+"""
+A pool of linked worktrees for rebasing branches off the main checkout.
+
+Rebasing a branch that isn't checked out means checking it out first, which
+rewrites the user's working tree and index (and wakes up every file watcher
+looking at it). The pool keeps a few git-up-managed worktrees in
+`$GIT_COMMON_DIR/git-up/scratch` instead, where such branches are checked
+out and rebased.
+
+The worktrees are sparse: only the files in the repository's root are
+checked out, everything else is only materialized when a rebase needs it
+(e.g. on conflicts). Git-up doesn't change the repository's configuration
+for that, the sparse checkout is only enabled for git-up's own commands in
+these worktrees. They're kept across runs, so a checkout only has to update
+the files that differ between two branches, and the least recently used ones
+are removed once there are more than configured.
+
+A branch goes back to the worktree it has last been checked out in, which
+still has its files. Other branches get a new worktree while the pool isn't
+full, otherwise the least recently used free one.
+"""
+
+__all__ = ['ScratchPool', 'ScratchWorktree']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import os
+import shutil
+from contextlib import contextmanager
+
+# PyGitUp libs
+from PyGitUp.git_wrapper import GitError
+from PyGitUp.utils import config_environment
+from PyGitUp.worktrees import REBASE_DIRS
+
+# Only check out the files in the root directory
+SPARSE_PATTERNS = '/*\n!/*/\n'
+
+SLOT_PREFIX = 'slot-'
+
+# Remembers the branch last checked out in a worktree (in its admin dir)
+BRANCH_FILE = 'git-up-branch'
+
+
+###############################################################################
+# ScratchWorktree
+###############################################################################
+
+class ScratchWorktree:
+    """ One of the pool's worktrees. """
+
+    def __init__(self, path):
+        #: The worktree's directory
+        self.path = path
+
+        #: Environment for git commands running in the worktree
+        self.environment = config_environment('core.sparseCheckout=true')
+
+    @property
+    def admin_dir(self):
+        """ The worktree's admin directory in the common git dir. """
+        with open(os.path.join(self.path, '.git'), 'r') as f:
+            gitdir = f.read().strip()[len('gitdir: '):]
+
+        # Relative to the worktree with worktree.useRelativePaths
+        return os.path.normpath(os.path.join(self.path, gitdir))
+
+    @property
+    def rebase_in_progress(self):
+        """ Has a rebase been interrupted in the worktree? """
+        try:
+            admin_dir = self.admin_dir
+        except OSError:
+            return False
+
+        return any(os.path.isdir(os.path.join(admin_dir, rebase_dir))
+                   for rebase_dir in REBASE_DIRS)
+
+    @property
+    def branch(self):
+        """ The branch checked out last in the worktree, None if unknown. """
+        try:
+            with open(os.path.join(self.admin_dir, BRANCH_FILE), 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @branch.setter
+    def branch(self, name):
+        try:
+            with open(os.path.join(self.admin_dir, BRANCH_FILE), 'w') as f:
+                f.write(name + '\n')
+        except OSError:
+            pass  # Only means a fuller checkout next time
+
+    @property
+    def mtime(self):
+        """ When the worktree has been used last. """
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return 0
+
+    def git(self):
+        """ Return a git command runner for the worktree. """
+        from git import Git
+
+        git = Git(self.path)
+        git.update_environment(**self.environment)
+
+        return git
+
+    def touch(self):
+        """ Mark the worktree as used. """
+        os.utime(self.path)
+
+
+###############################################################################
+# ScratchPool
+###############################################################################
+
+class ScratchPool:
+    """
+    Manages git-up's scratch worktrees.
+    """
+
+    def __init__(self, git, root, size):
+        """
+        :type git: PyGitUp.git_wrapper.GitWrapper
+        :param root: the directory to keep the worktrees in
+        :param size: the maximum number of worktrees
+        """
+        self.git = git
+        self.root = root
+        self.size = size
+
+        self._recovered = False
+
+        #: Paths of the worktrees currently handed out
+        self._in_use = set()
+
+    def slots(self):
+        """ Return all scratch worktrees, most recently used first. """
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+
+        slots = [ScratchWorktree(os.path.join(self.root, name))
+                 for name in names if name.startswith(SLOT_PREFIX)]
+
+        return sorted(slots, key=lambda slot: slot.mtime, reverse=True)
+
+    @contextmanager
+    def worktree(self, branch_name, start_point):
+        """
+        Check out a branch in a scratch worktree.
+
+        The branch is released again afterwards, aborting any rebase that
+        has been left unfinished.
+
+        :rtype: ScratchWorktree
+        """
+        self.recover()
+
+        slot = self._acquire(branch_name, start_point)
+        self._in_use.add(slot.path)
+
+        try:
+            self._run(slot.git().checkout, branch_name)
+            slot.branch = branch_name
+
+            yield slot
+        finally:
+            try:
+                self._release(slot)
+            finally:
+                self._in_use.discard(slot.path)
+                self.evict()
+
+    def recover(self):
+        """
+        Release branches still checked out in scratch worktrees (e.g.
+        after git-up has been interrupted), so they can be checked out
+        elsewhere.
+        """
+        if self._recovered:
+            return
+
+        for slot in self.slots():
+            try:
+                self._release(slot)
+            except GitError:
+                self._remove(slot)
+
+        self._recovered = True
+
+    def evict(self):
+        """ Remove the least recently used worktrees beyond the pool size. """
+        for slot in self.slots()[max(self.size, 0):]:
+            if slot.path not in self._in_use:
+                self._remove(slot)
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    @staticmethod
+    def _run(command, *args):
+        """ Run a git command, raising GitError on failure. """
+        from git import GitCommandError
+
+        try:
+            return command(*args)
+        except GitCommandError as error:
+            raise GitError("'{}' returned exit status {}".format(
+                ' '.join(str(c) for c in error.command), error.status
+            ), stderr=error.stderr, stdout=error.stdout)
+
+    def _acquire(self, branch_name, start_point):
+        """ Pick a free worktree for a branch, creating one if needed. """
+        slots = self.slots()
+        free = [slot for slot in slots if slot.path not in self._in_use]
+
+        for slot in free:
+            if slot.branch == branch_name:
+                return slot
+
+        if free and len(slots) >= self.size:
+            return free[-1]
+
+        return self._create(start_point)
+
+    def _create(self, start_point):
+        """ Add a new sparse scratch worktree. """
+        index = 0
+        path = os.path.join(self.root, f'{SLOT_PREFIX}{index}')
+        while os.path.exists(path):
+            index += 1
+            path = os.path.join(self.root, f'{SLOT_PREFIX}{index}')
+
+        os.makedirs(self.root, exist_ok=True)
+        self.git.worktree('add', '--detach', '--no-checkout', path,
+                          start_point)
+
+        slot = ScratchWorktree(path)
+
+        info_dir = os.path.join(slot.admin_dir, 'info')
+        os.makedirs(info_dir, exist_ok=True)
+        with open(os.path.join(info_dir, 'sparse-checkout'), 'w') as f:
+            f.write(SPARSE_PATTERNS)
+
+        self._run(slot.git().read_tree, '-mu', 'HEAD')
+
+        return slot
+
+    def _release(self, slot):
+        """ Detach a worktree's HEAD, aborting unfinished rebases. """
+        git = slot.git()
+
+        if slot.rebase_in_progress:
+            self._run(git.rebase, '--abort')
+
+        self._run(git.checkout, '--detach')
+        slot.touch()
+
+    def _remove(self, slot):
+        """ Remove a scratch worktree. """
+        try:
+            self.git.worktree('remove', '--force', slot.path)
+        except GitError:
+            # Not a (valid) worktree anymore
+            shutil.rmtree(slot.path, ignore_errors=True)
+            self.git.worktree('prune')
@@ -0,0 +1,105 @@
+"""
+Branch states remembered across runs.
+
+Whether a branch is ahead of, behind or diverged from its target (and where
+the two have diverged) only depends on the two commits. The state cache
+stores the last seen (branch SHA, target SHA) pair of every branch together
+with its classification and merge base in `$GIT_COMMON_DIR/git-up/state`,
+so branches that haven't moved since the last run don't have to be compared
+again.
+
+Shallow clones, grafts and replace refs can change what a commit's history
+looks like, so the cache isn't used in repositories that have any of them.
+"""
+
+__all__ = ['StateCache']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# PyGitUp libs
+from PyGitUp.refs import history_rewritten
+from PyGitUp.utils import write_json
+
+
+###############################################################################
+# StateCache
+###############################################################################
+
+class StateCache:
+    """
+    The states of a repository's branches, stored in a file.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        #: Path of the cache file
+        self.path = path
+
+        #: The entries read by `load`
+        #: :type: dict[str, (str, str, str, str | None)]
+        self._loaded = {}
+
+    @classmethod
+    def open(cls, common_dir, path, replaced=False):
+        """
+        Return the cache of a repository, None if its history can be
+        rewritten by shallow boundaries, grafts or (maybe) replace refs.
+
+        :param replaced: does the repository have replace refs? (None: unknown)
+        """
+        if replaced is None or history_rewritten(common_dir, replaced):
+            return None
+
+        return cls(path)
+
+    def load(self):
+        """
+        Read the cached entries.
+
+        :returns: branch name -> (branch SHA, target SHA, state, merge base
+                  or None)
+        :rtype: dict[str, (str, str, str, str | None)]
+        """
+        import json
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or \
+                data.get('version') != self.VERSION or \
+                not isinstance(data.get('branches'), dict):
+            return {}
+
+        entries = {}
+        for name, entry in data['branches'].items():
+            if isinstance(entry, list) and len(entry) == 4 and \
+                    all(isinstance(value, str) for value in entry[:3]) and \
+                    isinstance(entry[3], (str, type(None))):
+                entries[name] = tuple(entry)
+
+        self._loaded = entries
+
+        return dict(entries)
+
+    def store(self, entries):
+        """
+        Replace the cached entries, unless nothing has changed.
+
+        :type entries: dict[str, (str, str, str, str | None)]
+        """
+        if entries == self._loaded:
+            return
+
+        # The cache is an optimization only
+        if write_json(self.path, {
+            'version': self.VERSION,
+            'branches': {name: list(entry)
+                         for name, entry in sorted(entries.items())}
+        }):
+            self._loaded = dict(entries)
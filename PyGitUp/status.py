@@ -0,0 +1,78 @@
+"""
+The state of the working tree, computed once per run.
+
+Scanning a large working tree takes seconds. git-up used to do that several
+times per run: once to count the changes and again (twice, through GitPython)
+when deciding whether to stash. `WorktreeStatus` is the result of a single
+`git status --porcelain=v2 -z` scan which is shared by everything that needs
+to know about local changes.
+"""
+
+__all__ = ['WorktreeStatus']
+
+
+###############################################################################
+# WorktreeStatus
+###############################################################################
+
+class WorktreeStatus:
+    """
+    Local changes in the working tree (untracked files are ignored).
+    """
+
+    # git status --porcelain=v2 -z --untracked-files=no
+    ARGUMENTS = ['--porcelain=v2', '-z', '--untracked-files=no']
+
+    def __init__(self, staged=0, unstaged=0, unmerged=0, submodules=0,
+                 count=0):
+        #: Number of paths with changes in the index
+        self.staged = staged
+        #: Number of paths with changes in the working tree
+        self.unstaged = unstaged
+        #: Number of paths with merge conflicts
+        self.unmerged = unmerged
+        #: Number of changed submodules
+        self.submodules = submodules
+        #: Number of changed paths
+        self.count = count
+
+    @property
+    def dirty(self):
+        """ Are there changes to stash? Changed submodules don't count. """
+        return self.count > self.submodules
+
+    @classmethod
+    def parse(cls, output):
+        """ Parse the output of `git status ARGUMENTS`. """
+        status = cls()
+
+        fields = output.split('\0')
+        index = 0
+        while index < len(fields):
+            entry = fields[index]
+            index += 1
+
+            if entry.startswith('2 '):
+                index += 1  # Renamed/copied: the original path follows
+            elif not entry.startswith(('1 ', 'u ')):
+                continue  # Headers, untracked or ignored files
+
+            kind, xy, submodule = entry.split(' ', 3)[:3]
+
+            status.count += 1
+            if submodule.startswith('S'):
+                status.submodules += 1
+            if kind == 'u':
+                status.unmerged += 1
+                continue
+            if xy[0] != '.':
+                status.staged += 1
+            if xy[1] != '.':
+                status.unstaged += 1
+
+        return status
+
+    def __repr__(self):
+        return ('<WorktreeStatus count={0.count} staged={0.staged} '
+                'unstaged={0.unstaged} unmerged={0.unmerged} '
+                'submodules={0.submodules}>'.format(self))
@@ -0,0 +1,126 @@
+# System imports
+import os
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.backends import SubprocessBackend, Pygit2Backend, open_backend
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.tests import basepath, init_master, update_file, write_file
+
+test_name = 'backends'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Diverge from origin
+    update_file(repo, test_name, filename='local.txt')
+    update_file(master, test_name)
+    repo.remotes.origin.fetch()
+
+    # Local changes
+    write_file(join(path, 'local.txt'), 'changed')
+    write_file(join(path, 'untracked.txt'), 'untracked')
+
+
+def _check_backend(backend):
+    origin = 'refs/remotes/origin/' + test_name
+
+    assert backend.merge_base(test_name, origin) == \
+        repo.git.merge_base(test_name, origin)
+    assert backend.commit_sha(origin) == repo.git.rev_parse(origin)
+    assert backend.commit_sha('refs/heads/missing') is None
+    assert backend.tree_shas([test_name, origin]) == [
+        repo.git.rev_parse(test_name + '^{tree}'),
+        repo.git.rev_parse(origin + '^{tree}'),
+    ]
+
+    status = backend.status()
+    assert status.count == 1
+    assert status.unstaged == 1
+    assert status.dirty
+
+
+def test_subprocess_backend():
+    """ Answer queries by running git """
+    _check_backend(SubprocessBackend(GitWrapper(repo)))
+
+
+def test_pygit2_backend():
+    """ Answer queries with libgit2, just like git """
+    pytest.importorskip('pygit2')
+
+    backend = Pygit2Backend.open(GitWrapper(repo), repo.working_dir)
+    assert backend is not None
+
+    try:
+        _check_backend(backend)
+    finally:
+        backend.close()
+
+
+def test_backend_disabled():
+    """ Use git if pygit2 is disabled """
+    backend = open_backend(GitWrapper(repo), repo.working_dir, pygit2=False)
+
+    assert backend.name == 'git'
+
+
+def test_backends_agree():
+    """ Answer queries the same way with git and libgit2 """
+    pytest.importorskip('pygit2')
+
+    git = GitWrapper(repo)
+    subprocess_backend = SubprocessBackend(git)
+    pygit2_backend = Pygit2Backend.open(git, repo.working_dir)
+
+    origin = 'refs/remotes/origin/' + test_name
+    revs = [test_name, origin, test_name + '~1', 'HEAD']
+
+    def answers(backend):
+        return (
+            [backend.merge_base(rev, other) for rev in revs for other in revs],
+            [backend.commit_sha(rev) for rev in revs + ['missing']],
+            backend.tree_shas(revs),
+            vars(backend.status()),
+        )
+
+    try:
+        assert answers(pygit2_backend) == answers(subprocess_backend)
+    finally:
+        pygit2_backend.close()
+
+
+def test_backend_opt_in():
+    """ Only use pygit2 if enabled, and not with replace refs """
+    pytest.importorskip('pygit2')
+
+    try:
+        repo.git.config('git-up.backend.pygit2', 'false')
+        assert GitWrapper(repo).backend.name == 'git'
+
+        repo.git.config('git-up.backend.pygit2', 'true')
+        assert GitWrapper(repo).backend.name == 'pygit2'
+
+        # libgit2 would ignore the replacement
+        repo.git.replace(test_name, test_name + '~1')
+        try:
+            assert GitWrapper(repo).backend.name == 'git'
+        finally:
+            repo.git.replace('-d', test_name)
+    finally:
+        repo.git.config('--unset', 'git-up.backend.pygit2')
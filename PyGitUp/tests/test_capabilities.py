@@ -0,0 +1,61 @@
+# System imports
+import subprocess
+
+from PyGitUp.capabilities import GitCapabilities
+
+
+def _count_probes(monkeypatch):
+    """ Count the calls to `git version`. """
+    calls = []
+    check_output = subprocess.check_output
+
+    def counting_check_output(cmd, **kwargs):
+        calls.append(cmd)
+        return check_output(cmd, **kwargs)
+
+    monkeypatch.setattr(subprocess, 'check_output', counting_check_output)
+    GitCapabilities.clear_cache()
+
+    return calls
+
+
+def test_parse_version():
+    assert GitCapabilities.parse_version('git version 2.39.5') == '2.39.5'
+    assert GitCapabilities.parse_version(
+        'git version 2.45.1.windows.1'
+    ) == '2.45.1'
+
+
+def test_features():
+    capabilities = GitCapabilities('2.39.5')
+
+    assert capabilities.prune
+    assert capabilities.worktree
+    assert not capabilities.ahead_behind
+    assert capabilities.is_version_min('2.10.0')
+    assert not capabilities.is_version_min('2.100')
+
+
+def test_probe_once_per_process(monkeypatch):
+    calls = _count_probes(monkeypatch)
+
+    first = GitCapabilities.probe()
+    second = GitCapabilities.probe()
+
+    assert first is second
+    assert len(calls) == 1
+
+
+def test_probe_persistent(monkeypatch, tmp_path):
+    cache_file = str(tmp_path / 'git-version.json')
+    monkeypatch.setattr(GitCapabilities, 'cache_file',
+                        staticmethod(lambda: cache_file))
+    calls = _count_probes(monkeypatch)
+
+    version = GitCapabilities.probe(persistent=True).version
+    assert len(calls) == 1
+
+    # A new process (simulated by clearing the cache) reads it from disk
+    GitCapabilities.clear_cache()
+    assert GitCapabilities.probe(persistent=True).version == version
+    assert len(calls) == 1
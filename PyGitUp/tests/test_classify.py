@@ -0,0 +1,123 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'classify'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Diverge from the old state of the remote branch
+    repo.git.checkout('origin/' + test_name, b=test_name + '.diverged')
+    update_file(repo, test_name + '.diverged')
+
+    # Update the remote branch
+    update_file(master, test_name)
+    repo.remotes.origin.fetch()
+
+    # Be ahead of/level with the new state of the remote branch
+    repo.git.checkout('origin/' + test_name, b=test_name + '.ahead')
+    update_file(repo, test_name + '.ahead')
+    repo.git.branch(test_name + '.up-to-date', 'origin/' + test_name)
+
+    for suffix in ['.ahead', '.diverged', '.up-to-date']:
+        repo.git.branch('--set-upstream-to', 'origin/' + test_name,
+                        test_name + suffix)
+
+    repo.git.checkout(test_name)
+
+
+def _classifier(monkeypatch=None):
+    from PyGitUp.classify import BranchClassifier
+    from PyGitUp.git_wrapper import GitWrapper, GitError
+    from PyGitUp.refs import RefSnapshot
+
+    git = GitWrapper(repo)
+    refs = RefSnapshot.load(git)
+    target_sha = refs.sha('refs/remotes/origin/' + test_name)
+    pairs = {
+        branch.name: (refs.sha(branch.path), target_sha)
+        for branch in repo.branches
+    }
+
+    classifier = BranchClassifier(git)
+    if monkeypatch:
+        def fail(*args):
+            raise GitError('for-each-ref failed')
+
+        monkeypatch.setattr(classifier, '_for_each_ref', fail)
+
+    classifier.classify(pairs)
+
+    states = {name: classifier.state(name, *shas)
+              for name, shas in pairs.items()}
+
+    return classifier, states
+
+
+def test_classify_batch():
+    """ Classify all branches with a single git call """
+    classifier, states = _classifier()
+
+    assert states == {
+        test_name: 'behind',
+        test_name + '.ahead': 'ahead',
+        test_name + '.diverged': 'diverged',
+        test_name + '.up-to-date': 'up to date',
+    }
+    assert classifier.fallbacks == 0
+
+
+def test_classify_fallback(monkeypatch):
+    """ Fall back to git merge-base if the batched call fails """
+    classifier, states = _classifier(monkeypatch)
+
+    assert states == _classifier()[1]
+    assert classifier.fallbacks == 3
+
+
+def test_classify_run():
+    """ Run 'git up' with branches in every state """
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['rebase.auto'] = False
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding', 'ahead', 'diverged',
+                            'up to date']
+    assert repo.branches[test_name].commit == \
+        master.branches[test_name].commit
+
+
+def test_classify_unrelated():
+    """ Classify branches without a merge base as diverged """
+    from PyGitUp.classify import BranchClassifier
+    from PyGitUp.git_wrapper import GitWrapper
+
+    orphan = repo.git.commit_tree(repo.git.rev_parse('HEAD^{tree}'),
+                                  m='unrelated')
+    target_sha = repo.git.rev_parse('origin/' + test_name)
+
+    classifier = BranchClassifier(GitWrapper(repo))
+
+    assert classifier.merge_base(orphan, target_sha) is None
+    assert classifier.state('unrelated', orphan, target_sha) == 'diverged'
@@ -0,0 +1,177 @@
+# System imports
+import itertools
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.commitgraph import CommitGraph, CommitGraphMiss
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'commit-graph'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master
+    master_path, master = init_master(test_name)
+
+    # Build a history with forks, a criss-cross and an octopus merge
+    master.git.checkout(b=test_name)
+    update_file(master, 'base')
+
+    for name in ['a', 'b', 'c']:
+        master.git.checkout(test_name, b=test_name + '.' + name)
+        update_file(master, name, filename=name + '.txt')
+
+    master.git.checkout(test_name + '.a')
+    master.git.merge(test_name + '.b', m='merge b into a')
+    master.git.checkout(test_name + '.b')
+    master.git.merge(test_name + '.a~1', m='merge a into b')
+    update_file(master, 'b2', filename='b.txt')
+
+    master.git.checkout(test_name)
+    master.git.merge(test_name + '.a~1', test_name + '.b~2',
+                     test_name + '.c', m='octopus')
+
+    master.git.commit_graph('write', '--reachable')
+
+
+def _commits():
+    return master.git.rev_list('--all').split()
+
+
+def _git_is_ancestor(ancestor, descendant):
+    try:
+        master.git.merge_base('--is-ancestor', ancestor, descendant)
+    except GitCommandError:
+        return False
+
+    return True
+
+
+def test_is_ancestor():
+    """ Answer ancestry questions like git """
+    graph = CommitGraph.open(master.git_dir)
+    assert graph is not None
+
+    for one, two in itertools.permutations(_commits(), 2):
+        assert graph.is_ancestor(one, two) == _git_is_ancestor(one, two)
+
+    graph.close()
+
+
+def test_merge_base():
+    """ Find the same merge base as git or defer to it """
+    graph = CommitGraph.open(master.git_dir)
+
+    deferred = 0
+    for one, two in itertools.combinations(_commits(), 2):
+        try:
+            base = graph.merge_base(one, two)
+        except CommitGraphMiss:
+            deferred += 1
+            # Only ambiguous (criss-cross) merge bases are left to git
+            assert len(master.git.merge_base('--all', one, two).split()) > 1
+        else:
+            assert base == master.git.merge_base(one, two)
+
+    assert deferred > 0
+    graph.close()
+
+
+def test_split_graph():
+    """ Read a commit-graph chain and miss commits that aren't in it """
+    update_file(master, 'new commit')
+    new_sha = master.head.commit.hexsha
+    master.git.commit_graph('write', '--reachable', '--split=no-merge')
+    update_file(master, 'not in the graph')
+
+    graph = CommitGraph.open(master.git_dir)
+    assert len(graph.layers) == 2
+
+    old_sha = master.git.rev_parse(test_name + '.c')
+    assert graph.is_ancestor(old_sha, new_sha)
+    assert not graph.is_ancestor(new_sha, old_sha)
+
+    try:
+        graph.is_ancestor(old_sha, master.head.commit.hexsha)
+    except CommitGraphMiss:
+        pass
+    else:
+        assert False, 'commit should be missing from the graph'
+
+    graph.close()
+
+
+def test_no_graph():
+    """ Don't use a missing commit graph """
+    assert CommitGraph.open(join(basepath, 'no-such-repo')) is None
+
+
+def test_classify_from_graph():
+    """ Classify branches without asking git """
+    from PyGitUp.classify import BranchClassifier
+
+    graph = CommitGraph.open(master.git_dir)
+    classifier = BranchClassifier(None, graph=graph)
+
+    sha = master.git.rev_parse
+    classifier.classify({
+        'a': (sha(test_name + '.a'), sha(test_name + '.b')),
+        'c': (sha(test_name + '.c'), sha(test_name + '.c~1')),
+        'c~1': (sha(test_name + '.c~1'), sha(test_name + '.c')),
+    })
+
+    assert classifier.state('a', sha(test_name + '.a'),
+                            sha(test_name + '.b')) == 'diverged'
+    assert classifier.state('c', sha(test_name + '.c'),
+                            sha(test_name + '.c~1')) == 'ahead'
+    assert classifier.state('c~1', sha(test_name + '.c~1'),
+                            sha(test_name + '.c')) == 'behind'
+    assert classifier.fallbacks == 0
+
+    graph.close()
+
+
+def test_replaced_history():
+    """ Don't use the graph if replace refs alter the history """
+    sha = master.git.rev_parse
+    master.git.replace(sha(test_name + '.c'), sha(test_name + '.b'))
+    try:
+        master.git.pack_refs('--all')
+        assert CommitGraph.open(master.git_dir) is None
+    finally:
+        master.git.replace('-d', sha(test_name + '.c'))
+
+
+def test_graph_closed_on_error(monkeypatch):
+    """ Close the graph if updating the branches fails """
+    from PyGitUp.git_wrapper import GitError, GitWrapper
+
+    path = join(basepath, test_name + '.clone')
+    master.clone(path, b=test_name)
+    os.chdir(path)
+    Repo(path).git.config('git-up.rebase.commit-graph', 'true')
+
+    closed = []
+    monkeypatch.setattr(CommitGraph, 'close',
+                        lambda graph: closed.append(graph))
+
+    def fail(*args, **kwargs):
+        raise GitError('stash failed')
+
+    monkeypatch.setattr(GitWrapper, 'stasher', fail)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    monkeypatch.setattr(gitup, '_commit_graph',
+                        lambda: CommitGraph.open(master.git_dir))
+
+    try:
+        gitup.rebase_all_branches()
+    except GitError:
+        pass
+    else:
+        assert False, 'the update should have failed'
+
+    assert len(closed) == 1
@@ -0,0 +1,65 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.config import ConfigSnapshot
+from PyGitUp.tests import basepath, init_master
+
+test_name = 'config'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    repo.git.config('git-up.rebase.arguments', '--rebase-merges')
+    repo.git.config('git-up.fetch.prune', 'false')
+
+
+def test_parse():
+    values, origins = ConfigSnapshot.parse(
+        'file:.git/config\0git-up.fetch.prune\nfalse\0'
+        'command line:\0git-up.rebase.arguments\n--a\nb\0'
+        'file:.git/config\0git-up.fetch.all\0'
+    )
+
+    assert values == {
+        'git-up.fetch.prune': 'false',
+        'git-up.rebase.arguments': '--a\nb',
+        'git-up.fetch.all': '',
+    }
+    assert origins == ['.git/config', '.git/config']
+
+
+def test_config():
+    """ Run 'git up' and read all settings from the config snapshot """
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    assert gitup.settings['rebase.arguments'] == '--rebase-merges'
+    assert gitup.settings['fetch.prune'] is False
+    assert gitup.settings['fetch.all'] is False
+
+    # The snapshot is shared as long as the config is unchanged
+    assert GitUp(testing=True).git.config_snapshot is \
+        gitup.git.config_snapshot
+
+    # ... and read again once it changes
+    gitup.repo.git.config('git-up.fetch.all', 'true')
+
+    gitup = GitUp(testing=True)
+    assert gitup.settings['fetch.all'] is True
@@ -0,0 +1,161 @@
+# System imports
+import asyncio
+import os
+import time
+from os.path import join
+
+import pytest
+from PyGitUp.engine import GitEngine, OutputBuffer, run_coroutine
+from PyGitUp.git_wrapper import GitError
+from PyGitUp.tests import basepath, init_master
+
+test_name = 'engine'
+repo_path = join(basepath, test_name + os.sep)
+
+# A git command that takes a while
+SLOW = ['-c', 'alias.slow=!sleep 0.3', 'slow']
+VERY_SLOW = ['-c', 'alias.slow=!sleep 10', 'slow']
+
+
+def setup_module():
+    global master_path
+    master_path, master = init_master(test_name)
+
+
+def test_command():
+    """ Build command lines like GitPython """
+    engine = GitEngine()
+
+    assert engine.command('rev_parse', '--verify', None, ['a', 'b'],
+                          b='x', all=True, prune=False, depth=1) == \
+        ['rev-parse', '-b', 'x', '--all', '--depth=1', '--verify', 'a', 'b']
+
+
+def test_run():
+    """ Run commands and report failures """
+    engine = GitEngine(working_dir=master_path)
+
+    result = engine.run_sync('rev-parse', '--is-inside-work-tree')
+    assert result.ok
+    assert result.stdout.strip() == b'true'
+
+    with pytest.raises(GitError) as exc_info:
+        engine.run_sync('rev-parse', '--verify', 'does-not-exist')
+
+    assert 'returned exit status 128' in exc_info.value.message
+    assert 'does-not-exist' not in exc_info.value.stdout
+
+    result = engine.run_sync('hash-object', '--stdin', input=b'data\n')
+    assert result.stdout.strip() == \
+        b'1269488f7fb1f4b56a8c0e5eb48cecbfadfa9219'
+
+
+def test_timeout():
+    """ Kill commands that take too long """
+    engine = GitEngine(working_dir=master_path)
+
+    start = time.monotonic()
+    with pytest.raises(GitError) as exc_info:
+        engine.run_sync(*VERY_SLOW, timeout=0.2)
+
+    assert 'timed out' in exc_info.value.message
+    assert time.monotonic() - start < 5
+
+
+def test_limit():
+    """ Run at most `limit` commands at once """
+    engine = GitEngine(working_dir=master_path, limit=2)
+
+    async def run_all():
+        return await asyncio.gather(*[engine.run(*SLOW) for _ in range(4)])
+
+    start = time.monotonic()
+    results = asyncio.run(run_all())
+
+    assert all(result.ok for result in results)
+    assert time.monotonic() - start >= 0.6
+
+
+def test_cancel():
+    """ Kill commands when they are cancelled """
+    engine = GitEngine(working_dir=master_path)
+
+    async def cancel():
+        task = asyncio.ensure_future(engine.run(*VERY_SLOW))
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    asyncio.run(cancel())
+
+    assert time.monotonic() - start < 5
+
+
+def test_output_buffer():
+    """ Keep the beginning and the end of long output """
+    unbounded = OutputBuffer()
+    bounded = OutputBuffer(head=4, tail=6)
+
+    for chunk in (b'ab', b'cdefgh', b'ijklmnop', b'qr'):
+        unbounded.write(chunk)
+        bounded.write(chunk)
+
+    assert unbounded.getvalue() == b'abcdefghijklmnopqr'
+    assert bounded.getvalue() == b'abcd\n[... 8 bytes left out ...]\nmnopqr'
+    assert bounded.dropped == 8
+
+
+def test_run_sync_in_event_loop():
+    """ Run commands synchronously while an event loop is running """
+    engine = GitEngine(working_dir=master_path)
+
+    async def run():
+        return engine.run_sync('rev-parse', '--is-inside-work-tree')
+
+    assert asyncio.run(run()).stdout.strip() == b'true'
+
+
+def test_run_coroutine_in_event_loop():
+    """ Run commands concurrently while an event loop is running """
+    from git import Repo
+    from PyGitUp.git_wrapper import GitWrapper
+
+    engine = GitEngine(working_dir=master_path)
+    git = GitWrapper(Repo(master_path))
+
+    async def run_both():
+        return await asyncio.gather(engine.run('rev-parse', 'HEAD'),
+                                    engine.run('rev-parse', 'HEAD'))
+
+    async def run():
+        listed = git.ls_remotes({master_path: ['HEAD']})
+        return run_coroutine(run_both()), listed
+
+    (first, second), listed = asyncio.run(run())
+    assert first.stdout == second.stdout
+    assert listed[master_path]['HEAD'] == first.stdout.decode().strip()
+
+
+def test_run_sync_streams():
+    """ Copy output to streams while the command runs """
+    from io import StringIO
+
+    engine = GitEngine(working_dir=master_path)
+    stdout = StringIO()
+    stderr = StringIO()
+
+    result = engine.run_sync('-c', 'alias.both=!echo out; echo err >&2',
+                             'both', stdout_stream=stdout,
+                             stderr_stream=stderr)
+
+    assert result.ok
+    assert stdout.getvalue() == 'out\n'
+    assert stderr.getvalue() == 'err\n'
+
+    with pytest.raises(GitError) as exc_info:
+        engine.run_sync(*VERY_SLOW, stdout_stream=stdout, timeout=0.2)
+
+    assert 'timed out' in exc_info.value.message
@@ -0,0 +1,114 @@
+# System imports
+import os
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.git_wrapper import GitWrapper, RefUpdateError
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'fast-forward-transaction'
+repo_path = join(basepath, test_name + os.sep)
+
+branches = [test_name + suffix for suffix in ['.a', '.b', '.c']]
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Branches that aren't checked out
+    for branch in branches:
+        repo.git.branch(branch, 'origin/' + test_name, track=True)
+
+    # Modify file in master
+    update_file(master, test_name)
+
+
+def test_fast_forward_transaction(monkeypatch):
+    """ Fast-forward all branches that aren't checked out at once """
+    os.chdir(repo_path)
+
+    calls = []
+    update_refs = GitWrapper.update_refs
+
+    def counting_update_refs(self, updates, message):
+        calls.append([refname for refname, _, _ in updates])
+        return update_refs(self, updates, message)
+
+    monkeypatch.setattr(GitWrapper, 'update_refs', counting_update_refs)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding'] * 4
+    assert calls == [['refs/heads/' + branch for branch in branches]]
+
+    expected = master.branches[test_name].commit
+    for branch in branches:
+        assert repo.branches[branch].commit == expected
+        assert repo.git.reflog('-1', '--format=%gs', branch) == \
+            f'merge origin/{test_name}: Fast-forward'
+
+
+def test_fast_forward_transaction_atomic():
+    """ Don't update any ref if one of them has changed """
+    git = GitWrapper(repo)
+    old = repo.git.rev_parse(test_name + '~1')
+    new = repo.git.rev_parse(test_name)
+
+    repo.git.branch('-f', branches[0], old)
+    repo.git.branch('-f', branches[1], old)
+
+    with pytest.raises(RefUpdateError):
+        git.update_refs([('refs/heads/' + branches[0], new, old),
+                         ('refs/heads/' + branches[1], new, new)],
+                        'test')
+
+    assert repo.git.rev_parse(branches[0]) == old
+    assert repo.git.rev_parse(branches[1]) == old
+
+
+def test_fast_forward_reflog_per_target(monkeypatch):
+    """ Name each branch's own target in its reflog """
+    os.chdir(repo_path)
+
+    old = repo.git.rev_parse(test_name + '~1')
+    new = repo.git.rev_parse(test_name)
+    for branch in branches:
+        repo.git.branch('-f', branch, old)
+
+    messages = []
+    update_refs = GitWrapper.update_refs
+
+    def recording_update_refs(self, updates, message):
+        messages.append(message)
+        return update_refs(self, updates, message)
+
+    monkeypatch.setattr(GitWrapper, 'update_refs', recording_update_refs)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    targets = ['origin/a', 'origin/b', 'origin/a']
+    gitup._fast_forward_all([('refs/heads/' + branch, new, old, target)
+                             for branch, target in zip(branches, targets)])
+    gitup.close()
+
+    assert messages == ['merge origin/a: Fast-forward',
+                        'merge origin/b: Fast-forward']
+    for branch, target in zip(branches, targets):
+        assert repo.git.rev_parse(branch) == new
+        assert repo.git.reflog('-1', '--format=%gs', branch) == \
+            f'merge {target}: Fast-forward'
@@ -0,0 +1,92 @@
+# System imports
+import os
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.git_wrapper import GitError
+from PyGitUp.tests import basepath, capture, init_master, update_file
+
+test_name = 'fetch-jobs'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global repo, master1, master2
+    master1_path, master1 = init_master(test_name + '.1')
+
+    # Prepare master repo
+    master1.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master1.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Create second remote
+    master2_path = join(basepath, 'master.' + test_name + '.2')
+    master1.clone(master2_path, b=test_name)
+    master2 = Repo(master2_path, odbt=GitCmdObjectDB)
+
+    # Add second master as remote, too
+    repo.git.checkout(b=test_name + '.2')
+    repo.git.remote('add', 'upstream', master2_path)
+    repo.git.fetch(all=True)
+    repo.git.branch(set_upstream_to='upstream/' + test_name)
+
+    repo.git.config('git-up.fetch.jobs', '2')
+    repo.git.config('git-up.fetch.progress', 'true')
+
+
+def test_fetch_jobs():
+    """ Fetch several remotes at once """
+    os.chdir(repo_path)
+    update_file(master1, test_name)
+    update_file(master2, test_name)
+
+    from PyGitUp.gitup import GitUp
+
+    with capture() as [stdout, _]:
+        gitup = GitUp(testing=True)
+        gitup.fetch()
+
+    for remote, master in (('origin', master1), ('upstream', master2)):
+        assert repo.git.rev_parse(f'{remote}/{test_name}') == \
+            master.head.commit.hexsha
+        assert f'{remote}: ' in stdout.getvalue()
+
+    # Every line is prefixed with the remote it's from
+    for line in stdout.getvalue().replace('\r', '\n').splitlines():
+        if line:
+            assert line.startswith(('origin: ', 'upstream: '))
+
+
+def test_fetch_jobs_error():
+    """ Report the errors of all remotes at once """
+    os.chdir(repo_path)
+    update_file(master1, test_name)
+    repo.git.remote('set-url', 'upstream', 'does-not-exist')
+
+    from PyGitUp.gitup import GitUp
+
+    try:
+        with capture():
+            gitup = GitUp(testing=True)
+
+            with pytest.raises(GitError) as exc_info:
+                gitup.fetch()
+    finally:
+        repo.git.remote('set-url', 'upstream', master2.working_dir)
+
+    error = exc_info.value
+    assert error.message == '`git fetch` failed for upstream'
+    assert error.stderr.startswith('upstream: ')
+    assert 'does-not-exist' in error.stderr
+    assert error.stderr_already_output
+
+    # The other remote has been fetched anyway
+    assert repo.git.rev_parse('origin/' + test_name) == \
+        master1.head.commit.hexsha
@@ -46,3 +46,34 @@ def test_fetch_large_output():
     # Assert
     assert len(gitup.states) == 1
     assert gitup.states[0] == 'up to date'
+
+
+class FlushCounter(io.StringIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+def test_stream_reader():
+    """ Copy output in chunks, keeping only its ends """
+    from PyGitUp.git_wrapper import GitWrapper
+
+    lines = [('line %d äöü\n' % i).encode() for i in range(100000)]
+    output = FlushCounter()
+    result = []
+
+    GitWrapper.stream_reader(io.BufferedReader(io.BytesIO(b''.join(lines))),
+                             output, result, head=100, tail=100)
+
+    assert output.getvalue() == b''.join(lines).decode()
+    assert output.flushes < len(lines) / 100
+    assert len(result[0]) < 300
+    assert result[0].startswith(lines[0])
+    assert result[0].endswith(lines[-1])
+
+    # Output that isn't copied is kept completely
+    result = []
+    GitWrapper.stream_reader(io.BytesIO(b''.join(lines)), None, result)
+    assert result[0] == b''.join(lines)
@@ -0,0 +1,81 @@
+# System imports
+import json
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, capture, init_master, update_file
+
+test_name = 'fetch-max-age'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    repo.git.config('git-up.fetch.max-age', '1h')
+
+
+def _run():
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    with capture():
+        gitup.run()
+
+    return gitup
+
+
+def test_max_age():
+    """ Don't fetch remotes that have just been fetched """
+    os.chdir(repo_path)
+    fetched_file = join(repo.git_dir, 'git-up', 'fetched')
+
+    update_file(master, test_name)
+    assert _run().states == ['fast-forwarding']
+    assert os.path.isfile(fetched_file)
+
+    # Fetched less than an hour ago: nothing new
+    update_file(master, test_name)
+    assert _run().states == ['up to date']
+
+    # ... until it's an hour
+    with open(fetched_file) as f:
+        data = json.load(f)
+    data['remotes']['origin'] -= 60 * 60
+
+    with open(fetched_file, 'w') as f:
+        json.dump(data, f)
+
+    assert _run().states == ['fast-forwarding']
+
+
+def test_max_age_invalid():
+    """ Warn about an invalid max-age instead of ignoring it silently """
+    os.chdir(repo_path)
+    repo.git.config('git-up.fetch.max-age', '5min')
+
+    try:
+        update_file(master, test_name)
+
+        from PyGitUp.gitup import GitUp
+        with capture() as output:
+            gitup = GitUp(testing=True)
+            gitup.run()
+
+        assert "git-up.fetch.max-age is set to '5min'" in output[0]
+        assert gitup.states == ['fast-forwarding']
+    finally:
+        repo.git.config('git-up.fetch.max-age', '1h')
@@ -0,0 +1,82 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'fetch-narrow'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    master.git.branch('untracked.' + test_name)
+    master.git.branch(test_name + '-prefixed')
+    master.git.branch(test_name + '.deleted')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    repo.git.branch(test_name + '.deleted', 'origin/' + test_name +
+                    '.deleted')
+    repo.git.config('git-up.fetch.narrow', 'true')
+
+    # Update the tracked and the untracked branch, delete another one
+    update_file(master, test_name)
+    master.git.checkout('untracked.' + test_name)
+    update_file(master, test_name)
+    master.git.checkout(test_name)
+    master.git.branch('-D', test_name + '.deleted')
+
+    # New branches sharing the name of the tracked one as a prefix
+    master.git.branch(test_name + '.new')
+    master.git.branch(test_name + '-new')
+    master.git.checkout(test_name + '-prefixed')
+    update_file(master, test_name)
+    master.git.checkout(test_name)
+
+
+def test_fetch_narrow(monkeypatch, tmp_path):
+    """ Only fetch the branches local branches track """
+    os.chdir(repo_path)
+    untracked = repo.git.rev_parse('origin/untracked.' + test_name)
+    prefixed = repo.git.rev_parse('origin/' + test_name + '-prefixed')
+
+    trace_file = str(tmp_path / 'trace')
+    monkeypatch.setenv('GIT_TRACE_PACKET', trace_file)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.fetch()
+
+    # Tracked branches are fetched...
+    assert repo.git.rev_parse('origin/' + test_name) == \
+        master.git.rev_parse(test_name)
+
+    # ... and pruned, others are left alone
+    remote_branches = repo.git.branch('-r', format='%(refname:short)')
+    assert 'origin/' + test_name + '.deleted' not in remote_branches
+    assert repo.git.rev_parse('origin/untracked.' + test_name) == \
+        untracked
+
+    # ... even if their names start with the name of a tracked branch
+    assert repo.git.rev_parse('origin/' + test_name + '-prefixed') == \
+        prefixed
+    assert 'origin/' + test_name + '.new' not in remote_branches
+    assert 'origin/' + test_name + '-new' not in remote_branches
+
+    # The remote has only been asked for the tracked branches
+    with open(trace_file) as f:
+        trace = f.read()
+    assert 'ref-prefix refs/heads/' + test_name + '\n' in trace
+    assert 'ref-prefix refs/heads/untracked.' + test_name not in trace
@@ -0,0 +1,85 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'fetch-skip-unchanged'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global repo, master1, master2
+    master1_path, master1 = init_master(test_name + '.1')
+
+    # Prepare master repo
+    master1.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master1.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Create second remote
+    master2_path = join(basepath, 'master.' + test_name + '.2')
+    master1.clone(master2_path, b=test_name)
+    master2 = Repo(master2_path, odbt=GitCmdObjectDB)
+    master2.git.branch(test_name + '.deleted')
+
+    # Add second master as remote, too
+    repo.git.checkout(b=test_name + '.2')
+    repo.git.remote('add', 'upstream', master2_path)
+    repo.git.fetch(all=True)
+    repo.git.branch(set_upstream_to='upstream/' + test_name)
+    repo.git.branch('--track', test_name + '.deleted',
+                    'upstream/' + test_name + '.deleted')
+
+    repo.git.config('git-up.fetch.skip-unchanged', 'true')
+
+
+def _fetched_remotes(monkeypatch):
+    fetched = []
+    fetch = GitWrapper.fetch
+
+    def record(self, *args, **kwargs):
+        fetched.append(args[0])
+        return fetch(self, *args, **kwargs)
+
+    monkeypatch.setattr(GitWrapper, 'fetch', record)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.fetch()
+
+    return fetched
+
+
+def test_skip_unchanged(monkeypatch):
+    """ Only fetch remotes whose tracked branches have moved """
+    os.chdir(repo_path)
+
+    assert _fetched_remotes(monkeypatch) == []
+
+    update_file(master1, test_name)
+    assert _fetched_remotes(monkeypatch) == [['origin']]
+    assert repo.git.rev_parse('origin/' + test_name) == \
+        master1.head.commit.hexsha
+
+    assert _fetched_remotes(monkeypatch) == []
+
+
+def test_skip_unchanged_deleted(monkeypatch):
+    """ Fetch remotes to prune tracked branches that have been deleted """
+    os.chdir(repo_path)
+
+    master2.git.branch('-D', test_name + '.deleted')
+    assert _fetched_remotes(monkeypatch) == [['upstream']]
+    assert 'upstream/' + test_name + '.deleted' not in \
+        repo.git.branch('-r')
+
+    assert _fetched_remotes(monkeypatch) == []
@@ -0,0 +1,65 @@
+# System imports
+import os
+import subprocess
+import sys
+from os.path import dirname
+
+import PyGitUp
+
+# Modules that are only needed on some code paths and have to be imported
+# lazily
+LAZY_MODULES = ['git', 'urllib.request', 'json', 'packaging.version',
+                'tempfile', 'colorama', 'termcolor', 'importlib.metadata',
+                'argparse', 'asyncio']
+
+# Budget for `import PyGitUp.gitup` (in microseconds)
+BUDGET = 100000
+
+
+def import_times(module):
+    """ Import a module in a fresh interpreter and parse `-X importtime`. """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=dirname(dirname(PyGitUp.__file__)),
+        stderr=subprocess.PIPE, text=True, check=True,
+    ).stderr
+
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def test_import_time():
+    """ Importing PyGitUp.gitup doesn't load heavy modules """
+    # The first run may have to compile the byte code
+    import_times('PyGitUp.gitup')
+    times = import_times('PyGitUp.gitup')
+
+    assert 'PyGitUp.gitup' in times
+    assert [m for m in LAZY_MODULES if m in times] == []
+    assert times['PyGitUp.gitup'] < BUDGET
+
+
+def test_version_without_gitpython():
+    """ `git up --version` doesn't import GitPython """
+    output = subprocess.run(
+        [sys.executable, '-c',
+         'import sys\n'
+         'from PyGitUp.gitup import run\n'
+         'sys.argv = ["git-up", "--version"]\n'
+         'run()\n'
+         'print("git" in sys.modules)\n'],
+        cwd=dirname(dirname(PyGitUp.__file__)),
+        env=dict(os.environ,
+                 GIT_CONFIG_PARAMETERS="'git-up.updates.check=false'"),
+        stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+
+    assert output.splitlines()[-1] == 'False'
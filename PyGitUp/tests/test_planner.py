@@ -0,0 +1,116 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.planner import ExecutionPlan
+from PyGitUp.tests import basepath, capture, init_master, update_file, \
+    write_file
+
+test_name = 'planner'
+repo_path = join(basepath, test_name + os.sep)
+
+branches = [test_name + suffix for suffix in ['.a', '.b', '.c']]
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Branches with local commits, which have to be checked out to rebase
+    for branch in branches[:2]:
+        repo.git.checkout('origin/' + test_name, b=branch, track=True)
+        update_file(repo, branch, filename=branch + '.txt')
+
+    # A branch tracking one of them
+    repo.git.branch(branches[2], branches[0], track=True)
+
+    repo.git.checkout(test_name)
+
+    # Modify file in master
+    update_file(master, test_name)
+
+    # Uncommitted changes
+    write_file(join(path, 'staged.txt'), 'changes')
+    repo.git.add('staged.txt')
+
+
+def test_planner(monkeypatch):
+    """ Rebase branches that need a checkout last, on the original one """
+    os.chdir(repo_path)
+
+    checkouts = []
+    checkout = GitWrapper.checkout
+
+    def counting_checkout(self, branch_name):
+        checkouts.append(branch_name)
+        return checkout(self, branch_name)
+
+    monkeypatch.setattr(GitWrapper, 'checkout', counting_checkout)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    with capture() as [stdout, _]:
+        gitup.run()
+
+    stdout = stdout.getvalue()
+
+    # Branch .c waits for .a, the original branch comes last
+    assert checkouts == branches + [test_name]
+    assert 'returning to' not in stdout
+
+    # The output is still in order
+    positions = [stdout.index(name + ' ')
+                 for name in [test_name] + branches]
+    assert positions == sorted(positions)
+    assert gitup.states == ['fast-forwarding', 'rebasing', 'rebasing',
+                            'rebasing']
+
+    expected = master.branches[test_name].commit
+    assert repo.active_branch.name == test_name
+    assert repo.head.commit == expected
+    assert repo.branches[branches[0]].commit.parents[0] == expected
+    assert repo.branches[branches[2]].commit == \
+        repo.branches[branches[0]].commit
+
+    # Stashed once, restored at the end
+    assert repo.git.stash('list') == ''
+    assert repo.git.diff('--cached', '--name-only') == 'staged.txt'
+
+
+def test_plan_order():
+    """ Deferred branches come after the others, the current one last """
+    plan = ExecutionPlan(['a', 'b', 'c', 'd'], current='a',
+                         targets={'d': 'b'})
+    steps = []
+
+    for name, deferred in plan:
+        steps.append((name, deferred))
+        if deferred is None and name in ('a', 'b'):
+            plan.defer(name, 'checkout')
+        else:
+            plan.finish(name)
+
+    assert steps == [('a', None), ('b', None), ('c', None),
+                     ('b', 'checkout'), ('d', None), ('a', 'checkout')]
+
+
+def test_plan_disabled():
+    """ Without planning, branches are handed out in order """
+    plan = ExecutionPlan(['a', 'b', 'c'], current='a', targets={'a': 'c'},
+                         enabled=False)
+
+    assert [name for name, _ in plan] == ['a', 'b', 'c']
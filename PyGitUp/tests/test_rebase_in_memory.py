@@ -0,0 +1,143 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.tests import basepath, write_file, init_master, update_file
+
+test_name = 'rebase-in-memory'
+repo_path = join(basepath, test_name + os.sep)
+
+branch_name = test_name + '.other'
+conflict_name = test_name + '.conflict'
+
+
+def _commit(repo, filename, contents, message, **kwargs):
+    path = join(repo.working_dir, filename)
+    write_file(path, contents)
+    repo.index.add([path])
+    return repo.index.commit(message, **kwargs)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # A branch that isn't checked out with: a new file (by someone else), a
+    # change that's already upstream and an empty commit
+    repo.git.checkout('origin/' + test_name, b=branch_name, track=True)
+    _commit(repo, 'a.txt', 'a\n', 'add a\n\nwith a body\n',
+            author=Actor('Someone Else', 'someone@example.com'))
+    _commit(repo, 'upstream.txt', 'upstream\n', 'upstream change')
+    repo.git.commit('--allow-empty', m='empty')
+
+    # A branch that conflicts with upstream
+    repo.git.checkout('origin/' + test_name, b=conflict_name, track=True)
+    update_file(repo, 'conflicting change')
+
+    # Don't use the checked out branch
+    repo.git.checkout('--no-track', 'origin/' + test_name, b='unrelated')
+
+    # Modify files in master
+    _commit(master, 'upstream.txt', 'upstream\n', 'upstream change')
+    update_file(master, test_name)
+
+
+def test_rebase_in_memory(monkeypatch):
+    """ Rebase a branch without checking it out """
+    os.chdir(repo_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('branch has been checked out')
+
+    monkeypatch.setattr(GitWrapper, 'checkout', fail)
+    monkeypatch.setattr(GitWrapper, 'rebase', fail)
+
+    old_commits = list(repo.iter_commits(branch_name, max_count=3))
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['rebase.in-memory'] = True
+
+    # Only rebase the branch without conflicts
+    gitup.branches = [branch for branch in gitup.branches
+                      if branch.name != conflict_name]
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding', 'rebasing']
+    assert repo.active_branch.name == 'unrelated'
+
+    # The upstream change has been dropped, the empty commit is kept
+    empty, added, base = repo.iter_commits(branch_name, max_count=3)
+    assert base == master.branches[test_name].commit
+    assert empty.message == old_commits[0].message
+    assert added.message == old_commits[2].message == 'add a\n\nwith a body\n'
+    assert added.author.email == 'someone@example.com'
+    assert added.authored_date == old_commits[2].authored_date
+    assert empty.tree == added.tree
+    assert added.tree['a.txt'] and added.tree['upstream.txt']
+
+    assert repo.git.reflog('-1', '--format=%gs', branch_name).startswith(
+        'rebase (finish): refs/heads/' + branch_name
+    )
+
+
+def test_rebase_in_memory_conflict():
+    """ Leave conflicting branches to git rebase """
+    from PyGitUp.capabilities import GitCapabilities
+    from PyGitUp.replay import InMemoryRebase
+
+    git = GitWrapper(repo)
+    in_memory = InMemoryRebase(git, GitCapabilities.probe())
+
+    branch_sha = repo.git.rev_parse(conflict_name)
+    assert in_memory.rebase(branch_sha,
+                            repo.git.rev_parse('origin/' + test_name)) is None
+    assert repo.git.rev_parse(conflict_name) == branch_sha
+
+
+def test_rebase_in_memory_unrelated():
+    """ Leave branches rebased onto an unrelated history to git rebase """
+    os.chdir(repo_path)
+    unrelated_name = test_name + '.unrelated-history'
+
+    # A branch tracking a remote branch without any history in common
+    master.git.checkout('--orphan', unrelated_name)
+    master.git.rm('-rf', '.')
+    _commit(master, 'orphan.txt', 'orphan\n', 'orphan')
+    master.git.checkout(test_name)
+
+    repo.git.fetch()
+    repo.git.branch(unrelated_name, 'origin/' + test_name)
+    repo.git.branch('-u', 'origin/' + unrelated_name, unrelated_name)
+
+    from PyGitUp.capabilities import GitCapabilities
+    from PyGitUp.replay import InMemoryRebase
+
+    git = GitWrapper(repo)
+    in_memory = InMemoryRebase(git, GitCapabilities.probe())
+    target_sha = repo.git.rev_parse('origin/' + unrelated_name)
+    assert in_memory.rebase(repo.git.rev_parse(unrelated_name),
+                            target_sha) is None
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['rebase.in-memory'] = True
+    gitup.branches = [branch for branch in gitup.branches
+                      if branch.name == unrelated_name]
+    gitup.run()
+
+    assert gitup.states == ['rebasing']
+    assert repo.is_ancestor(target_sha, unrelated_name)
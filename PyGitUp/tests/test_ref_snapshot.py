@@ -0,0 +1,81 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'ref-snapshot'
+repo_path = join(basepath, test_name + os.sep)
+worktree_path = join(basepath, test_name + '-wt')
+worktree_branch = test_name + '.wt'
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Branches tracking another local branch that git-up will move
+    repo.git.branch(test_name + '.a', 'origin/' + test_name)
+    repo.git.branch('--set-upstream-to', 'origin/' + test_name,
+                    test_name + '.a')
+    repo.git.branch(test_name + '.b', test_name + '.a', track=True)
+
+    # A linked worktree with a branch of its own
+    repo.git.worktree('add', '-b', worktree_branch, '--track',
+                      worktree_path, 'origin/' + test_name)
+
+    # Modify file in master
+    update_file(master, test_name)
+
+
+def test_ref_snapshot():
+    """ Run 'git up' with a local branch tracking an updated branch """
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    assert sorted(gitup.remotes) == ['.', 'origin']
+    assert gitup.target_map[test_name + '.b'].is_local
+
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding'] * 4
+
+    expected = master.branches[test_name].commit
+    assert repo.branches[test_name].commit == expected
+    assert repo.branches[test_name + '.a'].commit == expected
+    assert repo.branches[test_name + '.b'].commit == expected
+
+
+def test_ref_snapshot_linked_worktree():
+    """ Read HEAD of the linked worktree git-up runs in """
+    worktree = Repo(worktree_path)
+    worktree.git.reset('--hard', 'HEAD~1')
+
+    os.chdir(worktree_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    assert gitup.refs.head == 'refs/heads/' + worktree_branch
+    assert gitup._current_branch() == worktree_branch
+
+    gitup.run()
+
+    assert gitup.states == ['up to date'] * 3 + ['fast-forwarding']
+    assert worktree.active_branch.name == worktree_branch
+    assert worktree.head.commit == master.branches[test_name].commit
+    assert repo.active_branch.name == test_name
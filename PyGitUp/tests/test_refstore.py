@@ -0,0 +1,206 @@
+# System imports
+import os
+import subprocess
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.refs import RefSnapshot
+from PyGitUp.refstore import FilesRefStore, ReftableRefStore, \
+    open_ref_store
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'refstore'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    for index in range(50):
+        master.git.branch(f'{test_name}.{index:02}')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Packed branches...
+    for index in range(0, 50, 2):
+        repo.git.branch(f'{test_name}.{index:02}',
+                        f'origin/{test_name}.{index:02}')
+    repo.git.pack_refs('--all')
+
+    # ... and loose ones, one of them updated after packing
+    for index in range(1, 50, 2):
+        repo.git.branch(f'{test_name}.{index:02}',
+                        f'origin/{test_name}.{index:02}')
+    update_file(master, test_name)
+    repo.remotes.origin.fetch()
+    repo.git.branch('-f', test_name + '.00', 'origin/' + test_name)
+
+    # Tracking a local branch
+    repo.git.branch('--track', test_name + '.local', test_name)
+
+    # Tracking a remote with a custom refspec
+    repo.git.remote('add', 'mirror', master_path)
+    repo.git.config('--replace-all', 'remote.mirror.fetch',
+                    '+refs/heads/*:refs/remotes/copy/*')
+    repo.git.fetch('mirror')
+    repo.git.branch('--track', test_name + '.mirror',
+                    'copy/' + test_name)
+
+    # A linked worktree
+    repo.git.worktree('add', join(basepath, test_name + '.worktree'),
+                      test_name + '.01')
+
+
+def _git_snapshot():
+    snapshot = RefSnapshot(GitWrapper(repo))
+    snapshot.parse(repo.git.for_each_ref('--format=' + RefSnapshot.FORMAT,
+                                         'refs/heads', 'refs/remotes'))
+    return snapshot
+
+
+def test_snapshot_matches_git():
+    """ Read the same refs and upstreams as git for-each-ref """
+    expected = _git_snapshot()
+
+    snapshot = RefSnapshot(GitWrapper(repo))
+    snapshot.read(repo.git_dir, repo.common_dir)
+
+    assert snapshot.shas == expected.shas
+    assert snapshot.upstreams == expected.upstreams
+    assert snapshot.upstreams[test_name + '.mirror'] == \
+        ('refs/remotes/copy/' + test_name, 'mirror')
+    assert snapshot.head == 'refs/heads/' + test_name
+
+
+def test_packed_refs_lookup():
+    """ Look up single packed refs """
+    store = FilesRefStore(repo.git_dir)
+    try:
+        for index in range(50):
+            refname = f'refs/remotes/origin/{test_name}.{index:02}'
+            assert store.resolve(refname) == repo.git.rev_parse(refname)
+
+        assert store.resolve(f'refs/heads/{test_name}.0') is None
+        assert store.resolve(f'refs/heads/{test_name}.99') is None
+        assert store.resolve('refs/heads/a') is None
+        assert store.resolve('refs/heads/zzz') is None
+    finally:
+        store.close()
+
+
+def test_worktree_head():
+    """ Read HEAD from the worktree's own git dir """
+    worktree = Repo(join(basepath, test_name + '.worktree'))
+
+    store = open_ref_store(worktree.git_dir, worktree.common_dir)
+    try:
+        assert store.head() == ('refs/heads/' + test_name + '.01',
+                                repo.git.rev_parse(test_name + '.01'))
+    finally:
+        store.close()
+
+    store = open_ref_store(repo.git_dir)
+    try:
+        assert store.head()[0] == 'refs/heads/' + test_name
+    finally:
+        store.close()
+
+
+def _varint(value):
+    encoded = [value & 0x7f]
+    value >>= 7
+    while value:
+        value -= 1
+        encoded.insert(0, 0x80 | (value & 0x7f))
+        value >>= 7
+
+    return bytes(encoded)
+
+
+def _table(records):
+    """ Write a minimal, unpadded reftable (version 1). """
+    header = b'REFT\x01' + (0).to_bytes(3, 'big') + bytes(16)
+
+    body = b''
+    name = b''
+    for refname, value_type, value in sorted(records):
+        refname = refname.encode()
+        prefix = os.path.commonprefix([name, refname])
+        suffix = refname[len(prefix):]
+        body += _varint(len(prefix)) + \
+            _varint(len(suffix) << 3 | value_type) + suffix + _varint(0)
+        if value_type == 1:
+            body += bytes.fromhex(value)
+        elif value_type == 3:
+            body += _varint(len(value)) + value.encode()
+        name = refname
+
+    restarts = (len(header) + 4).to_bytes(3, 'big') + (1).to_bytes(2, 'big')
+    block_len = len(header) + 4 + len(body) + len(restarts)
+
+    return header + b'r' + block_len.to_bytes(3, 'big') + body + \
+        restarts + bytes(68)
+
+
+def test_reftable_stack(tmp_path):
+    """ Merge the tables of a stack, newest first """
+    one, two = '1' * 40, '2' * 40
+    git_dir = tmp_path / 'repo'
+    reftable = git_dir / 'reftable'
+    reftable.mkdir(parents=True)
+
+    (reftable / '0-old.ref').write_bytes(_table([
+        ('HEAD', 3, 'refs/heads/main'),
+        ('refs/heads/deleted', 1, one),
+        ('refs/heads/main', 1, one),
+        ('refs/heads/main-2', 1, one),
+    ]))
+    (reftable / '1-new.ref').write_bytes(_table([
+        ('refs/heads/deleted', 0, None),
+        ('refs/heads/main', 1, two),
+        ('refs/remotes/origin/HEAD', 3, 'refs/heads/main'),
+    ]))
+    (reftable / 'tables.list').write_text('0-old.ref\n1-new.ref\n')
+
+    store = open_ref_store(str(git_dir))
+    assert isinstance(store, ReftableRefStore)
+
+    assert store.refs(['refs/heads/', 'refs/remotes/']) == {
+        'refs/heads/main': two,
+        'refs/heads/main-2': one,
+        'refs/remotes/origin/HEAD': two,
+    }
+    assert store.head() == ('refs/heads/main', two)
+
+
+def test_reftable_git(tmp_path):
+    """ Read a reftable repository written by git """
+    path = str(tmp_path / 'reftable')
+    if subprocess.call(['git', 'init', '-q', '--ref-format=reftable', path],
+                       stderr=subprocess.DEVNULL):
+        pytest.skip('git does not support reftable')
+
+    reftable_repo = Repo(path)
+    update_file(reftable_repo, test_name)
+    for index in range(20):
+        reftable_repo.git.branch(f'{test_name}.{index:02}')
+
+    store = open_ref_store(reftable_repo.git_dir)
+    refs = reftable_repo.git.for_each_ref('--format=%(refname) %(objectname)',
+                                          'refs/heads')
+
+    assert store.refs(['refs/heads/']) == dict(
+        line.split(' ') for line in refs.splitlines()
+    )
+    assert store.head()[0] == reftable_repo.git.symbolic_ref('HEAD')
@@ -0,0 +1,49 @@
+# System imports
+from os.path import join, normpath
+
+from PyGitUp.gitup import RepoLocation
+
+root = normpath('/repo')
+
+
+def test_plain_repo():
+    location = RepoLocation.parse([root, '.git', '.git', 'true'], root)
+
+    assert location.git_dir == join(root, '.git')
+    assert location.common_dir == join(root, '.git')
+    assert not location.is_submodule
+    assert not location.is_linked_worktree
+    assert location.repo_dir == root
+
+
+def test_linked_worktree():
+    worktree = join(root, 'wt')
+    git_dir = join(root, '.git', 'worktrees', 'wt')
+
+    location = RepoLocation.parse(
+        [worktree, git_dir, join(root, '.git'), 'true'], worktree
+    )
+
+    assert location.is_linked_worktree
+    assert not location.is_submodule
+    assert location.git_dir == git_dir
+    assert location.common_dir == join(root, '.git')
+    assert location.repo_dir == worktree
+
+
+def test_submodule():
+    submodule = join(root, 'sub')
+    git_dir = join(root, '.git', 'modules', 'sub')
+
+    location = RepoLocation.parse(
+        [submodule, git_dir, git_dir, 'true', root], join(submodule, 'dir')
+    )
+
+    assert location.is_submodule
+    assert location.superproject_dir == root
+    assert location.repo_dir == submodule
+
+
+def test_not_a_repo():
+    assert RepoLocation.parse(None, root) is None
+    assert RepoLocation.parse([], root) is None
@@ -0,0 +1,106 @@
+# System imports
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.repos import RepoPool
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'repo-pool'
+repo_path = join(basepath, test_name + os.sep)
+worktree_path = join(basepath, test_name + '-wt')
+
+
+def setup_module():
+    global master, repo
+
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    for index in range(10):
+        update_file(master, f'commit {index}')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    repo.git.worktree('add', '-b', test_name + '-wt', worktree_path)
+
+
+def test_repo_pool():
+    """ Open every repository once and share the object reader """
+    pool = RepoPool()
+
+    main = pool.open(repo_path)
+    worktree = pool.open(worktree_path)
+
+    assert pool.open(join(repo_path, '.')) is main
+    assert pool.open(worktree_path) is worktree
+    assert worktree is not main
+    assert worktree.repo.odb is main.repo.odb
+
+    # Read objects from several threads at once
+    expected = [commit.message for commit in repo.iter_commits(test_name)]
+
+    def messages(git):
+        return [commit.message for commit in
+                git.repo.iter_commits(test_name)]
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(messages, [main, worktree] * 4))
+
+    assert results == [expected] * 8
+    assert main.repo.git.cat_file_all is not None
+
+    # Closing stops the persistent git processes
+    pool.close()
+
+    assert main.repo.git.cat_file_all is None
+    assert pool.open(repo_path) is not main
+
+    pool.close()
+
+
+def test_repo_pool_environment():
+    """ Only use the environment passed to `using` within the block """
+    pool = RepoPool()
+
+    with pool.using(worktree_path, {'GIT_AUTHOR_NAME': 'Pool'}) as git:
+        assert git.var('GIT_AUTHOR_IDENT').startswith('Pool ')
+
+    assert pool.open(worktree_path) is git
+    assert 'GIT_AUTHOR_NAME' not in git.git.environment()
+    assert not git.var('GIT_AUTHOR_IDENT').startswith('Pool ')
+
+    pool.close()
+
+
+def test_repo_pool_closed_on_init_error(monkeypatch):
+    """ Close the repositories if GitUp can't be set up """
+    from PyGitUp import gitup
+
+    closed = []
+    close = RepoPool.close
+
+    def recording_close(self):
+        closed.append(self)
+        close(self)
+
+    def fail(*args):
+        raise RuntimeError('reading refs failed')
+
+    monkeypatch.setattr(RepoPool, 'close', recording_close)
+    monkeypatch.setattr(gitup.RefSnapshot, 'load', fail)
+
+    os.chdir(repo_path)
+    with pytest.raises(RuntimeError):
+        gitup.GitUp(testing=True)
+
+    assert len(closed) == 1
@@ -0,0 +1,151 @@
+# System imports
+import os
+from os.path import join, isdir, isfile
+
+import pytest
+from git import *
+from PyGitUp.git_wrapper import GitWrapper, RebaseError
+from PyGitUp.tests import basepath, write_file, init_master, update_file
+
+test_name = 'scratch-worktrees'
+repo_path = join(basepath, test_name + os.sep)
+
+branch_name = test_name + '.other'
+conflict_name = test_name + '.conflict'
+
+
+def _commit(repo, filename, contents, message):
+    path = join(repo.working_dir, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file(path, contents)
+    repo.index.add([path])
+    return repo.index.commit(message)
+
+
+def setup_module():
+    global master, repo, scratch_root
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    _commit(master, join('sub', 'dir.txt'), 'sub\n', 'add sub')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+    scratch_root = join(repo.git_dir, 'git-up', 'scratch')
+
+    assert repo.working_dir == path
+
+    # A branch that isn't checked out
+    repo.git.checkout('origin/' + test_name, b=branch_name, track=True)
+    _commit(repo, 'other.txt', 'other\n', 'other')
+
+    # A branch that conflicts with upstream
+    repo.git.checkout('origin/' + test_name, b=conflict_name, track=True)
+    update_file(repo, 'conflicting change')
+
+    repo.git.checkout('--no-track', 'origin/' + test_name, b='unrelated')
+
+    # Modify file in master
+    update_file(master, test_name)
+
+
+def _git_up(**settings):
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings.update(settings)
+
+    return gitup
+
+
+def test_scratch_worktree(monkeypatch):
+    """ Rebase a branch in a scratch worktree """
+    def fail(*args, **kwargs):
+        raise AssertionError('branch has been checked out')
+
+    monkeypatch.setattr(GitWrapper, 'checkout', fail)
+
+    gitup = _git_up(**{'worktrees.scratch': '2'})
+    gitup.branches = [branch for branch in gitup.branches
+                      if branch.name != conflict_name]
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding', 'rebasing']
+    assert repo.active_branch.name == 'unrelated'
+    assert repo.commit(branch_name + '~1') == \
+        master.branches[test_name].commit
+
+    # The worktree is sparse and kept for the next run
+    slot = join(scratch_root, 'slot-0')
+    assert os.listdir(scratch_root) == ['slot-0']
+    assert isfile(join(slot, 'file.txt'))
+    assert not isdir(join(slot, 'sub'))
+    assert Repo(slot).head.is_detached
+
+    # ... and git-up doesn't mistake it for a user's worktree
+    assert gitup.worktrees.get(branch_name) is None
+
+
+def test_scratch_worktree_conflict():
+    """ Rebase conflicting branches in the main working tree """
+    gitup = _git_up(**{'worktrees.scratch': '2'})
+    gitup.branches = [branch for branch in gitup.branches
+                      if branch.name == conflict_name]
+
+    with pytest.raises(RebaseError):
+        gitup.run()
+
+    repo.git.rebase('--abort')
+    repo.git.checkout('unrelated')
+
+    # The branch got a scratch worktree of its own, which has been cleaned up
+    assert sorted(os.listdir(scratch_root)) == ['slot-0', 'slot-1']
+    assert Repo(join(scratch_root, 'slot-1')).head.is_detached
+
+
+def test_scratch_worktree_evicted():
+    """ Remove scratch worktrees once they're disabled """
+    gitup = _git_up()
+    gitup.branches = [branch for branch in gitup.branches
+                      if branch.name != conflict_name]
+    gitup.run()
+
+    assert not os.listdir(scratch_root)
+    assert 'slot-0' not in repo.git.worktree('list')
+
+
+def test_scratch_worktree_per_branch():
+    """ Keep up to `size` worktrees, one per branch """
+    from PyGitUp.scratch import ScratchPool
+
+    root = join(repo.git_dir, 'git-up', 'scratch-pool')
+    start = 'origin/' + test_name
+    names = [test_name + '.pool-a', test_name + '.pool-b',
+             test_name + '.pool-c']
+    for name in names:
+        repo.git.branch(name, start)
+
+    pool = ScratchPool(GitWrapper(repo), root, 2)
+
+    def checkout(name):
+        with pool.worktree(name, start) as worktree:
+            return worktree.path
+
+    first = checkout(names[0])
+    second = checkout(names[1])
+    assert first != second
+    assert checkout(names[0]) == first
+    assert len(pool.slots()) == 2
+
+    # A full pool reuses the least recently used worktree
+    assert checkout(names[2]) == second
+    assert len(pool.slots()) == 2
+
+    pool.size = 0
+    pool.evict()
+    assert not os.listdir(root)
@@ -0,0 +1,126 @@
+# System imports
+import json
+import os
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.classify import BranchClassifier
+from PyGitUp.git_wrapper import GitWrapper
+from PyGitUp.tests import basepath, init_master, update_file
+
+test_name = 'state-cache'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global repo, state_file
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    master.git.branch(test_name + '.diverged')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    repo.git.branch(test_name + '.diverged', 'origin/' + test_name +
+                    '.diverged')
+    repo.git.config('git-up.cache.state', 'true')
+    repo.git.config('git-up.rebase.show-hashes', 'true')
+    state_file = join(repo.git_dir, 'git-up', 'state')
+
+    # A local commit...
+    update_file(repo, test_name, filename='local.txt')
+
+    # ... and remote ones
+    master.git.checkout(test_name + '.diverged')
+    update_file(master, test_name)
+    master.git.checkout(test_name)
+    update_file(master, test_name)
+    repo.remotes.origin.fetch()
+
+    repo.git.checkout(test_name + '.diverged')
+    update_file(repo, test_name, filename='local.txt')
+    repo.git.checkout(test_name)
+
+
+def _status():
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+
+    return dict(gitup.status())
+
+
+def test_state_cache(monkeypatch):
+    """ Reuse the states of branches that haven't moved """
+    os.chdir(repo_path)
+
+    expected = {test_name: 'rebasing', test_name + '.diverged': 'rebasing'}
+    assert _status() == expected
+    assert os.path.isfile(state_file)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Branches have been classified again')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(BranchClassifier, '_for_each_ref', fail)
+        patch.setattr(GitWrapper, 'merge_base', fail)
+
+        assert _status() == expected
+
+    # Branches that have moved are classified again
+    repo.git.branch('-f', test_name + '.diverged',
+                    'origin/' + test_name + '.diverged~1')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(BranchClassifier, '_for_each_ref', fail)
+
+        with pytest.raises(AssertionError):
+            _status()
+
+    assert _status()[test_name + '.diverged'] == 'fast-forwarding'
+
+
+def test_state_cache_version():
+    """ Ignore caches written by other versions """
+    os.chdir(repo_path)
+    _status()
+
+    with open(state_file) as f:
+        data = json.load(f)
+
+    data['version'] = -1
+    for entry in data['branches'].values():
+        entry[2] = 'up to date'
+
+    with open(state_file, 'w') as f:
+        json.dump(data, f)
+
+    assert _status()[test_name] == 'rebasing'
+
+
+@pytest.mark.parametrize('pygit2', ['false', 'true'])
+def test_state_cache_replace_refs(pygit2):
+    """ Don't use the cache if replace refs might rewrite history """
+    os.chdir(repo_path)
+
+    # HEAD~1 is a root commit: the replacement leaves the branch without a
+    # merge base with its upstream, no matter which backend is asked
+    repo.git.config('git-up.backend.pygit2', pygit2)
+    repo.git.replace(repo.git.rev_parse('HEAD'),
+                     repo.git.rev_parse('HEAD~1'))
+    try:
+        if os.path.exists(state_file):
+            os.remove(state_file)
+
+        assert _status()[test_name] == 'rebasing'
+        assert not os.path.exists(state_file)
+    finally:
+        repo.git.replace('-d', repo.git.rev_parse('HEAD'))
+        repo.git.config('--unset', 'git-up.backend.pygit2')
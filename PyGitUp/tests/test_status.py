@@ -0,0 +1,123 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, capture, init_master, update_file, \
+    write_file, testfile_name
+
+test_name = 'status'
+repo_path = join(basepath, test_name + os.sep)
+
+
+def setup_module():
+    global master, repo
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+    for suffix in ('ahead', 'behind', 'diverged', 'deleted'):
+        master.git.branch(f'{test_name}.{suffix}')
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    for suffix in ('ahead', 'behind', 'diverged', 'deleted'):
+        repo.git.branch(f'{test_name}.{suffix}',
+                        f'origin/{test_name}.{suffix}')
+
+    # Local commits
+    for suffix in ('ahead', 'diverged'):
+        repo.git.checkout(f'{test_name}.{suffix}')
+        update_file(repo, suffix, filename='local.txt')
+    repo.git.checkout(test_name)
+
+    # Remote commits
+    for suffix in ('behind', 'diverged'):
+        master.git.checkout(f'{test_name}.{suffix}')
+        update_file(master, suffix)
+    master.git.checkout(test_name)
+    master.git.branch(f'{test_name}.deleted', D=True)
+
+    repo.remotes.origin.fetch(prune=True)
+
+    # Local changes
+    write_file(join(path, testfile_name), 'changed')
+
+
+def _refs():
+    return repo.git.for_each_ref('--format=%(refname) %(objectname)')
+
+
+def test_status():
+    """ Run 'git up --status' """
+    os.chdir(repo_path)
+    refs = _refs()
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.should_fetch = False
+    gitup.status_only = True
+
+    with capture() as [stdout, _]:
+        gitup.run()
+
+    assert gitup.states == [
+        'up to date',
+        'ahead',
+        'fast-forwarding',
+        'remote branch doesn\'t exist',
+        'rebasing',
+    ]
+
+    stdout = stdout.getvalue()
+    assert 'would fast-forward' in stdout
+    assert 'would rebase' in stdout
+
+    # Nothing has changed
+    assert _refs() == refs
+    assert repo.active_branch.name == test_name
+    assert not repo.git.stash('list')
+    assert repo.is_dirty()
+
+    # The working tree hasn't even been looked at
+    assert gitup.git._worktree_status is None
+
+
+def test_status_diverged():
+    """ Report diverged branches if they aren't rebased automatically """
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['rebase.auto'] = False
+
+    assert dict(gitup.status())[test_name + '.diverged'] == 'diverged'
+
+
+def test_status_no_fetch():
+    """ Don't fetch in status mode, that would change remote branches """
+    os.chdir(repo_path)
+    update_file(master, 'not fetched')
+    refs = _refs()
+    fetch_head = join(repo.git_dir, 'FETCH_HEAD')
+    with open(fetch_head) as f:
+        fetched = f.read()
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['fetch.max-age'] = '1h'
+    gitup.status_only = True
+
+    with capture():
+        gitup.run()
+
+    assert _refs() == refs
+    with open(fetch_head) as f:
+        assert f.read() == fetched
+    assert not os.path.exists(join(repo.git_dir, 'git-up', 'fetched'))
@@ -10,3 +10,30 @@ def test_uniq():
     assert utils.uniq([1, 1, 1, 2, 3]) == [1, 2, 3]
     assert utils.uniq([1]) == [1]
     assert utils.uniq([]) == []
+
+
+def test_parse_duration():
+    assert utils.parse_duration('90') == 90
+    assert utils.parse_duration('30s') == 30
+    assert utils.parse_duration('5m') == 300
+    assert utils.parse_duration('2H') == 7200
+    assert utils.parse_duration('1d') == 86400
+    assert utils.parse_duration('') is None
+    assert utils.parse_duration('m') is None
+    assert utils.parse_duration('1.5h') is None
+    assert utils.parse_duration('5ms') is None
+    assert utils.parse_duration('5min') is None
+
+
+def test_write_json(tmp_path):
+    import json
+
+    path = tmp_path / 'cache' / 'file'
+    assert utils.write_json(str(path), {'a': 1})
+    assert json.loads(path.read_text()) == {'a': 1}
+    assert utils.write_json(str(path), {'b': 2})
+    assert json.loads(path.read_text()) == {'b': 2}
+
+    # Unwritable: no file (or temporary file) is left behind
+    assert not utils.write_json(str(path / 'file'), {})
+    assert sorted(p.name for p in path.parent.iterdir()) == ['file']
@@ -0,0 +1,92 @@
+# System imports
+import os
+from os.path import join
+
+from git import *
+from PyGitUp.tests import basepath, init_master, update_file, write_file
+from PyGitUp.worktrees import WorktreeIndex
+
+test_name = 'worktree-in-progress'
+repo_path = join(basepath, test_name + os.sep)
+worktree_path = join(basepath, test_name + '-wt' + os.sep)
+
+
+def setup_module():
+    global master, repo
+
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # A branch checked out in a worktree with a merge conflict in progress
+    repo.git.branch(test_name + '-wt', 'origin/' + test_name)
+    repo.git.branch(test_name + '-conflict', 'origin/' + test_name,
+                    no_track=True)
+    repo.git.worktree('add', worktree_path, test_name + '-wt')
+    repo.git.branch('--set-upstream-to', 'origin/' + test_name,
+                    test_name + '-wt')
+
+    wt_git = Git(worktree_path)
+    write_file(join(worktree_path, 'conflict.txt'), 'worktree')
+    wt_git.add('conflict.txt')
+    wt_git.commit(m='worktree commit')
+
+    wt_git.checkout(test_name + '-conflict')
+    write_file(join(worktree_path, 'conflict.txt'), 'conflict')
+    wt_git.add('conflict.txt')
+    wt_git.commit(m='conflicting commit')
+    wt_git.checkout(test_name + '-wt')
+
+    try:
+        wt_git.merge(test_name + '-conflict')
+    except GitCommandError:
+        pass
+
+    # Modify file in master
+    update_file(master, test_name)
+
+
+def test_worktree_in_progress():
+    """ Run 'git up' with a merge in progress in a worktree """
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.run()
+
+    assert gitup.states == ['fast-forwarding', 'operation in progress']
+
+
+def test_worktree_index_cache(tmp_path):
+    """ The worktree scan is cached across runs """
+    common_dir = join(repo_path, '.git')
+    admin_dir = join(common_dir, 'worktrees', test_name + '-wt')
+    cache_file = str(tmp_path / 'worktrees')
+
+    # Changes within the last seconds are never cached
+    os.utime(admin_dir, ns=(0, 0))
+
+    worktree = WorktreeIndex(common_dir, cache_file=cache_file) \
+        .get(test_name + '-wt')
+    assert worktree.in_progress
+    assert os.path.isfile(cache_file)
+
+    # The cached entry is used as long as the admin dir is unchanged...
+    os.rename(join(admin_dir, 'MERGE_HEAD'), join(admin_dir, 'MERGE_HEAD~'))
+    os.utime(admin_dir, ns=(0, 0))
+    assert WorktreeIndex(common_dir, cache_file=cache_file) \
+        .get(test_name + '-wt').in_progress
+
+    # ... and read again once it changes
+    os.utime(admin_dir, ns=(10 ** 9, 10 ** 9))
+    assert not WorktreeIndex(common_dir, cache_file=cache_file) \
+        .get(test_name + '-wt').in_progress
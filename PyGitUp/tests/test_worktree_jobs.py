@@ -0,0 +1,114 @@
+# System imports
+import os
+import time
+from os.path import join
+
+import pytest
+from git import *
+from PyGitUp.git_wrapper import RebaseError
+from PyGitUp.tests import basepath, capture, init_master, update_file, \
+    write_file
+
+test_name = 'worktree-jobs'
+repo_path = join(basepath, test_name + os.sep)
+
+names = [f'{test_name}.{index}' for index in range(4)]
+
+
+def setup_module():
+    global master, repo
+
+    master_path, master = init_master(test_name)
+
+    # Prepare master repo
+    master.git.checkout(b=test_name)
+
+    # Clone to test repo
+    path = join(basepath, test_name)
+
+    master.clone(path, b=test_name)
+    repo = Repo(path, odbt=GitCmdObjectDB)
+
+    assert repo.working_dir == path
+
+    # Branches checked out in worktrees, every other one with a local commit
+    for index, name in enumerate(names):
+        worktree_path = join(basepath, name)
+        repo.git.branch(name, 'origin/' + test_name, track=True)
+        repo.git.worktree('add', worktree_path, name)
+
+        if index % 2:
+            write_file(join(worktree_path, name), name)
+            Git(worktree_path).add(name)
+            Git(worktree_path).commit(m=name)
+
+    # A branch tracking one of them
+    repo.git.branch(test_name + '.tracking', names[0], track=True)
+
+    # Modify file in master
+    update_file(master, test_name)
+
+
+def _git_up():
+    os.chdir(repo_path)
+
+    from PyGitUp.gitup import GitUp
+    gitup = GitUp(testing=True)
+    gitup.settings['worktrees.jobs'] = '4'
+
+    return gitup
+
+
+def test_worktree_jobs(monkeypatch):
+    """ Update worktrees concurrently, printing in order """
+    from PyGitUp.gitup import GitUp
+    rebase_in_worktree = GitUp._rebase_in_worktree
+
+    def slow_rebase_in_worktree(self, branch, *args):
+        # Let the first branches take the longest
+        time.sleep(0.1 * (len(names) - names.index(branch.name)))
+        print('updated ' + branch.name)
+        return rebase_in_worktree(self, branch, *args)
+
+    monkeypatch.setattr(GitUp, '_rebase_in_worktree',
+                        slow_rebase_in_worktree)
+
+    gitup = _git_up()
+    with capture() as [stdout, _]:
+        gitup.run()
+
+    assert gitup.states == ['fast-forwarding'] + \
+        ['fast-forwarding', 'rebasing'] * 2 + ['fast-forwarding']
+
+    expected = master.branches[test_name].commit
+    assert repo.branches[names[0]].commit == expected
+    assert repo.commit(names[1] + '~1') == expected
+    assert repo.branches[test_name + '.tracking'].commit == expected
+
+    # Every branch's output directly follows its name
+    lines = stdout.getvalue().splitlines()
+    updated = [line for line in lines if line.startswith('updated ')]
+    assert updated == ['updated ' + name for name in names]
+    for name in names:
+        index = next(index for index, line in enumerate(lines)
+                     if line.startswith(name + ' '))
+        assert lines[index + 1] == 'updated ' + name
+
+
+def test_worktree_jobs_error():
+    """ Report the first error once all jobs are done """
+    # Conflict with upstream in two worktrees
+    for name in names[1:3]:
+        update_file(Repo(join(basepath, name)), 'conflict')
+    update_file(master, test_name + ' again')
+
+    gitup = _git_up()
+    with pytest.raises(RebaseError) as error:
+        gitup.run()
+
+    assert names[1] in error.value.message
+
+    # The other worktrees have been updated anyway
+    expected = master.branches[test_name].commit
+    assert repo.branches[names[0]].commit == expected
+    assert repo.commit(names[3] + '~1') == expected
@@ -0,0 +1,43 @@
+from PyGitUp.status import WorktreeStatus
+
+SHA = '0' * 40
+
+
+def entry(kind, xy, submodule, *paths):
+    fields = [kind, xy, submodule, '100644', '100644', '100644', SHA, SHA]
+    if kind == '2':
+        fields.append('R100')
+    return ' '.join(fields + [paths[0]]) + '\0' + ''.join(
+        path + '\0' for path in paths[1:]
+    )
+
+
+def test_clean():
+    status = WorktreeStatus.parse('')
+
+    assert status.count == 0
+    assert not status.dirty
+
+
+def test_changes():
+    status = WorktreeStatus.parse(
+        entry('1', 'MM', 'N...', 'file with spaces.txt')
+        + entry('2', 'R.', 'N...', 'new name', 'old name')
+        + entry('1', '.M', 'SC..', 'submodule')
+        + 'u UU N... 100644 100644 100644 100644 {0} {0} {0} conflict\0'
+        .format(SHA)
+    )
+
+    assert status.count == 4
+    assert status.staged == 2
+    assert status.unstaged == 2
+    assert status.unmerged == 1
+    assert status.submodules == 1
+    assert status.dirty
+
+
+def test_only_submodules():
+    status = WorktreeStatus.parse(entry('1', '.M', 'SC..', 'submodule'))
+
+    assert status.count == 1
+    assert not status.dirty
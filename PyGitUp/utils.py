@@ -1,6 +1,7 @@
 """
 Some simple, generic useful methods.
 """
+import os
 import subprocess
 import sys
 
@@ -21,7 +22,17 @@ def uniq(seq):
 
 
 def execute(cmd, cwd=None):
-    """ Execute a command and return it's output. """
+    """ Execute a command and return the first line of it's output. """
+    lines = execute_lines(cmd, cwd=cwd)
+
+    if lines:
+        return lines[0]
+    else:
+        return None
+
+
+def execute_lines(cmd, cwd=None):
+    """ Execute a command and return all lines of it's output. """
     try:
         lines = subprocess \
             .check_output(cmd, cwd=cwd, stderr=DEVNULL) \
@@ -29,10 +40,64 @@ def execute(cmd, cwd=None):
     except subprocess.CalledProcessError:
         return None
     else:
-        if lines:
-            return decode(lines[0].strip())
-        else:
-            return None
+        return [decode(line.strip()) for line in lines]
+
+
+def config_environment(*settings):
+    """
+    Return the environment that passes config settings ('key=value') to git
+    commands, like `git -c key=value` would.
+    """
+    parameters = os.environ.get('GIT_CONFIG_PARAMETERS', '')
+    parameters += ''.join(f" '{setting}'" for setting in settings)
+
+    return {'GIT_CONFIG_PARAMETERS': parameters.strip()}
+
+
+# Seconds per unit of a duration
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_duration(value):
+    """
+    Parse a duration like '90', '30s', '5m', '2h' or '1d' into seconds.
+    Returns None if it's invalid.
+    """
+    value = str(value).strip().lower()
+    number = value.rstrip(''.join(DURATION_UNITS))
+    unit = value[len(number):]
+
+    if unit not in DURATION_UNITS or not number.isdigit():
+        return None
+
+    return int(number) * DURATION_UNITS[unit]
+
+
+def write_json(path, data):
+    """
+    Write data to a JSON file atomically: readers see either the old or the
+    new contents. Returns False if the file couldn't be written.
+    """
+    import json
+
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, path)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+
+    return True
+
+
+def colored(text, color=None, attrs=None):
+    """ Colorize text using termcolor, which is imported on first use. """
+    from termcolor import colored as termcolor_colored
+    return termcolor_colored(text, color, attrs=attrs)
 
 
 def decode(s):
@@ -0,0 +1,258 @@
+"""
+Lazy lookup of branches checked out in linked worktrees.
+
+Every linked worktree has an admin directory at
+`$GIT_COMMON_DIR/worktrees/<name>` that holds its HEAD, the path of the
+worktree and markers of in-progress operations like CHERRY_PICK_HEAD. The
+index reads these directories directly instead of asking
+`git worktree list` and opening every worktree's `.git` file.
+
+The scan only happens once a branch actually needs to be updated, the admin
+directories are read concurrently and the results are cached for the run.
+Optionally, they're also cached across runs: an admin directory's
+modification time changes whenever one of the files inside is created,
+replaced or removed, so unchanged directories don't have to be read again.
+"""
+
+__all__ = ['Worktree', 'WorktreeIndex']
+
+###############################################################################
+# IMPORTS
+###############################################################################
+
+# Python libs
+import os
+import time
+
+# PyGitUp libs
+from PyGitUp.utils import write_json
+
+# Markers of operations that must not be interrupted
+IN_PROGRESS_MARKERS = ('CHERRY_PICK_HEAD', 'MERGE_HEAD', 'BISECT_LOG')
+
+# Directories of an in-progress rebase, containing the rebased branch
+REBASE_DIRS = ('rebase-merge', 'rebase-apply')
+
+# Admin directories changed less than this many nanoseconds before a scan
+# are not cached across runs: a change within the same timestamp tick would
+# go unnoticed
+RACY_NS = 2 * 10 ** 9
+
+# Maximum number of admin directories read at the same time
+MAX_JOBS = 16
+
+
+###############################################################################
+# Worktree
+###############################################################################
+
+class Worktree:
+    """ A linked worktree and the branch checked out in it. """
+
+    def __init__(self, name, path, branch, in_progress=False):
+        #: Name of the admin directory
+        self.name = name
+        #: Path of the worktree as written by git (not normalized)
+        self.path = path
+        #: Branch checked out in the worktree or being rebased in it
+        self.branch = branch
+        #: Is a cherry-pick, merge, bisect or rebase in progress?
+        self.in_progress = in_progress
+
+    @classmethod
+    def read(cls, name, admin_dir):
+        """
+        Read a worktree from its admin directory, None if no branch is
+        checked out.
+        """
+        head = _read(os.path.join(admin_dir, 'HEAD'))
+        gitdir = _read(os.path.join(admin_dir, 'gitdir'))
+        if not head or not gitdir:
+            return None
+
+        # 'gitdir' points at the worktree's .git file (relative to the admin
+        # directory with worktree.useRelativePaths)
+        if not os.path.isabs(gitdir) and not gitdir.startswith('/'):
+            gitdir = os.path.normpath(os.path.join(admin_dir, gitdir))
+        path = os.path.dirname(gitdir)
+
+        if head.startswith('ref: refs/heads/'):
+            in_progress = any(
+                os.path.isfile(os.path.join(admin_dir, marker))
+                for marker in IN_PROGRESS_MARKERS
+            )
+
+            return cls(name, path, head[len('ref: refs/heads/'):],
+                       in_progress)
+
+        # Detached HEAD: might be in the middle of rebasing a branch
+        for rebase_dir in REBASE_DIRS:
+            ref = _read(os.path.join(admin_dir, rebase_dir, 'head-name'))
+            if ref and ref.startswith('refs/heads/'):
+                return cls(name, path, ref[len('refs/heads/'):], True)
+
+        return None
+
+    def to_dict(self):
+        """ Serialize the worktree for the cache. """
+        return {'path': self.path, 'branch': self.branch,
+                'in_progress': self.in_progress}
+
+    @classmethod
+    def from_dict(cls, name, data):
+        """ Deserialize a worktree from the cache. """
+        return cls(name, data['path'], data['branch'], data['in_progress'])
+
+
+###############################################################################
+# WorktreeIndex
+###############################################################################
+
+class WorktreeIndex:
+    """
+    Maps branch names to the linked worktrees they're checked out in.
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, common_dir, exclude_branch=None, cache_file=None,
+                 exclude_root=None):
+        """
+        :param common_dir: the repository's common git dir
+        :param exclude_branch: the branch checked out in the current
+                               worktree, which is updated via checkout
+        :param cache_file: where to cache the scan across runs (optional)
+        :param exclude_root: ignore worktrees in this directory (git-up's
+                             own scratch worktrees)
+        """
+        self.admin_root = os.path.join(common_dir, 'worktrees')
+        self.exclude_branch = exclude_branch
+        self.cache_file = cache_file
+        self.exclude_root = exclude_root
+
+        #: branch name -> Worktree, None until the first lookup
+        #: :type: dict[str, Worktree]
+        self._branches = None
+
+    def get(self, branch_name):
+        """
+        Return the worktree a branch is checked out in, or None.
+
+        :rtype: Worktree
+        """
+        if self._branches is None:
+            self._branches = self.scan()
+
+        return self._branches.get(branch_name)
+
+    def invalidate(self):
+        """ Scan the worktrees again on the next lookup. """
+        self._branches = None
+
+    def scan(self):
+        """ Read all admin directories, reusing cached results. """
+        try:
+            names = os.listdir(self.admin_root)
+        except OSError:
+            return {}  # No linked worktrees
+
+        cached = self._load_cache()
+        now = time.time_ns()
+
+        def scan_one(name):
+            admin_dir = os.path.join(self.admin_root, name)
+            try:
+                mtime = os.stat(admin_dir).st_mtime_ns
+            except OSError:
+                return name, None, None
+
+            entry = cached.get(name)
+            if isinstance(entry, dict) and entry.get('mtime') == mtime:
+                try:
+                    worktree = entry['worktree']
+                    worktree = Worktree.from_dict(name, worktree) \
+                        if worktree else None
+                except (KeyError, TypeError):
+                    pass  # Broken cache entry
+                else:
+                    return name, mtime, worktree
+
+            return name, mtime, Worktree.read(name, admin_dir)
+
+        if len(names) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(min(MAX_JOBS, len(names))) as executor:
+                results = list(executor.map(scan_one, names))
+        else:
+            results = [scan_one(name) for name in names]
+
+        branches = {}
+        for _, _, worktree in results:
+            if worktree and worktree.branch != self.exclude_branch and \
+                    not self._excluded(worktree.path):
+                branches[worktree.branch] = worktree
+
+        self._store_cache(cached, results, now)
+
+        return branches
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+
+    def _excluded(self, path):
+        """ Is a worktree in the excluded directory? """
+        if not self.exclude_root:
+            return False
+
+        root = os.path.normcase(os.path.abspath(self.exclude_root))
+        path = os.path.normcase(os.path.abspath(path))
+
+        return path.startswith(root + os.sep)
+
+    def _load_cache(self):
+        """ Return the cached scan results: name -> {mtime, worktree}. """
+        if not self.cache_file:
+            return {}
+
+        import json
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or \
+                data.get('version') != self.CACHE_VERSION:
+            return {}
+
+        return data.get('worktrees', {})
+
+    def _store_cache(self, cached, results, now):
+        """ Cache the scan results, leaving out racily changed entries. """
+        if not self.cache_file:
+            return
+
+        worktrees = {
+            name: {'mtime': mtime,
+                   'worktree': worktree.to_dict() if worktree else None}
+            for name, mtime, worktree in results
+            if mtime is not None and now - mtime > RACY_NS
+        }
+        if worktrees == cached:
+            return  # Nothing has changed
+
+        # The cache is an optimization only
+        write_json(self.cache_file, {'version': self.CACHE_VERSION,
+                                     'worktrees': worktrees})
+
+
+def _read(path):
+    """ Return the stripped contents of a file, None if it can't be read. """
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
@@ -0,0 +1,101 @@
+"""
+Benchmark: classifying branches with the commit graph vs. `git merge-base`.
+
+Creates a scratch repository with a long history and many branches forked
+from it, then checks for every branch whether it can be fast-forwarded to the
+main branch, once by spawning `git merge-base` per branch (what git-up used
+to do) and once in-process from the commit-graph file.
+
+Usage: python benchmarks/commit_graph.py [--commits N] [--branches N]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PyGitUp.commitgraph import CommitGraph  # noqa: E402
+
+
+def git(repo, *args, **kwargs):
+    return subprocess.run(['git', '-C', repo] + list(args), check=True,
+                          stdout=subprocess.PIPE, **kwargs).stdout
+
+
+def make_repo(path, commits, branches):
+    """ Create a linear history with branches forking off of it. """
+    git(path, 'init', '-q')
+
+    stream = []
+    for mark in range(1, commits + 1):
+        stream.append(
+            f'commit refs/heads/main\nmark :{mark}\n'
+            f'committer Bench <bench@example.com> {1000000000 + mark} +0000\n'
+            f'data 8\ncommit {mark % 10}\n'
+        )
+        if mark > 1:
+            stream.append(f'from :{mark - 1}\n')
+        stream.append('\n')
+
+    # Every branch gets one commit of its own on top of a fork point
+    for index in range(branches):
+        fork = 1 + index * (commits - 1) // max(branches, 1)
+        stream.append(
+            f'commit refs/heads/branch-{index}\n'
+            f'committer Bench <bench@example.com> {2000000000 + index} '
+            f'+0000\ndata 6\nbranch\nfrom :{fork}\n\n'
+        )
+
+    git(path, 'fast-import', '--quiet', input=''.join(stream).encode())
+    git(path, 'commit-graph', 'write', '--reachable')
+
+    output = git(path, 'for-each-ref', '--format=%(objectname) %(refname)',
+                 'refs/heads').decode()
+    shas = dict(line.split()[::-1] for line in output.splitlines())
+    target = shas.pop('refs/heads/main')
+
+    return target, list(shas.values())
+
+
+def bench_subprocess(path, target, shas):
+    for sha in shas:
+        git(path, 'merge-base', sha, target)
+
+
+def bench_graph(path, target, shas):
+    graph = CommitGraph.open(os.path.join(path, '.git'))
+    for sha in shas:
+        graph.is_ancestor(target, sha)
+        graph.is_ancestor(sha, target)
+    graph.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--commits', type=int, default=5000)
+    parser.add_argument('--branches', type=int, default=500)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='git-up-bench.')
+    try:
+        target, shas = make_repo(path, args.commits, args.branches)
+
+        print(f'{args.branches} branches, {args.commits} commits')
+        for name, bench in [('git merge-base', bench_subprocess),
+                            ('commit graph', bench_graph)]:
+            start = time.perf_counter()
+            bench(path, target, shas)
+            elapsed = time.perf_counter() - start
+            print(f'{name:>16}: {elapsed * 1000:9.1f} ms '
+                  f'({elapsed * 1e6 / len(shas):8.1f} us/branch)')
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
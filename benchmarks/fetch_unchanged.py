@@ -0,0 +1,109 @@
+"""
+Benchmark: fetching a remote that has nothing new.
+
+Creates a remote with many branches and pull request refs, clones it via
+file:// and tracks a few of its branches. Then runs `GitUp.fetch` with
+nothing new on the remote: a plain fetch, a narrowed fetch and one that asks
+`git ls-remote` first and skips the fetch (git-up.fetch.skip-unchanged).
+
+Usage: python benchmarks/fetch_unchanged.py [--branches N] [--pulls N]
+                                            [--tracked N] [--runs N]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PyGitUp.gitup import GitUp  # noqa: E402
+
+
+def git(repo, *args, **kwargs):
+    return subprocess.run(['git', '-C', repo] + list(args), check=True,
+                          stdout=subprocess.PIPE, **kwargs).stdout
+
+
+def make_remote(path, branches, pulls):
+    """ Create a repository with many branches and pull request refs. """
+    git(path, 'init', '-q')
+
+    stream = []
+    for index in range(branches + pulls):
+        ref = f'refs/heads/branch-{index}' if index < branches \
+            else f'refs/pull/{index - branches}/head'
+        stream.append(
+            f'commit {ref}\n'
+            f'committer Bench <bench@example.com> {1000000000 + index} '
+            f'+0000\ndata 7\ncommit\n\n'
+        )
+
+    git(path, 'fast-import', '--quiet', input=''.join(stream).encode())
+
+
+def bench_fetch(path, settings, runs):
+    """ Return the median time of `GitUp.fetch` with some settings. """
+    os.chdir(path)
+
+    times = []
+    for _ in range(runs):
+        gitup = GitUp()
+        gitup.settings.update(settings)
+
+        start = time.perf_counter()
+        gitup.fetch()
+        times.append(time.perf_counter() - start)
+
+        gitup.close()
+
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--branches', type=int, default=10000)
+    parser.add_argument('--pulls', type=int, default=50000)
+    parser.add_argument('--tracked', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='git-up-bench.')
+    cwd = os.getcwd()
+    try:
+        remote = os.path.join(root, 'remote')
+        clone = os.path.join(root, 'clone')
+        os.mkdir(remote)
+        make_remote(remote, args.branches, args.pulls)
+
+        subprocess.run(['git', 'clone', '-q', '--no-checkout',
+                        'file://' + remote, clone], check=True)
+        git(clone, 'config', '--add', 'remote.origin.fetch',
+            '+refs/pull/*:refs/remotes/origin/pull/*')
+        git(clone, 'fetch', '-q', 'origin')
+        git(clone, 'checkout', '-q', '-b', 'branch-0', 'origin/branch-0')
+        for index in range(1, args.tracked):
+            git(clone, 'branch', '-q', '--track', f'branch-{index}',
+                f'origin/branch-{index}')
+        git(clone, 'pack-refs', '--all')
+
+        print(f'{args.branches} branches, {args.pulls} pull request refs, '
+              f'{args.tracked} tracked')
+        for name, settings in [
+            ('git fetch', {}),
+            ('narrow fetch', {'fetch.narrow': True}),
+            ('skip unchanged', {'fetch.skip-unchanged': True}),
+        ]:
+            elapsed = bench_fetch(clone, settings, args.runs)
+            print(f'{name:>16}: {elapsed * 1000:9.1f} ms')
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
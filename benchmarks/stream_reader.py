@@ -0,0 +1,84 @@
+"""
+Benchmark: copying command output with `GitWrapper.stream_reader`.
+
+Pumps a few megabytes of fetch-like output through the chunked reader
+(copying it to a text stream and keeping only its ends) and through the
+byte-at-a-time reader it replaced, which is quadratic in the size of the
+output and therefore only run on a part of it.
+
+Usage: python benchmarks/stream_reader.py [--megabytes N] [--old-megabytes N]
+"""
+
+import argparse
+import codecs
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PyGitUp.git_wrapper import GitWrapper  # noqa: E402
+
+
+def byte_reader(input_stream, output_stream, result_list):
+    """ The reader `stream_reader` replaced. """
+    captured_bytes = b""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        read_byte = input_stream.read(1)
+        captured_bytes += read_byte
+        if output_stream is not None:
+            decoded_text = decoder.decode(read_byte, final=not read_byte)
+            if decoded_text:
+                output_stream.write(decoded_text)
+                output_stream.flush()
+        if read_byte == b"":
+            break
+    result_list.append(captured_bytes)
+
+
+def make_output(megabytes):
+    """ Lines like the ones `git fetch` prints for new branches. """
+    lines = []
+    size = 0
+    index = 0
+    while size < megabytes * 1024 * 1024:
+        line = (f' * [new branch]      branch-name-{index} -> '
+                f'origin/branch-name-{index}\n').encode()
+        lines.append(line)
+        size += len(line)
+        index += 1
+
+    return b''.join(lines)
+
+
+def bench(reader, data):
+    """ Return the throughput of a reader in MB/s. """
+    stream = io.BufferedReader(io.BytesIO(data))
+    output = io.StringIO()
+
+    start = time.perf_counter()
+    reader(stream, output, [])
+    elapsed = time.perf_counter() - start
+
+    return len(data) / elapsed / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--megabytes', type=float, default=16)
+    parser.add_argument('--old-megabytes', type=float, default=0.25)
+    args = parser.parse_args()
+
+    for name, reader, megabytes in [
+        ('byte by byte', byte_reader, args.old_megabytes),
+        ('chunked', GitWrapper.stream_reader, args.old_megabytes),
+        ('chunked', GitWrapper.stream_reader, args.megabytes),
+    ]:
+        throughput = bench(reader, make_output(megabytes))
+        print(f'{name:>14} ({megabytes:6.2f} MB): {throughput:10.2f} MB/s')
+
+
+if __name__ == '__main__':
+    main()